@@ -0,0 +1,96 @@
+"""
+Per-field cost of JWT authentication on a large list.
+
+Executes ``books { id title yearPublished author { username } }`` over an
+in-memory test database with the stock ``graphql_jwt`` middleware (checks
+on every field) and with ``authenticate_operation`` (checks once per
+operation, no JWT middleware in the chain), then prints the median time of
+each and the overhead per resolved field.
+
+Usage::
+
+    python -m benchmarks.bench_auth_middleware --items 1000 --repeat 20
+"""
+import argparse
+import os
+import statistics
+import time
+
+import django
+
+QUERY = '''
+query {
+    books {
+        id
+        title
+        yearPublished
+        author {
+            username
+        }
+    }
+}
+'''
+
+
+def run(schema, operation, token, middleware, per_operation, repeat):
+    from django.contrib.auth.models import AnonymousUser
+    from django.test import RequestFactory
+
+    from users.middleware import authenticate_operation
+
+    timings = []
+    for _ in range(repeat):
+        request = RequestFactory().post('/graphql/', HTTP_AUTHORIZATION=f'JWT {token}')
+        request.user = AnonymousUser()
+        start = time.perf_counter()
+        if per_operation:
+            authenticate_operation(request, schema.graphql_schema, operation)
+        result = schema.execute(QUERY, context_value=request, middleware=middleware)
+        timings.append(time.perf_counter() - start)
+        assert not result.errors, result.errors
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'graphdj.settings')
+    django.setup()
+
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from graphql import get_operation_ast, parse
+    from graphql_jwt.middleware import JSONWebTokenMiddleware
+    from graphql_jwt.shortcuts import get_token
+
+    from books.models import Book
+    from graphdj.schema import schema
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        user = get_user_model().objects.create_user('bench', 'bench@example.com', 'password123')
+        Book.objects.bulk_create(
+            Book(title=f'Book {i}', description='Benchmark book', year_published=2000, author=user)
+            for i in range(args.items)
+        )
+        token = get_token(user)
+        operation = get_operation_ast(parse(QUERY))
+        # books + (id, title, yearPublished, author, author.username) per item
+        fields = 1 + 5 * args.items
+
+        stock = run(schema, operation, token, [JSONWebTokenMiddleware()], False, args.repeat)
+        once = run(schema, operation, token, [], True, args.repeat)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    print(f'items: {args.items}, resolved fields: {fields}')
+    print(f'per-field middleware:   {stock * 1000:8.2f} ms')
+    print(f'once per operation:     {once * 1000:8.2f} ms')
+    print(f'overhead removed:       {(stock - once) / fields * 1e6:8.2f} us/field')
+
+
+if __name__ == '__main__':
+    main()
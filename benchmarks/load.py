@@ -0,0 +1,534 @@
+"""
+End-to-end load test of ``/graphql/``.
+
+Replays a weighted mix of the API's real operations (``books`` with a
+search term, ``book``, ``bookReviews``, ``myBooks``, ``createReview`` and
+``tokenAuth``) from ``--concurrency`` virtual users for ``--duration``
+seconds, against the WSGI or ASGI application in process or against a
+running server over HTTP. Latency percentiles (p50/p95/p99, in ms), error
+counts and requests per second of each operation are printed as JSON, so runs
+can be diffed or plotted. Ids and users are sampled from the configured
+database, which ``manage.py seed_data`` fills; every virtual user logs in
+once before the clock starts. The ``--anonymous`` share of the public reads
+(``books``, ``book``, ``bookReviews``) is sent without the token, as the
+response cache only serves anonymous requests, and those are also summarized
+apart by the ``responseCache`` outcome (hit or miss) they reported.
+
+Usage::
+
+    python manage.py migrate
+    python manage.py seed_data --users 100000 --books 1000000 --reviews 5000000
+    python -m benchmarks.load --target wsgi --concurrency 8 --duration 30 --output wsgi.json
+    python -m benchmarks.load --target asgi --concurrency 64 --duration 30
+    python -m benchmarks.load --target http --url http://localhost:8000/graphql/
+"""
+import argparse
+import asyncio
+import http.client
+import io
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+
+import django
+
+SEARCH_TERMS = (
+    "silent", "golden", "forgotten", "secret", "frozen", "ancient", "river", "garden",
+    "empire", "shadow", "kingdom", "mountain", "winter", "island", "library", "storm",
+)
+
+OPERATIONS = {
+    'books': '''
+        query Books($search: String) {
+            books(search: $search, first: 20) {
+                id
+                title
+                author {
+                    username
+                }
+            }
+        }
+    ''',
+    'book': '''
+        query Book($id: Int!) {
+            book(id: $id) {
+                id
+                title
+                description
+                yearPublished
+                reviewCount
+                author {
+                    username
+                }
+            }
+        }
+    ''',
+    'bookReviews': '''
+        query BookReviews($bookId: Int!) {
+            bookReviews(bookId: $bookId) {
+                id
+                text
+                user {
+                    username
+                }
+            }
+        }
+    ''',
+    'myBooks': '''
+        query MyBooks {
+            myBooks {
+                id
+                title
+                reviewCount
+            }
+        }
+    ''',
+    'createReview': '''
+        mutation CreateReview($input: CreateReviewInput!) {
+            createReview(createReviewInput: $input) {
+                review {
+                    id
+                }
+            }
+        }
+    ''',
+    'tokenAuth': '''
+        mutation TokenAuth($username: String!, $password: String!) {
+            tokenAuth(username: $username, password: $password) {
+                token
+            }
+        }
+    ''',
+}
+
+DEFAULT_MIX = 'books=25,book=25,bookReviews=20,myBooks=10,createReview=10,tokenAuth=10'
+
+# Operations that may be sent anonymously
+PUBLIC_READS = {'books', 'book', 'bookReviews'}
+
+
+def parse_mix(mix):
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        if name not in OPERATIONS:
+            raise SystemExit(f'Unknown operation {name!r}; choose from {", ".join(OPERATIONS)}')
+        weights[name] = float(weight or 1)
+    return weights
+
+
+class Dataset:
+    """Ids and credentials sampled from the database the run targets."""
+
+    def __init__(self, prefix, password, users, books, rng):
+        from django.contrib.auth import get_user_model
+        from django.db.models import Max, Min
+
+        from books.models import Book
+
+        self.password = password
+        self.users = list(
+            get_user_model().objects.filter(username__startswith=prefix)
+            .order_by('?').values_list('id', 'username')[:users]
+        )
+        bounds = Book.objects.aggregate(low=Min('id'), high=Max('id'))
+        if not self.users or bounds['low'] is None:
+            raise SystemExit('No data to replay; run "manage.py seed_data" first')
+        ids = [rng.randint(bounds['low'], bounds['high']) for _ in range(books)]
+        self.books = list(Book.objects.filter(id__in=ids).values_list('id', 'author_id'))
+
+    def variables(self, name, user_id, rng):
+        if name == 'books':
+            return {'search': rng.choice(SEARCH_TERMS)}
+        if name == 'book':
+            return {'id': rng.choice(self.books)[0]}
+        if name == 'bookReviews':
+            return {'bookId': rng.choice(self.books)[0]}
+        if name == 'createReview':
+            book_id, author_id = rng.choice(self.books)
+            while author_id == user_id:
+                book_id, author_id = rng.choice(self.books)
+            return {'input': {'bookId': book_id, 'text': 'Load test review'}}
+        if name == 'tokenAuth':
+            return {'username': rng.choice(self.users)[1], 'password': self.password}
+        return {}
+
+
+def encode(name, variables):
+    return json.dumps({
+        'query': OPERATIONS[name],
+        'operationName': name[0].upper() + name[1:],
+        'variables': variables,
+    }).encode()
+
+
+def outcome(status, body):
+    """Whether the request succeeded, and the ``responseCache`` it reported."""
+    if status != 200:
+        return False, None
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return False, None
+    return 'errors' not in payload, (payload.get('extensions') or {}).get('responseCache')
+
+
+def succeeded(status, body):
+    return outcome(status, body)[0]
+
+
+class WSGIClient:
+    """Calls the WSGI application directly, one request at a time per thread."""
+
+    def __init__(self, path, host):
+        from graphdj.wsgi import application
+
+        self.application = application
+        self.path = path
+        self.host = host
+
+    def post(self, body, token=None):
+        environ = {
+            'REQUEST_METHOD': 'POST',
+            'SCRIPT_NAME': '',
+            'PATH_INFO': self.path,
+            'QUERY_STRING': '',
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': self.host,
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        if token:
+            environ['HTTP_AUTHORIZATION'] = f'JWT {token}'
+        status = []
+        result = self.application(environ, lambda line, headers: status.append(int(line[:3])))
+        try:
+            content = b''.join(result)
+        finally:
+            # Sends request_finished, which returns the database connection
+            result.close()
+        return status[0], content
+
+
+class HTTPClient:
+    """Posts to a running server, keeping one connection per thread."""
+
+    def __init__(self, url):
+        self.url = urllib.parse.urlsplit(url)
+        self.local = threading.local()
+
+    def connection(self):
+        if getattr(self.local, 'connection', None) is None:
+            connection_class = (
+                http.client.HTTPSConnection if self.url.scheme == 'https' else http.client.HTTPConnection
+            )
+            self.local.connection = connection_class(self.url.netloc, timeout=60)
+        return self.local.connection
+
+    def post(self, body, token=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'JWT {token}'
+        connection = self.connection()
+        try:
+            connection.request('POST', self.url.path or '/', body, headers)
+            response = connection.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self.local.connection = None
+            return 0, b''
+
+
+class ASGIClient:
+    """Calls the ASGI application directly from the event loop."""
+
+    def __init__(self, path, host):
+        from graphdj.asgi import application
+
+        self.application = application
+        self.path = path
+        self.host = host
+
+    async def post(self, body, token=None):
+        headers = [
+            (b'host', self.host.encode()),
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ]
+        if token:
+            headers.append((b'authorization', f'JWT {token}'.encode()))
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'POST',
+            'scheme': 'http',
+            'path': self.path,
+            'raw_path': self.path.encode(),
+            'query_string': b'',
+            'root_path': '',
+            'headers': headers,
+            'client': ('127.0.0.1', 0),
+            'server': (self.host, 80),
+        }
+        done = asyncio.Event()
+        sent = False
+        status, chunks = [], []
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            # Django listens for a disconnect while the view runs
+            await done.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+                if not message.get('more_body'):
+                    done.set()
+
+        await self.application(scope, receive, send)
+        done.set()
+        return status[0], b''.join(chunks)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        # (operation, "hit" or "miss") -> latencies of anonymous reads
+        self.cached = defaultdict(list)
+        self.cached_errors = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def record(self, name, latency, ok, cache=None):
+        with self.lock:
+            self.latencies[name].append(latency)
+            if not ok:
+                self.errors[name] += 1
+            if cache is not None:
+                key = name, cache.lower()
+                self.cached[key].append(latency)
+                if not ok:
+                    self.cached_errors[key] += 1
+
+
+def send(name, rng, token, anonymous):
+    """The token to send ``name`` with: none for the anonymous share of reads."""
+    if name in PUBLIC_READS and rng.random() < anonymous:
+        return None
+    return token
+
+
+def login(post, dataset, user):
+    status, body = post(encode('tokenAuth', {'username': user[1], 'password': dataset.password}))
+    if not succeeded(status, body):
+        raise SystemExit(f'Could not log in as {user[1]}: {body[:200]!r}')
+    return json.loads(body)['data']['tokenAuth']['token']
+
+
+def pick(weights, rng):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def run_threads(client, dataset, weights, concurrency, duration, seed, anonymous):
+    from django.db import connections
+
+    recorder = Recorder()
+    users = [dataset.users[i % len(dataset.users)] for i in range(concurrency)]
+    tokens = [login(client.post, dataset, user) for user in users]
+    start = threading.Barrier(concurrency + 1)
+    deadline = []
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        user_id, token = users[index][0], tokens[index]
+        try:
+            start.wait()
+            while time.perf_counter() < deadline[0]:
+                name = pick(weights, rng)
+                body = encode(name, dataset.variables(name, user_id, rng))
+                sent = send(name, rng, token, anonymous)
+                began = time.perf_counter()
+                status, content = client.post(body, sent)
+                latency = time.perf_counter() - began
+                ok, cache = outcome(status, content)
+                recorder.record(name, latency, ok, cache if sent is None else None)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    began = time.perf_counter()
+    deadline.append(began + duration)
+    start.wait()
+    for thread in threads:
+        thread.join()
+    return recorder, time.perf_counter() - began
+
+
+def run_tasks(client, dataset, weights, concurrency, duration, seed, anonymous):
+    from asgiref.sync import sync_to_async
+
+    recorder = Recorder()
+    users = [dataset.users[i % len(dataset.users)] for i in range(concurrency)]
+
+    async def main():
+        tokens = []
+        for user in users:
+            status, body = await client.post(encode('tokenAuth', {
+                'username': user[1], 'password': dataset.password,
+            }))
+            if not succeeded(status, body):
+                raise SystemExit(f'Could not log in as {user[1]}: {body[:200]!r}')
+            tokens.append(json.loads(body)['data']['tokenAuth']['token'])
+        # Sampling createReview books may query nothing, but keep it off the loop anyway
+        variables = sync_to_async(dataset.variables)
+        deadline = time.perf_counter() + duration
+
+        async def worker(index):
+            rng = random.Random(seed + index)
+            user_id, token = users[index][0], tokens[index]
+            while time.perf_counter() < deadline:
+                name = pick(weights, rng)
+                body = encode(name, await variables(name, user_id, rng))
+                sent = send(name, rng, token, anonymous)
+                began = time.perf_counter()
+                status, content = await client.post(body, sent)
+                latency = time.perf_counter() - began
+                ok, cache = outcome(status, content)
+                recorder.record(name, latency, ok, cache if sent is None else None)
+
+        began = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        return time.perf_counter() - began
+
+    elapsed = asyncio.run(main())
+    return recorder, elapsed
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of the sorted list ``ordered``."""
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies, errors, elapsed):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'rps': round(len(ordered) / elapsed, 2),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def report(recorder, elapsed, config):
+    operations = {
+        name: summarize(latencies, recorder.errors[name], elapsed)
+        for name, latencies in sorted(recorder.latencies.items())
+    }
+    response_cache = defaultdict(dict)
+    for (name, cache), latencies in sorted(recorder.cached.items()):
+        response_cache[name][cache] = summarize(
+            latencies, recorder.cached_errors[name, cache], elapsed
+        )
+    every = [latency for latencies in recorder.latencies.values() for latency in latencies]
+    return {
+        'config': config,
+        'elapsed_s': round(elapsed, 3),
+        'operations': operations,
+        # Anonymous reads only, by the responseCache outcome they reported
+        'response_cache': dict(response_cache),
+        'total': summarize(every, sum(recorder.errors.values()), elapsed) if every else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--target', choices=('wsgi', 'asgi', 'http'), default='wsgi')
+    parser.add_argument('--url', default='http://localhost:8000/graphql/',
+                        help='Server to load with --target http')
+    parser.add_argument('--path', default='/graphql/')
+    parser.add_argument('--host', default='localhost', help='Host header of in-process requests')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help=f'Weighted operations (default: {DEFAULT_MIX})')
+    parser.add_argument('--prefix', default='seed', help='Username prefix of seeded users')
+    parser.add_argument('--password', default='password123')
+    parser.add_argument('--sample-users', type=int, default=1000)
+    parser.add_argument('--sample-books', type=int, default=10000)
+    parser.add_argument('--anonymous', type=float, default=0.5,
+                        help='Share of books, book and bookReviews sent without a token')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+    if not 0 <= args.anonymous <= 1:
+        parser.error('--anonymous must be between 0 and 1')
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'graphdj.settings')
+    if args.target == 'asgi':
+        # What graphdj.asgi sets, before settings are read
+        os.environ.setdefault('GRAPHQL_ASYNC', '1')
+    django.setup()
+
+    weights = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    dataset = Dataset(args.prefix, args.password, args.sample_users, args.sample_books, rng)
+
+    if args.target == 'asgi':
+        client = ASGIClient(args.path, args.host)
+        recorder, elapsed = run_tasks(
+            client, dataset, weights, args.concurrency, args.duration, args.seed,
+            args.anonymous
+        )
+    else:
+        client = HTTPClient(args.url) if args.target == 'http' else WSGIClient(args.path, args.host)
+        recorder, elapsed = run_threads(
+            client, dataset, weights, args.concurrency, args.duration, args.seed,
+            args.anonymous
+        )
+
+    result = report(recorder, elapsed, {
+        'target': args.url if args.target == 'http' else args.target,
+        'concurrency': args.concurrency,
+        'duration_s': args.duration,
+        'mix': weights,
+        'anonymous': args.anonymous,
+        'seed': args.seed,
+    })
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
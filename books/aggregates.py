@@ -0,0 +1,73 @@
+"""
+Denormalized review aggregates on ``Book``.
+
+``Book.review_count`` lets book lists show how many reviews each book has
+without a ``COUNT(*)`` per row or a ``GROUP BY`` over ``Review``. The review
+mutations adjust it in their own transaction with ``F()`` expressions, so
+concurrent writers never lose an increment. Rows written any other way
+(admin, shell, fixtures) are brought back in line by
+``manage.py repair_review_aggregates``.
+"""
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+
+from reviews.models import Review
+
+from . import leaderboards
+from .models import Book
+
+
+def adjust_review_counts(deltas):
+    """Apply ``{book_id: delta}`` to ``review_count``, one UPDATE per distinct delta."""
+    by_delta = defaultdict(list)
+    for book_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(book_id)
+    for delta, book_ids in by_delta.items():
+        Book.objects.filter(id__in=book_ids).update(
+            review_count=Greatest(F('review_count') + delta, Value(0))
+        )
+    leaderboards.update(leaderboards.BOOKS, deltas)
+
+
+def reviews_added(book_ids):
+    """Count one new review for every entry of ``book_ids``."""
+    adjust_review_counts(Counter(book_ids))
+
+
+def reviews_removed(book_ids):
+    """Count one removed review for every entry of ``book_ids``."""
+    adjust_review_counts({book_id: -n for book_id, n in Counter(book_ids).items()})
+
+
+def repair_review_counts(batch_size=1000):
+    """
+    Recompute ``review_count`` from ``Review`` for every book, ``batch_size``
+    books at a time. Returns the number of books that were out of date.
+    """
+    repaired = 0
+    last_id = 0
+    while True:
+        books = list(
+            Book.objects.filter(id__gt=last_id).order_by('id').only('id', 'review_count')[:batch_size]
+        )
+        if not books:
+            return repaired
+        last_id = books[-1].id
+        counts = dict(
+            Review.objects.filter(book_id__in=[book.id for book in books])
+            .values_list('book_id')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+        stale = []
+        for book in books:
+            count = counts.get(book.id, 0)
+            if book.review_count != count:
+                book.review_count = count
+                stale.append(book)
+        if stale:
+            Book.objects.bulk_update(stale, ['review_count'])
+            repaired += len(stale)
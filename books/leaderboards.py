@@ -0,0 +1,242 @@
+"""
+Materialized top-K leaderboards behind ``topBooks`` and ``topAuthors``.
+
+``books`` ranks books by ``review_count``; ``authors`` ranks users by the
+number of books they wrote. Each board stores its best ``SIZE + BUFFER``
+objects with a positive score as ``LeaderboardEntry`` rows, ranked by score
+and then by id, and ``Leaderboard.floor``/``floor_object_id`` bound the rank
+of every object left out. The book and review mutations report new scores
+through :func:`update`, which merges them once their transaction commits:
+an outsider is admitted only if it outranks the lowest entry, and whatever
+it evicts raises the floor. The buffer absorbs members whose score drops; a
+read is served straight from the entries while its last row still outranks
+the floor and is rebuilt from the source tables otherwise.
+``manage.py rebuild_leaderboards`` rebuilds every board.
+"""
+import heapq
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import Book, Leaderboard, LeaderboardEntry
+
+BOOKS = 'books'
+AUTHORS = 'authors'
+
+# Attempts of a board refresh racing other writers
+RETRIES = 3
+
+DEFAULTS = {
+    'SIZE': 100,
+    'BUFFER': 100,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'LEADERBOARDS', {})}
+
+
+def capacity():
+    config = get_config()
+    return config['SIZE'] + config['BUFFER']
+
+
+def _book_ranking(limit):
+    return list(
+        Book.objects.filter(review_count__gt=0)
+        .order_by('-review_count', 'id')
+        .values_list('id', 'review_count')[:limit]
+    )
+
+
+def _book_scores(ids):
+    scores = dict(Book.objects.filter(id__in=ids).values_list('id', 'review_count'))
+    return {id: scores.get(id, 0) for id in ids}
+
+
+def _author_ranking(limit):
+    return list(
+        Book.objects.values_list('author_id')
+        .annotate(score=Count('id'))
+        .order_by('-score', 'author_id')[:limit]
+    )
+
+
+def _author_scores(ids):
+    scores = dict(
+        Book.objects.filter(author_id__in=ids)
+        .values_list('author_id')
+        .annotate(score=Count('id'))
+        .order_by()
+    )
+    return {id: scores.get(id, 0) for id in ids}
+
+
+# name -> (full ranking of the top ``limit``, current scores of some ids)
+BOARDS = {
+    BOOKS: (_book_ranking, _book_scores),
+    AUTHORS: (_author_ranking, _author_scores),
+}
+
+
+def _key(score, object_id):
+    """Sort key of an object on a board; higher ranks first."""
+    return score, -object_id
+
+
+def _floor(board):
+    return _key(board.floor, board.floor_object_id)
+
+
+def rebuild(name):
+    """Recompute board ``name`` from the source tables."""
+    ranking_of, _ = BOARDS[name]
+    size = capacity()
+    ranking = ranking_of(size + 1)
+    floor_id, floor_score = ranking[size] if len(ranking) > size else (0, 0)
+    with transaction.atomic():
+        board, _ = Leaderboard.objects.get_or_create(name=name)
+        Leaderboard.objects.filter(pk=board.pk).update(
+            floor=floor_score, floor_object_id=floor_id, version=F('version') + 1
+        )
+        board.entries.all().delete()
+        LeaderboardEntry.objects.bulk_create([
+            LeaderboardEntry(leaderboard=board, object_id=object_id, score=score)
+            for object_id, score in ranking[:size]
+        ])
+
+
+class Conflict(Exception):
+    """Another writer changed the board since it was read."""
+
+
+def update(name, ids):
+    """
+    Refresh the scores of ``ids`` on board ``name`` once the current
+    transaction commits, so the board row is never held for the length of
+    the writer's transaction.
+    """
+    ids = set(ids)
+    if ids:
+        transaction.on_commit(lambda: refresh(name, ids))
+
+
+def refresh(name, ids):
+    """
+    Merge the current scores of ``ids`` into board ``name``.
+
+    The board is read without locking and written back with a fixed number
+    of statements, however many ids changed, guarded by its ``version``: a
+    writer that lost the race reads it again, up to ``RETRIES`` times, after
+    which the board is dropped for the next read to rebuild.
+    """
+    for _ in range(RETRIES):
+        try:
+            with transaction.atomic():
+                _merge(name, ids)
+            return
+        except Conflict:
+            continue
+    Leaderboard.objects.filter(name=name).delete()
+
+
+def _merge(name, ids):
+    _, scores_of = BOARDS[name]
+    board = Leaderboard.objects.filter(name=name).first()
+    if board is None:
+        # Never read yet; the first read builds it
+        return
+    scores = scores_of(ids)
+    members = {entry.object_id: entry for entry in board.entries.filter(object_id__in=ids)}
+    size = board.entries.count()
+    floor = _floor(board)
+
+    deleted, updated = [], {}
+    for object_id, entry in members.items():
+        if scores[object_id] > 0:
+            if entry.score != scores[object_id]:
+                entry.score = scores[object_id]
+                updated[object_id] = entry
+        else:
+            deleted.append(entry.pk)
+            size -= 1
+    outsiders = sorted(
+        (_key(score, object_id) for object_id, score in scores.items()
+         if object_id not in members and score > 0),
+        reverse=True,
+    )
+
+    # Eviction candidates, lowest first: the members just rescored plus as
+    # many untouched entries as there are outsiders to admit
+    pool = [(*_key(entry.score, object_id), entry) for object_id, entry in members.items()
+            if scores[object_id] > 0]
+    if outsiders:
+        pool.extend(
+            (*_key(entry.score, entry.object_id), entry)
+            for entry in board.entries.exclude(object_id__in=ids)
+            .order_by('score', '-object_id')[:len(outsiders)]
+        )
+    heapq.heapify(pool)
+
+    created = {}
+    for key in outsiders:
+        if size >= capacity():
+            if not pool or key <= pool[0][:2]:
+                floor = max(floor, key)
+                continue
+            *lowest_key, lowest = heapq.heappop(pool)
+            if lowest.pk is None:
+                del created[lowest.object_id]
+            else:
+                updated.pop(lowest.object_id, None)
+                deleted.append(lowest.pk)
+            size -= 1
+            floor = max(floor, tuple(lowest_key))
+        score, object_id = key[0], -key[1]
+        entry = LeaderboardEntry(leaderboard=board, object_id=object_id, score=score)
+        created[object_id] = entry
+        heapq.heappush(pool, (*key, entry))
+        size += 1
+
+    if not (deleted or updated or created or floor != _floor(board)):
+        return
+    # Claims the board first, so a writer that lost the race writes nothing
+    claimed = Leaderboard.objects.filter(name=name, version=board.version).update(
+        floor=floor[0], floor_object_id=-floor[1], version=F('version') + 1
+    )
+    if not claimed:
+        raise Conflict(name)
+    if deleted:
+        LeaderboardEntry.objects.filter(pk__in=deleted).delete()
+    if updated:
+        LeaderboardEntry.objects.bulk_update(list(updated.values()), ['score'])
+    if created:
+        LeaderboardEntry.objects.bulk_create(list(created.values()))
+
+
+def _read(name, limit):
+    board = Leaderboard.objects.filter(name=name).first()
+    if board is None:
+        return None
+    entries = list(
+        board.entries.order_by('-score', 'object_id').values_list('object_id', 'score')[:limit]
+    )
+    if len(entries) == limit and _key(entries[-1][1], entries[-1][0]) > _floor(board):
+        return entries
+    if len(entries) < limit and board.floor == 0:
+        # Every object with a positive score is on the board
+        return entries
+    return None
+
+
+def top(name, limit):
+    """Return the best ``limit`` (at most ``SIZE``) ``(object_id, score)`` pairs."""
+    limit = min(limit, get_config()['SIZE'])
+    if limit <= 0:
+        return []
+    entries = _read(name, limit)
+    if entries is None:
+        rebuild(name)
+        entries = _read(name, limit)
+    return entries
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from books.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the book full-text search index from the books table"
+
+    def handle(self, *args, **options):
+        get_search_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS("Book search index rebuilt"))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from books import leaderboards
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized top books and top authors leaderboards"
+
+    def handle(self, *args, **options):
+        for name in leaderboards.BOARDS:
+            leaderboards.rebuild(name)
+        self.stdout.write(self.style.SUCCESS("Leaderboards rebuilt"))
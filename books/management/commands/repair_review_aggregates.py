@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from books import leaderboards
+from books.aggregates import repair_review_counts
+from graphdj import response_cache
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized review aggregates on books from the reviews table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Number of books recomputed per query (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        repaired = repair_review_counts(options["batch_size"])
+        if repaired:
+            # reviewCount is cached under the reviews:list tag
+            response_cache.invalidate(["reviews:list"])
+            leaderboards.rebuild(leaderboards.BOOKS)
+        self.stdout.write(self.style.SUCCESS(f"Repaired review aggregates of {repaired} book(s)"))
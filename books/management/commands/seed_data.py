@@ -0,0 +1,155 @@
+import random
+from array import array
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from books import leaderboards
+from books.models import Book
+from books.search import get_search_backend
+from graphdj import response_cache
+from reviews.models import Review
+
+ADJECTIVES = (
+    "silent", "hidden", "golden", "broken", "distant", "crimson", "forgotten", "last",
+    "secret", "burning", "quiet", "endless", "frozen", "wild", "lost", "bright",
+    "ancient", "hollow", "iron", "northern",
+)
+NOUNS = (
+    "river", "garden", "empire", "shadow", "city", "ocean", "kingdom", "letter",
+    "mountain", "house", "road", "winter", "forest", "island", "machine", "harbor",
+    "library", "storm", "bridge", "orchard",
+)
+REVIEW_WORDS = (
+    "gripping", "slow", "beautiful", "predictable", "moving", "clever", "dense",
+    "funny", "dark", "memorable", "uneven", "brilliant", "tedious", "warm",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Insert synthetic users, books and reviews with bulk_create for load testing. "
+        "Authors and reviews are skewed towards a few popular users and books. "
+        "Benchmark volumes: --users 100000 --books 1000000 --reviews 5000000."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--books", type=int, default=10000)
+        parser.add_argument("--reviews", type=int, default=50000)
+        parser.add_argument(
+            "--batch-size", type=int, default=5000,
+            help="Rows inserted per statement batch (default: 5000)",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+        parser.add_argument(
+            "--prefix", default="seed",
+            help="Username prefix; usernames are <prefix><n> (default: seed)",
+        )
+        parser.add_argument(
+            "--password", default="password123",
+            help="Password of every seeded user (default: password123)",
+        )
+
+    def handle(self, *args, **options):
+        if options["users"] < 2 and options["reviews"]:
+            raise CommandError("Reviews need at least two users")
+        if options["books"] < 1 and options["reviews"]:
+            raise CommandError("Reviews need at least one book")
+        self.batch_size = options["batch_size"]
+        self.seed = options["seed"]
+
+        user_ids = self.create_users(options["users"], options["prefix"], options["password"])
+        review_counts = self.count_reviews(options["reviews"], options["books"], len(user_ids))
+        book_ids, author_ids = self.create_books(options["books"], user_ids, review_counts)
+        self.create_reviews(options["reviews"], user_ids, book_ids, author_ids)
+
+        # bulk_create sends no signals; refresh what they would have maintained
+        get_search_backend().rebuild()
+        for name in leaderboards.BOARDS:
+            leaderboards.rebuild(name)
+        response_cache.invalidate(["books:list", "reviews:list"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(user_ids)} user(s), {len(book_ids)} book(s) "
+            f"and {options['reviews']} review(s)"
+        ))
+
+    def insert(self, model, objs):
+        with transaction.atomic():
+            return model._default_manager.bulk_create(objs, batch_size=self.batch_size)
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield range(start, min(start + self.batch_size, total))
+
+    def create_users(self, total, prefix, password):
+        User = get_user_model()
+        # Hashing is the slow part of creating users; every seeded user shares one hash
+        password = make_password(password)
+        user_ids = array("q")
+        for batch in self.batches(total):
+            users = self.insert(User, [
+                User(username=f"{prefix}{i}", email=f"{prefix}{i}@example.com", password=password)
+                for i in batch
+            ])
+            user_ids.extend(user.pk for user in users)
+            self.progress("users", len(user_ids), total)
+        return user_ids
+
+    def review_stream(self, total, books, users):
+        """Yield ``(book_index, user_index)`` pairs; the same ones on every call."""
+        rng = random.Random(self.seed + 2)
+        for _ in range(total):
+            yield int(books * rng.random() ** 3), rng.randrange(users)
+
+    def count_reviews(self, total, books, users):
+        counts = array("l", [0]) * books
+        for book_index, _ in self.review_stream(total, books, users):
+            counts[book_index] += 1
+        return counts
+
+    def create_books(self, total, user_ids, review_counts):
+        rng = random.Random(self.seed + 1)
+        book_ids, author_ids = array("q"), array("q")
+        for batch in self.batches(total):
+            books = self.insert(Book, [
+                Book(
+                    title=f"The {rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS).title()} {i}",
+                    description=" ".join(rng.choices(ADJECTIVES + NOUNS, k=12)),
+                    year_published=rng.randint(1900, 2024),
+                    author_id=user_ids[int(len(user_ids) * rng.random() ** 2)],
+                    review_count=review_counts[i],
+                )
+                for i in batch
+            ])
+            book_ids.extend(book.pk for book in books)
+            author_ids.extend(book.author_id for book in books)
+            self.progress("books", len(book_ids), total)
+        return book_ids, author_ids
+
+    def create_reviews(self, total, user_ids, book_ids, author_ids):
+        rng = random.Random(self.seed + 3)
+        stream = self.review_stream(total, len(book_ids), len(user_ids))
+        created = 0
+        for batch in self.batches(total):
+            reviews = []
+            for _ in batch:
+                book_index, user_index = next(stream)
+                user_id = user_ids[user_index]
+                if user_id == author_ids[book_index]:
+                    # Nobody reviews their own book
+                    user_id = user_ids[(user_index + 1) % len(user_ids)]
+                reviews.append(Review(
+                    text=" ".join(rng.choices(REVIEW_WORDS, k=8)),
+                    user_id=user_id,
+                    book_id=book_ids[book_index],
+                ))
+            self.insert(Review, reviews)
+            created += len(reviews)
+            self.progress("reviews", created, total)
+
+    def progress(self, label, done, total):
+        if done == total or done % (self.batch_size * 20) == 0:
+            self.stdout.write(f"{label}: {done}/{total}")
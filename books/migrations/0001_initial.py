@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-17 23:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Leaderboard',
+            fields=[
+                ('name', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('floor', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Book',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('description', models.TextField()),
+                ('year_published', models.PositiveIntegerField()),
+                ('review_count', models.PositiveIntegerField(default=0, editable=False)),
+                ('author', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='books', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['author', '-id'], name='book_author_recent_idx'), models.Index(fields=['year_published', 'id'], name='book_year_idx'), models.Index(fields=['-review_count', 'id'], name='book_review_rank_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.BigIntegerField()),
+                ('score', models.PositiveIntegerField()),
+                ('leaderboard', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='books.leaderboard')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['leaderboard', '-score', 'object_id'], name='leaderboard_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('leaderboard', 'object_id'), name='unique_leaderboard_object')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 00:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leaderboard',
+            name='floor_object_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='leaderboard',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
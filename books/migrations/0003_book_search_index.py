@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# Frozen copy of books.search.SQLiteFTSBackend's table, built from the rows
+# already there; other databases search with another backend
+CREATE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS books_book_fts USING "
+    "fts5(title, description, tokenize='unicode61 remove_diacritics 2')"
+)
+FILL = (
+    "INSERT INTO books_book_fts(rowid, title, description) "
+    "SELECT id, title, description FROM books_book"
+)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE)
+    schema_editor.execute('DELETE FROM books_book_fts')
+    schema_editor.execute(FILL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS books_book_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0002_leaderboard_floor_object_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -13,6 +13,42 @@ def max_value_current_year(value):
 # Create your models here.
 class Book(models.Model):
     title = models.CharField(max_length=255)
-    author = models.ForeignKey(get_user_model(),on_delete=models.CASCADE,related_name="books")
+    # Indexed by book_author_recent_idx, which leads with it
+    author = models.ForeignKey(get_user_model(),on_delete=models.CASCADE,related_name="books",db_index=False)
     description = models.TextField()
-    year_published = models.PositiveIntegerField()
\ No newline at end of file
+    year_published = models.PositiveIntegerField()
+    # Denormalized from Review, see books.aggregates
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # myBooks: the user's books, latest first
+            models.Index(fields=["author", "-id"], name="book_author_recent_idx"),
+            # booksConnection(orderBy: YEAR_PUBLISHED) keyset pages
+            models.Index(fields=["year_published", "id"], name="book_year_idx"),
+            # Rebuilding the topBooks leaderboard
+            models.Index(fields=["-review_count", "id"], name="book_review_rank_idx"),
+        ]
+
+class Leaderboard(models.Model):
+    """A materialized top-K ranking maintained by books.leaderboards."""
+    name = models.CharField(max_length=32, primary_key=True)
+    # No object outside the entries ranks above (floor, floor_object_id)
+    floor = models.PositiveIntegerField(default=0)
+    floor_object_id = models.BigIntegerField(default=0)
+    # Bumped by every write to the entries, for optimistic concurrency
+    version = models.PositiveIntegerField(default=0)
+
+
+class LeaderboardEntry(models.Model):
+    leaderboard = models.ForeignKey(Leaderboard, on_delete=models.CASCADE, related_name="entries")
+    object_id = models.BigIntegerField()
+    score = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["leaderboard", "object_id"], name="unique_leaderboard_object"),
+        ]
+        indexes = [
+            models.Index(fields=["leaderboard", "-score", "object_id"], name="leaderboard_rank_idx"),
+        ]
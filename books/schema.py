@@ -1,20 +1,125 @@
+import base64
+import binascii
+import json
+
 import graphene
+from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.db.models import Q
 from graphene_django import DjangoObjectType
 from graphql import GraphQLError
 from graphql_jwt.decorators import login_required
 
+from graphdj import bulk, response_cache
+from graphdj.loaders import load_related, track
+from graphdj.optimizer import optimize
+
+from users.schema import UserType
+
+from . import leaderboards
 from .models import Book
+from .search import get_search_backend, render_snippet
 
 
 class BookType(DjangoObjectType):
     class Meta:
         model = Book
 
+    snippet = graphene.String(
+        description="Highlighted search match, set when books is queried with highlight"
+    )
+
+    def resolve_snippet(self, info):
+        return render_snippet(getattr(self, 'search_snippet', None))
+
+    def resolve_author(self, info):
+        return load_related(info, self, 'author')
+
+    def resolve_reviews(self, info):
+        return load_related(info, self, 'reviews')
+
+class BookConnection(graphene.relay.Connection):
+    class Meta:
+        node = BookType
+
+class BookOrder(graphene.Enum):
+    ID = 'id'
+    YEAR_PUBLISHED = 'year_published'
+
+# Keyset columns for each ordering; the trailing id keeps the order total.
+BOOK_ORDER_KEYS = {
+    'id': ('id',),
+    'year_published': ('year_published', 'id'),
+}
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def search_books(books, search, rank=True):
+    """Narrow a Book queryset to the rows matching ``search``."""
+    if not search:
+        return books
+    return get_search_backend().search(books, search, rank=rank)
+
+def encode_cursor(order, book):
+    values = [getattr(book, key) for key in BOOK_ORDER_KEYS[order]]
+    payload = json.dumps([order, values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(order, cursor):
+    try:
+        cursor_order, values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        raise GraphQLError("Invalid cursor")
+    keys = BOOK_ORDER_KEYS[order]
+    if cursor_order != order or len(values) != len(keys):
+        raise GraphQLError("Cursor does not match the requested ordering")
+    return values
+
+def keyset_filter(order, values, descending=False):
+    """
+    Build the WHERE predicate selecting rows strictly after ``values`` in
+    ``order`` (or strictly before when ``descending``), e.g.
+    ``year > y OR (year = y AND id > i)``.
+    """
+    keys = BOOK_ORDER_KEYS[order]
+    lookup = 'lt' if descending else 'gt'
+    predicate = Q()
+    for i, key in enumerate(keys):
+        term = Q(**{f'{key}__{lookup}': values[i]})
+        for prev_key, prev_value in zip(keys[:i], values[:i]):
+            term &= Q(**{prev_key: prev_value})
+        predicate |= term
+    return predicate
+
+class BookRank(graphene.ObjectType):
+    rank = graphene.Int(required=True)
+    review_count = graphene.Int(required=True)
+    book = graphene.Field(BookType)
+
+class AuthorRank(graphene.ObjectType):
+    rank = graphene.Int(required=True)
+    book_count = graphene.Int(required=True)
+    author = graphene.Field(UserType)
+
+def ranked(info, name, queryset, limit):
+    """Pair the leaderboard entries of ``name`` with their rows from ``queryset``."""
+    if limit < 0:
+        raise GraphQLError("Limit cannot be negative")
+    entries = leaderboards.top(name, limit)
+    rows = queryset.in_bulk([object_id for object_id, _ in entries])
+    track(info, rows.values())
+    # Rows deleted outside the mutations are skipped until the next rebuild
+    return [
+        (rank, score, rows[object_id])
+        for rank, (object_id, score) in enumerate(entries, start=1)
+        if object_id in rows
+    ]
+
 class Query(graphene.ObjectType):
     books = graphene.List(
         BookType,
         search=graphene.String(),
+        highlight=graphene.Boolean(default_value=False),
         first=graphene.Int(),
         skip=graphene.Int(),
         description="Get a list of all books, optionally filtered by search term"
@@ -28,18 +133,36 @@ class Query(graphene.ObjectType):
         BookType,
         description="Get all books belonging to the authenticated user"
     )
+    books_connection = graphene.Field(
+        BookConnection,
+        search=graphene.String(),
+        order_by=BookOrder(default_value=BookOrder.ID.value),
+        first=graphene.Int(),
+        after=graphene.String(),
+        last=graphene.Int(),
+        before=graphene.String(),
+        description="Page through books with opaque keyset cursors"
+    )
+    top_books = graphene.List(
+        BookRank,
+        limit=graphene.Int(default_value=10),
+        description="Most reviewed books, from a materialized leaderboard"
+    )
+    top_authors = graphene.List(
+        AuthorRank,
+        limit=graphene.Int(default_value=10),
+        description="Authors with the most books, from a materialized leaderboard"
+    )
 
-    def resolve_books(self, info, search=None, first=None, skip=None):
+    def resolve_books(self, info, search=None, highlight=False, first=None, skip=None):
         try:
-            # Use select_related to optimize queries
-            books = Book.objects.select_related('author').all()
+            # Join only the relations the query selects
+            books = optimize(Book.objects.all(), info)
             
-            if search:
-                filter = (
-                    Q(title__icontains=search) |
-                    Q(description__icontains=search)
-                )
-                books = books.filter(filter)
+            # Matches come back ranked by relevance
+            books = search_books(books, search)
+            if search and highlight:
+                books = get_search_backend().highlight(books, search)
             
             if skip and skip < 0:
                 raise ValueError("Skip value cannot be negative")
@@ -52,36 +175,103 @@ class Query(graphene.ObjectType):
             if first:
                 books = books[:first]
                 
-            return books
+            return track(info, books)
             
         except Exception as e:
             raise GraphQLError(str(e))
 
     def resolve_book(self, info, id):
         try:
-            return Book.objects.select_related('author').get(id=id)
+            book = optimize(Book.objects.all(), info).get(id=id)
         except Book.DoesNotExist:
             raise GraphQLError("Book with this id doesn't exist")
         except Exception as e:
             raise GraphQLError(str(e))
+        return track(info, [book])[0]
 
     @login_required
     def resolve_my_books(self, info):
         try:
-            return (
+            return track(info, optimize(
                 Book.objects
-                .select_related('author')
                 .filter(author=info.context.user)
-                .order_by('-id')  # Latest first
-            )
+                .order_by('-id'),  # Latest first
+                info
+            ))
         except Exception as e:
             raise GraphQLError(str(e))
 
+    def resolve_top_books(self, info, limit):
+        books = optimize(Book.objects.all(), info, ('book',))
+        return [
+            BookRank(rank=rank, review_count=score, book=book)
+            for rank, score, book in ranked(info, leaderboards.BOOKS, books, limit)
+        ]
+
+    def resolve_top_authors(self, info, limit):
+        authors = optimize(get_user_model().objects.all(), info, ('author',))
+        return [
+            AuthorRank(rank=rank, book_count=score, author=author)
+            for rank, score, author in ranked(info, leaderboards.AUTHORS, authors, limit)
+        ]
+
+    def resolve_books_connection(self, info, order_by, search=None, first=None,
+                                 after=None, last=None, before=None):
+        if first is not None and last is not None:
+            raise GraphQLError("Use either first or last, not both")
+        if (first is not None and first < 0) or (last is not None and last < 0):
+            raise GraphQLError("Page size cannot be negative")
+        if after is not None and before is not None:
+            raise GraphQLError("Use either after or before, not both")
+
+        order_by = getattr(order_by, 'value', order_by)
+        backward = last is not None or (first is None and before is not None)
+        requested = last if backward else first
+        size = DEFAULT_PAGE_SIZE if requested is None else min(requested, MAX_PAGE_SIZE)
+        keys = BOOK_ORDER_KEYS[order_by]
+
+        books = search_books(
+            optimize(Book.objects.all(), info, ('edges', 'node')), search, rank=False
+        )
+        cursor = before if backward else after
+        if cursor is not None:
+            books = books.filter(
+                keyset_filter(order_by, decode_cursor(order_by, cursor), descending=backward)
+            )
+        if backward:
+            books = books.order_by(*[f'-{key}' for key in keys])
+        else:
+            books = books.order_by(*keys)
+
+        rows = track(info, books[:size + 1])
+        has_more = len(rows) > size
+        rows = rows[:size]
+        if backward:
+            rows.reverse()
+
+        edges = [
+            BookConnection.Edge(node=book, cursor=encode_cursor(order_by, book))
+            for book in rows
+        ]
+        page_info = graphene.relay.PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_next_page=has_more if not backward else before is not None,
+            has_previous_page=has_more if backward else after is not None,
+        )
+        return BookConnection(edges=edges, page_info=page_info)
+
 class CreateBookInput(graphene.InputObjectType):
         title = graphene.String(required=True)
         description = graphene.String(required=True)
         year_published = graphene.Int(required=True)
 
+def create_book_errors(create_book_input):
+    """Validation shared by ``createBook`` and ``createBooks``."""
+    if create_book_input.year_published < 0:
+        return ["Year published cannot be negative"]
+    return []
+
 class CreateBook(graphene.Mutation):
     class Arguments:
         create_book_input = CreateBookInput(required=True)
@@ -93,10 +283,11 @@ class CreateBook(graphene.Mutation):
     @login_required
     def mutate(self, info, create_book_input):
         try:
-            if create_book_input.year_published < 0:
+            errors = create_book_errors(create_book_input)
+            if errors:
                 return CreateBook(
                     success=False,
-                    errors=["Year published cannot be negative"]
+                    errors=errors
                 )
                 
             book = Book(
@@ -105,7 +296,9 @@ class CreateBook(graphene.Mutation):
                 year_published=create_book_input.year_published,
                 author=info.context.user
             )
-            book.save()
+            with transaction.atomic():
+                book.save()
+                leaderboards.update(leaderboards.AUTHORS, [book.author_id])
             
             return CreateBook(book=book, success=True)
             
@@ -115,12 +308,60 @@ class CreateBook(graphene.Mutation):
                 errors=[str(e)]
             )
 
+class CreateBooks(graphene.Mutation):
+    class Arguments:
+        inputs = graphene.List(graphene.NonNull(CreateBookInput), required=True)
+
+    books = graphene.List(BookType)
+    success = graphene.Boolean()
+    errors = graphene.List(bulk.ItemError)
+
+    @login_required
+    def mutate(self, info, inputs):
+        bulk.check_size(inputs)
+        errors = bulk.item_errors(inputs, create_book_errors)
+        if errors:
+            return CreateBooks(success=False, errors=errors)
+
+        books = [
+            Book(
+                title=book_input.title,
+                description=book_input.description,
+                year_published=book_input.year_published,
+                author=info.context.user
+            )
+            for book_input in inputs
+        ]
+        with transaction.atomic():
+            books = bulk.bulk_create(Book, books)
+            get_search_backend().index(books)
+            response_cache.invalidate_on_commit(['books:list'])
+            leaderboards.update(leaderboards.AUTHORS, [info.context.user.id])
+        return CreateBooks(books=track(info, books), success=True)
+
 class UpdateBookInput(graphene.InputObjectType):
     id = graphene.Int(required=True)
     title = graphene.String()
     description = graphene.String()
     year_published = graphene.Int()
 
+def update_book_errors(update_book_input):
+    """Validation shared by ``updateBook`` and ``updateBooks``."""
+    year_published = update_book_input.year_published
+    if year_published is not None and year_published < 0:
+        return ["Year published cannot be negative"]
+    return []
+
+def apply_book_update(book, update_book_input):
+    """Copy the given fields of ``update_book_input`` onto ``book``; return their names."""
+    fields = []
+    for field in ('title', 'description', 'year_published'):
+        value = getattr(update_book_input, field)
+        if value is not None:
+            setattr(book, field, value)
+            fields.append(field)
+    return fields
+
 class UpdateBook(graphene.Mutation):
     class Arguments:
         update_book_input = UpdateBookInput(required=True)
@@ -140,17 +381,13 @@ class UpdateBook(graphene.Mutation):
                     errors=["You cannot update a book which is not yours"]
                 )
 
-            if update_book_input.title is not None:
-                book.title = update_book_input.title
-            if update_book_input.description is not None:
-                book.description = update_book_input.description
-            if update_book_input.year_published is not None:
-                if update_book_input.year_published < 0:
-                    return UpdateBook(
-                        success=False,
-                        errors=["Year published cannot be negative"]
-                    )
-                book.year_published = update_book_input.year_published
+            errors = update_book_errors(update_book_input)
+            if errors:
+                return UpdateBook(
+                    success=False,
+                    errors=errors
+                )
+            apply_book_update(book, update_book_input)
             
             book.save()
             return UpdateBook(book=book, success=True)
@@ -166,6 +403,49 @@ class UpdateBook(graphene.Mutation):
                 errors=[str(e)]
             )
 
+class UpdateBooks(graphene.Mutation):
+    class Arguments:
+        inputs = graphene.List(graphene.NonNull(UpdateBookInput), required=True)
+
+    books = graphene.List(BookType)
+    denied = graphene.List(graphene.Int)
+    missing = graphene.List(graphene.Int)
+    success = graphene.Boolean()
+    errors = graphene.List(bulk.ItemError)
+
+    @login_required
+    def mutate(self, info, inputs):
+        bulk.check_size(inputs)
+        errors = bulk.item_errors(inputs, update_book_errors)
+        if errors:
+            return UpdateBooks(success=False, errors=errors)
+
+        updates = {book_input.id: book_input for book_input in inputs}
+        with transaction.atomic():
+            books = list(
+                Book.objects.select_for_update()
+                .filter(id__in=updates, author=info.context.user)
+                .order_by('id')
+            )
+            denied, missing = bulk.denied_and_missing(
+                Book.objects.all(), updates, [book.id for book in books]
+            )
+            fields = set()
+            for book in books:
+                fields.update(apply_book_update(book, updates[book.id]))
+            if books and fields:
+                bulk.bulk_update(Book, books, sorted(fields))
+                get_search_backend().index(books)
+                response_cache.invalidate_on_commit(
+                    ['books:list'] + [response_cache.book_tag(book.id) for book in books]
+                )
+        return UpdateBooks(
+            books=track(info, books),
+            denied=denied,
+            missing=missing,
+            success=not denied and not missing
+        )
+
 class DeleteBook(graphene.Mutation):
     class Arguments:
         book_id = graphene.Int(required=True)
@@ -184,7 +464,10 @@ class DeleteBook(graphene.Mutation):
                     errors=["You cannot delete a book which is not yours"]
                 )
                 
-            book.delete()
+            with transaction.atomic():
+                book.delete()
+                leaderboards.update(leaderboards.BOOKS, [book_id])
+                leaderboards.update(leaderboards.AUTHORS, [info.context.user.id])
             return DeleteBook(success=True)
             
         except Book.DoesNotExist:
@@ -198,8 +481,38 @@ class DeleteBook(graphene.Mutation):
                 errors=[str(e)]
             )
 
+class DeleteBooks(graphene.Mutation):
+    class Arguments:
+        ids = graphene.List(graphene.NonNull(graphene.Int), required=True)
+
+    deleted = graphene.List(graphene.Int)
+    denied = graphene.List(graphene.Int)
+    missing = graphene.List(graphene.Int)
+    success = graphene.Boolean()
+
+    @login_required
+    def mutate(self, info, ids):
+        bulk.check_size(ids)
+        with transaction.atomic():
+            owned = Book.objects.filter(id__in=ids, author=info.context.user)
+            deleted = sorted(owned.values_list('id', flat=True))
+            denied, missing = bulk.denied_and_missing(Book.objects.all(), ids, deleted)
+            # post_delete receivers unindex the books and expire cached responses
+            owned.delete()
+            leaderboards.update(leaderboards.BOOKS, deleted)
+            leaderboards.update(leaderboards.AUTHORS, [info.context.user.id])
+        return DeleteBooks(
+            deleted=deleted,
+            denied=denied,
+            missing=missing,
+            success=not denied and not missing
+        )
+
 class Mutation(graphene.ObjectType):
     create_book = CreateBook.Field()
+    create_books = CreateBooks.Field()
     update_book = UpdateBook.Field()
+    update_books = UpdateBooks.Field()
     delete_book = DeleteBook.Field()
+    delete_books = DeleteBooks.Field()
 
@@ -0,0 +1,162 @@
+"""
+Full-text search over books.
+
+The backend is chosen with the ``BOOK_SEARCH_BACKEND`` setting. The SQLite
+backend keeps an FTS5 table (``books_book_fts``) whose rowid is the book id,
+created by migration ``0003_book_search_index``; the ``Book`` save/delete
+signals in ``books.signals`` keep it in sync with the book mutations, and
+``manage.py rebuild_book_search_index`` rebuilds it from scratch. Snippets
+are HTML: the book text is escaped and only the matched terms are wrapped in
+``HIGHLIGHT_START``/``HIGHLIGHT_END`` (see :func:`render_snippet`).
+"""
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+
+DEFAULT_BACKEND = 'books.search.SQLiteFTSBackend'
+HIGHLIGHT_START = '<b>'
+HIGHLIGHT_END = '</b>'
+SNIPPET_ELLIPSIS = '…'
+SNIPPET_TOKENS = 16
+# Private-use characters marking matches in raw snippets until they are escaped
+MATCH_START = '\ue000'
+MATCH_END = '\ue001'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class SearchBackend:
+    """Interface every book search backend implements."""
+
+    def search(self, queryset, query, rank=True):
+        """Filter ``queryset`` to matches, ordered by relevance if ``rank``."""
+        raise NotImplementedError
+
+    def highlight(self, queryset, query):
+        """
+        Annotate ``search_snippet`` with the raw match, its terms between
+        ``MATCH_START`` and ``MATCH_END``.
+        """
+        return queryset
+
+    def index(self, books):
+        """Add or refresh ``books`` in the index."""
+
+    def remove(self, book_ids):
+        """Drop ``book_ids`` from the index."""
+
+    def rebuild(self):
+        """Recreate the index from the books table."""
+
+
+class ContainsBackend(SearchBackend):
+    """Index-free fallback using ``icontains``; works on every database."""
+
+    def search(self, queryset, query, rank=True):
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(description__icontains=query)
+        )
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """SQLite FTS5 index ranked with bm25, title weighted over description."""
+
+    table = 'books_book_fts'
+    title_weight = 10.0
+    description_weight = 1.0
+
+    def match_expression(self, query):
+        """
+        Turn free text into an FTS5 query: every word must match, the last
+        one as a prefix so search-as-you-type works.
+        """
+        tokens = _TOKEN_RE.findall(query)
+        if not tokens:
+            return None
+        terms = [f'"{token}"' for token in tokens]
+        terms[-1] += '*'
+        return ' '.join(terms)
+
+    def _correlated(self, select, match, params=()):
+        return RawSQL(
+            f'(SELECT {select} FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND rowid = "books_book"."id")',
+            (*params, match),
+        )
+
+    def search(self, queryset, query, rank=True):
+        match = self.match_expression(query)
+        if match is None:
+            return queryset.none()
+        queryset = queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', (match,)
+        ))
+        if rank:
+            queryset = queryset.annotate(search_rank=self._correlated(
+                f'bm25({self.table}, %s, %s)', match,
+                (self.title_weight, self.description_weight),
+            )).order_by('search_rank', 'id')
+        return queryset
+
+    def highlight(self, queryset, query):
+        match = self.match_expression(query)
+        if match is None:
+            return queryset
+        return queryset.annotate(search_snippet=self._correlated(
+            f'snippet({self.table}, -1, %s, %s, %s, %s)', match,
+            (MATCH_START, MATCH_END, SNIPPET_ELLIPSIS, SNIPPET_TOKENS),
+        ))
+
+    def index(self, books):
+        rows = [(book.id, book.title, book.description) for book in books]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows]
+            )
+            cursor.executemany(
+                f'INSERT INTO {self.table}(rowid, title, description) VALUES (%s, %s, %s)',
+                rows,
+            )
+
+    def remove(self, book_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in book_ids]
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING "
+                f"fts5(title, description, tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table}(rowid, title, description) '
+                f'SELECT id, title, description FROM books_book'
+            )
+
+
+def render_snippet(snippet):
+    """The HTML of a raw ``search_snippet``: escaped, with the matches in bold."""
+    if snippet is None:
+        return None
+    return (
+        escape(snippet)
+        .replace(MATCH_START, HIGHLIGHT_START)
+        .replace(MATCH_END, HIGHLIGHT_END)
+    )
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    return import_string(getattr(settings, 'BOOK_SEARCH_BACKEND', DEFAULT_BACKEND))()
@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from graphdj import response_cache
+
+from .models import Book
+from .search import get_search_backend
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, **kwargs):
+    get_search_backend().index([instance])
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    get_search_backend().remove([instance.pk])
+
+
+@receiver(post_save, sender=Book)
+def invalidate_saved_book(sender, instance, created, **kwargs):
+    tags = ['books:list']
+    if not created:
+        tags.append(response_cache.book_tag(instance.pk))
+    response_cache.invalidate_on_commit(tags)
+
+
+@receiver(post_delete, sender=Book)
+def invalidate_deleted_book(sender, instance, **kwargs):
+    response_cache.invalidate_on_commit([
+        'books:list',
+        'reviews:list',
+        response_cache.book_tag(instance.pk),
+        response_cache.book_reviews_tag(instance.pk),
+    ])
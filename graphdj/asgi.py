@@ -12,5 +12,16 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'graphdj.settings')
+os.environ.setdefault('GRAPHQL_ASYNC', '1')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Needs the app registry populated by get_asgi_application()
+from .subscriptions import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,68 @@
+"""
+Shared pieces of the bulk mutations (``createBooks``, ``createReviews``,
+``updateBooks``, ``deleteBooks``, ``deleteReviews``).
+
+A bulk mutation validates every input before writing anything and only
+writes when all of them are valid; failures are reported as ``ItemError``s
+pointing at the offending input by position. Rows are then written in one
+transaction, ``GRAPHQL_BULK['BATCH_SIZE']`` rows per statement. Updates and
+deletes put the ownership check in the ``WHERE`` clause and report the ids
+that were denied or missing instead of failing the whole call.
+``bulk_create`` and ``bulk_update`` send no model signals, so callers do the
+search indexing and cache invalidation their ``post_save`` receivers would
+have.
+"""
+import graphene
+from django.conf import settings
+from graphql import GraphQLError
+
+DEFAULTS = {
+    'MAX_ITEMS': 500,
+    'BATCH_SIZE': 100,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_BULK', {})}
+
+
+class ItemError(graphene.ObjectType):
+    index = graphene.Int(required=True)
+    errors = graphene.List(graphene.NonNull(graphene.String), required=True)
+
+
+def check_size(inputs):
+    """Reject calls with more than ``MAX_ITEMS`` inputs or ids."""
+    max_items = get_config()['MAX_ITEMS']
+    if len(inputs) > max_items:
+        raise GraphQLError(f"Cannot process more than {max_items} items at once")
+
+
+def item_errors(inputs, validate):
+    """Run ``validate`` (input -> list of messages) over ``inputs``."""
+    errors = []
+    for index, item in enumerate(inputs):
+        messages = validate(item)
+        if messages:
+            errors.append(ItemError(index=index, errors=messages))
+    return errors
+
+
+def bulk_create(model, objs):
+    return model._default_manager.bulk_create(objs, batch_size=get_config()['BATCH_SIZE'])
+
+
+def bulk_update(model, objs, fields):
+    model._default_manager.bulk_update(objs, fields, batch_size=get_config()['BATCH_SIZE'])
+
+
+def denied_and_missing(queryset, ids, owned_ids):
+    """
+    Return sorted ``(denied, missing)`` lists for the ``ids`` that are not in
+    ``owned_ids``: those that exist in ``queryset`` belong to somebody else.
+    """
+    rest = set(ids) - set(owned_ids)
+    if not rest:
+        return [], []
+    existing = set(queryset.filter(pk__in=rest).values_list('pk', flat=True))
+    return sorted(rest & existing), sorted(rest - existing)
@@ -0,0 +1,69 @@
+"""
+LRU cache of parsed and validated GraphQL documents.
+
+Keyed by the sha256 of the document text, each entry holds the parsed AST
+and the validation errors produced against the schema. The whole cache is
+dropped as soon as it is asked about a different schema object.
+"""
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from graphql import parse
+from graphql.error import GraphQLError
+from graphql.validation import validate
+
+CachedDocument = namedtuple('CachedDocument', ['document', 'errors'])
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+DEFAULT_SIZE = 256
+
+
+class DocumentCache:
+    def __init__(self, maxsize=DEFAULT_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._schema = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, schema, query, rules=None, max_errors=None):
+        """Return the ``CachedDocument`` for ``query`` under ``schema``."""
+        key = hashlib.sha256(query.encode()).hexdigest()
+        with self._lock:
+            if schema is not self._schema:
+                self._entries.clear()
+                self._schema = schema
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        try:
+            document = parse(query)
+        except GraphQLError as e:
+            entry = CachedDocument(None, [e])
+        else:
+            entry = CachedDocument(document, validate(schema, document, rules, max_errors))
+
+        with self._lock:
+            if schema is self._schema:
+                self._entries[key] = entry
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+document_cache = DocumentCache(getattr(settings, 'GRAPHQL_DOCUMENT_CACHE_SIZE', DEFAULT_SIZE))
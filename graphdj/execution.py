@@ -0,0 +1,60 @@
+"""
+Concurrent execution of root fields for ``AsyncGraphQLView``.
+
+Resolvers use the synchronous ORM. ``ConcurrentExecutionContext`` runs each
+root field of a query -- its resolver and everything completed below it -- on
+a bounded thread pool and returns an awaitable, so graphql-core gathers
+sibling root fields concurrently while the event loop stays free for other
+requests. Mutation fields still execute serially, on the caller's thread.
+``GRAPHQL_ASYNC_MAX_WORKERS`` sizes the pool, which ``graphdj.subscriptions``
+also executes subscription events on (see ``pooled``).
+"""
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from graphql import ExecutionContext, OperationType
+
+from . import query_stats
+
+DEFAULT_MAX_WORKERS = 8
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide pool root fields are resolved on."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'GRAPHQL_ASYNC_MAX_WORKERS', DEFAULT_MAX_WORKERS),
+                thread_name_prefix='graphql',
+            )
+    return _executor
+
+
+def pooled(func):
+    """Wrap the synchronous ``func`` into a coroutine function run on the pool."""
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        # Pool threads keep their own connections; honour CONN_MAX_AGE for them
+        close_old_connections()
+        query_stats.install()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False, executor=get_executor())
+
+
+class ConcurrentExecutionContext(ExecutionContext):
+    def execute_field(self, parent_type, source, field_nodes, path):
+        if path.prev is not None or self.operation.operation != OperationType.QUERY:
+            return super().execute_field(parent_type, source, field_nodes, path)
+        return pooled(super().execute_field)(parent_type, source, field_nodes, path)
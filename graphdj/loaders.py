@@ -0,0 +1,175 @@
+"""
+Per-request batching of related-object lookups.
+
+Execution is synchronous, so a classic promise based DataLoader cannot defer
+its batch until the end of a tick. Instead every model instance handed out by a
+resolver is tracked on the request, and the first time a relation is needed
+for one of them the loader fetches it for *all* tracked instances in a single
+``IN (...)`` query. Sibling rows in a list therefore cost one query per
+relation and nesting level instead of one query per row.
+
+Each root field gets its own registry, so root fields that
+``AsyncGraphQLView`` resolves on different threads never share one.
+"""
+from collections import defaultdict
+
+from django.db import connection
+
+
+class ModelLoader:
+    """
+    Loads ``model`` rows keyed by ``field`` ("pk" or the name of a foreign
+    key on ``model``) and caches them for the lifetime of the request.
+    """
+
+    def __init__(self, registry, model, field="pk"):
+        self.registry = registry
+        self.model = model
+        self.field = field
+        if field == "pk":
+            self.many = False
+            self.lookup = "pk"
+            self.key_attname = model._meta.pk.attname
+        else:
+            model_field = model._meta.get_field(field)
+            self.many = not model_field.one_to_one
+            self.lookup = field
+            self.key_attname = model_field.attname
+        self._cache = {}
+        self._scanned = defaultdict(int)
+
+    def _source_attnames(self, source):
+        """Attributes on ``source`` instances holding keys for this loader."""
+        if self.field == "pk":
+            return [
+                f.attname
+                for f in source._meta.concrete_fields
+                if f.is_relation
+                and (f.many_to_one or f.one_to_one)
+                and f.related_model is self.model
+            ]
+        related_model = self.model._meta.get_field(self.field).related_model
+        if source is related_model:
+            return [source._meta.pk.attname]
+        return []
+
+    def _pending_keys(self):
+        keys = set()
+        for source, instances in self.registry.seen.items():
+            start = self._scanned[source]
+            if start == len(instances):
+                continue
+            for attname in self._source_attnames(source):
+                keys.update(getattr(obj, attname) for obj in instances[start:])
+            self._scanned[source] = len(instances)
+        keys.discard(None)
+        return keys.difference(self._cache)
+
+    def _fetch(self, keys):
+        keys = list(keys)
+        batch_size = connection.features.max_query_params or len(keys)
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            rows = self.registry.track(
+                self.model._default_manager
+                .filter(**{f"{self.lookup}__in": batch})
+                .order_by("pk")
+            )
+            if self.many:
+                for key in batch:
+                    self._cache[key] = []
+                for row in rows:
+                    self._cache[getattr(row, self.key_attname)].append(row)
+            else:
+                for key in batch:
+                    self._cache[key] = None
+                for row in rows:
+                    self._cache[getattr(row, self.key_attname)] = row
+
+    def load(self, key):
+        """Return the row (or list of rows) for ``key``, batching misses."""
+        if key is None:
+            return [] if self.many else None
+        if key not in self._cache:
+            self._fetch(self._pending_keys() | {key})
+        return self._cache[key]
+
+
+class LoaderRegistry:
+    """Holds the loaders and the instances seen so far for one request."""
+
+    def __init__(self):
+        self.seen = defaultdict(list)
+        self._seen_ids = set()
+        self._loaders = {}
+
+    def loader(self, model, field="pk"):
+        key = (model, field)
+        if key not in self._loaders:
+            self._loaders[key] = ModelLoader(self, model, field)
+        return self._loaders[key]
+
+    def track(self, instances):
+        """Remember ``instances`` as batch candidates and return them as a list."""
+        instances = list(instances)
+        for obj in instances:
+            if obj is None or id(obj) in self._seen_ids:
+                continue
+            self._seen_ids.add(id(obj))
+            self.seen[type(obj)].append(obj)
+        return instances
+
+
+def _root_key(path):
+    while path.prev is not None:
+        path = path.prev
+    return path.key
+
+
+def get_loaders(info):
+    """Return the loader registry of the root field being resolved."""
+    context = info.context
+    if context is None:
+        return LoaderRegistry()
+    registries = vars(context).setdefault("loaders", {})
+    key = _root_key(info.path)
+    registry = registries.get(key)
+    if registry is None:
+        registry = registries.setdefault(key, LoaderRegistry())
+    return registry
+
+
+def track(info, instances):
+    """Register the rows returned by a resolver so their relations batch."""
+    return get_loaders(info).track(instances)
+
+
+def load_related(info, root, name):
+    """
+    Resolve relation ``name`` of ``root`` through the request's loaders.
+
+    Relations already populated by ``select_related``/``prefetch_related`` are
+    returned as-is.
+    """
+    registry = get_loaders(info)
+    field = root._meta.get_field(name)
+
+    if field.concrete:
+        if field.is_cached(root):
+            value = field.get_cached_value(root)
+            registry.track([value])
+            return value
+        return registry.loader(field.related_model).load(getattr(root, field.attname))
+
+    if field.one_to_one:
+        if field.is_cached(root):
+            value = field.get_cached_value(root)
+            registry.track([value])
+            return value
+        return registry.loader(field.related_model, field.field.name).load(root.pk)
+
+    prefetched = getattr(root, "_prefetched_objects_cache", {})
+    accessor = field.get_accessor_name()
+    if accessor in prefetched:
+        return registry.track(prefetched[accessor])
+    return registry.loader(field.related_model, field.field.name).load(root.pk)
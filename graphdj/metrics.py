@@ -0,0 +1,382 @@
+"""
+Prometheus metrics of ``/graphql/``, served on ``/metrics``.
+
+``GraphQLView`` counts every operation and its errors and observes its
+latency and SQL statement count, labeled by operation name and root field:
+an operation selecting several root fields is recorded once under each, so
+summing over ``root_field`` counts it once per field. Root fields are named
+only from validated documents, so they are bounded by the schema. With
+``RESOLVER_TIMING`` on, a resolver middleware times the root fields and the
+fields with a resolver of their own (fields read off their parent by the
+default resolver are skipped), and the ``RESOLVER_SLOWEST`` fields that took
+longest are observed in a histogram labeled by type and field. Statements are
+counted through ``query_stats``.
+
+Every series is a counter or a histogram, so the samples of several worker
+processes add up. With ``DIRECTORY`` set, each process writes its samples to
+its own file there at most every ``FLUSH_INTERVAL`` seconds (and at exit),
+and ``render`` sums the files of all processes, like prometheus_client's
+multiprocess mode; point the workers of one deployment at the same directory
+and empty it on deploy. Without it only the serving process is reported.
+Operation names come from client documents, so at most ``MAX_OPERATIONS`` of
+them are kept per process and the rest are reported as ``other``.
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.conf import settings
+from graphene.types.resolver import (
+    attr_resolver,
+    dict_or_attr_resolver,
+    dict_resolver,
+    get_default_resolver,
+)
+from graphql import FieldNode, FragmentSpreadNode, InlineFragmentNode
+from graphql.pyutils import is_awaitable
+
+DEFAULTS = {
+    'ENABLED': False,
+    'DIRECTORY': None,
+    'TOKEN': None,
+    'FLUSH_INTERVAL': 1.0,
+    'MAX_OPERATIONS': 100,
+    'RESOLVER_TIMING': False,
+    'RESOLVER_SLOWEST': 5,
+    'LATENCY_BUCKETS': [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+    'QUERY_BUCKETS': [0, 1, 2, 5, 10, 20, 50, 100, 200],
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REQUESTS = 'graphql_requests_total'
+ERRORS = 'graphql_errors_total'
+DURATION = 'graphql_request_duration_seconds'
+QUERIES = 'graphql_db_queries'
+RESOLVER_DURATION = 'graphql_resolver_duration_seconds'
+
+# name: (type, help, buckets setting)
+METRICS = {
+    REQUESTS: ('counter', 'GraphQL operations served.', None),
+    ERRORS: ('counter', 'GraphQL operations that returned errors.', None),
+    DURATION: (
+        'histogram', 'Time spent preparing and executing GraphQL operations.',
+        'LATENCY_BUCKETS',
+    ),
+    QUERIES: ('histogram', 'SQL statements run per GraphQL operation.', 'QUERY_BUCKETS'),
+    RESOLVER_DURATION: (
+        'histogram', 'Time spent per operation resolving fields among its slowest.',
+        'LATENCY_BUCKETS',
+    ),
+}
+
+_current = ContextVar('metrics', default=None)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_METRICS', {})}
+
+
+def enabled():
+    return bool(get_config()['ENABLED'])
+
+
+def timing_resolvers():
+    config = get_config()
+    return bool(config['ENABLED'] and config['RESOLVER_TIMING'])
+
+
+def root_fields(document, operation_ast):
+    """Names of the root fields ``operation_ast`` selects, in order."""
+    fragments = {
+        definition.name.value: definition for definition in document.definitions
+        if definition.kind == 'fragment_definition'
+    }
+    names = []
+
+    def collect(selection_set, spread):
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                if selection.name.value not in names:
+                    names.append(selection.name.value)
+            elif isinstance(selection, InlineFragmentNode):
+                collect(selection.selection_set, spread)
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                if name in fragments and name not in spread:
+                    collect(fragments[name].selection_set, spread | {name})
+
+    collect(operation_ast.selection_set, frozenset())
+    return names
+
+
+class Sample:
+    """What one operation contributes to the metrics."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.operation = 'anonymous'
+        self.root_fields = []
+        self.failed = False
+        self.queries = None
+        self.recorded = True
+        self.fields = defaultdict(float)
+        # Set when root fields resolve on several threads at once
+        self.lock = None
+
+    def add_field(self, type_name, field_name, duration):
+        if self.lock is None:
+            self.fields[type_name, field_name] += duration
+            return
+        with self.lock:
+            self.fields[type_name, field_name] += duration
+
+
+class ResolverTimingMiddleware:
+    """
+    Graphene middleware adding the time of root fields and of fields with a
+    resolver of their own to the current sample.
+    """
+
+    def __init__(self):
+        # (type, field) -> whether it is timed
+        self.timed = {}
+
+    def is_timed(self, info):
+        key = info.parent_type.name, info.field_name
+        timed = self.timed.get(key)
+        if timed is None:
+            resolve = info.parent_type.fields[info.field_name].resolve
+            default = resolve is None or isinstance(resolve, partial) and resolve.func in (
+                attr_resolver, dict_resolver, dict_or_attr_resolver, get_default_resolver()
+            )
+            timed = self.timed[key] = info.path.prev is None or not default
+        return timed
+
+    def resolve(self, next, root, info, **args):
+        sample = _current.get()
+        if sample is None or not self.is_timed(info):
+            return next(root, info, **args)
+        start = time.perf_counter()
+        result = next(root, info, **args)
+        if is_awaitable(result):
+            return self._await(sample, info, start, result)
+        sample.add_field(info.parent_type.name, info.field_name, time.perf_counter() - start)
+        return result
+
+    async def _await(self, sample, info, start, result):
+        try:
+            return await result
+        finally:
+            sample.add_field(info.parent_type.name, info.field_name, time.perf_counter() - start)
+
+
+class Registry:
+    """The counters and histograms of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.file_name = f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+        self.counters = defaultdict(float)
+        # labels -> per-bucket counts, the +Inf count, then the sum
+        self.histograms = {}
+        self.operations = set()
+        self.flushed = time.monotonic()
+
+    def operation_label(self, name, limit):
+        with self._lock:
+            if name in self.operations:
+                return name
+            if len(self.operations) < limit:
+                self.operations.add(name)
+                return name
+        return 'other'
+
+    def increment(self, name, labels, value=1):
+        with self._lock:
+            self.counters[name, labels] += value
+
+    def observe(self, name, labels, value, buckets):
+        with self._lock:
+            counts = self.histograms.get((name, labels))
+            if counts is None:
+                counts = self.histograms[name, labels] = [0] * (len(buckets) + 2)
+            counts[bisect.bisect_left(buckets, value)] += 1
+            counts[-1] += value
+
+    def record(self, sample, config):
+        operation = self.operation_label(sample.operation, config['MAX_OPERATIONS'])
+        duration = time.perf_counter() - sample.start
+        for root_field in sample.root_fields or ['']:
+            labels = (('operation', operation), ('root_field', root_field))
+            self.increment(REQUESTS, labels)
+            if sample.failed:
+                self.increment(ERRORS, labels)
+            self.observe(DURATION, labels, duration, config['LATENCY_BUCKETS'])
+            if sample.queries is not None:
+                self.observe(QUERIES, labels, sample.queries, config['QUERY_BUCKETS'])
+        slowest = sorted(sample.fields.items(), key=lambda item: item[1], reverse=True)
+        for (type_name, field_name), spent in slowest[:config['RESOLVER_SLOWEST']]:
+            self.observe(
+                RESOLVER_DURATION, (('type', type_name), ('field', field_name)),
+                spent, config['LATENCY_BUCKETS']
+            )
+        if config['DIRECTORY'] and time.monotonic() - self.flushed >= config['FLUSH_INTERVAL']:
+            self.flush(config['DIRECTORY'])
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [
+                    [name, labels, value] for (name, labels), value in self.counters.items()
+                ],
+                'histograms': [
+                    [name, labels, list(counts)]
+                    for (name, labels), counts in self.histograms.items()
+                ],
+            }
+
+    def flush(self, directory):
+        """Write this process's samples to its file in ``directory``."""
+        self.flushed = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.file_name)
+        temp = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temp, path)
+
+
+_registry = Registry()
+
+
+def get_registry():
+    return _registry
+
+
+if hasattr(os, 'register_at_fork'):
+    # Workers forked from a preloaded parent start from zero in their own file
+    os.register_at_fork(after_in_child=lambda: _registry.reset())
+
+
+@atexit.register
+def _flush_at_exit():
+    directory = get_config()['DIRECTORY'] if settings.configured else None
+    if directory:
+        _registry.flush(directory)
+
+
+@contextmanager
+def collect():
+    """Record the operation run inside, if metrics are enabled."""
+    config = get_config()
+    if not config['ENABLED']:
+        yield None
+        return
+    sample = Sample()
+    token = _current.set(sample)
+    try:
+        yield sample
+    except BaseException:
+        sample.failed = True
+        raise
+    finally:
+        _current.reset(token)
+        if sample.recorded:
+            _registry.record(sample, config)
+
+
+def describe(document, operation_ast):
+    """Label the current sample with the operation about to run."""
+    sample = _current.get()
+    if sample is not None and operation_ast is not None:
+        if operation_ast.name is not None:
+            sample.operation = operation_ast.name.value
+        sample.root_fields = root_fields(document, operation_ast)
+
+
+def finish(sample, result, stats):
+    """Note the outcome of the operation in ``sample`` and return ``result``."""
+    if sample is not None:
+        if result is None:
+            # Nothing was executed, e.g. the GraphiQL page was served
+            sample.recorded = False
+        elif result.errors:
+            sample.failed = True
+        if stats is not None:
+            sample.queries = stats.count
+    return result
+
+
+def load(directory, registry):
+    """Sum the samples every process wrote to ``directory``."""
+    counters = defaultdict(float)
+    histograms = {}
+
+    def add(data):
+        for name, labels, value in data['counters']:
+            counters[name, tuple(map(tuple, labels))] += value
+        for name, labels, counts in data['histograms']:
+            key = name, tuple(map(tuple, labels))
+            if key not in histograms:
+                histograms[key] = list(counts)
+            elif len(histograms[key]) == len(counts):
+                histograms[key] = [a + b for a, b in zip(histograms[key], counts)]
+
+    add(registry.snapshot())
+    if directory and os.path.isdir(directory):
+        for file_name in sorted(os.listdir(directory)):
+            if file_name == registry.file_name or not file_name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, file_name)) as f:
+                    add(json.load(f))
+            except (OSError, ValueError):
+                # Removed or unreadable; it is rewritten whole, never partly
+                continue
+    return counters, histograms
+
+
+def format_labels(labels):
+    def escape(value):
+        return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+    return '{%s}' % ','.join(f'{name}="{escape(value)}"' for name, value in labels)
+
+
+def render():
+    """The samples of every process in the Prometheus text format."""
+    config = get_config()
+    counters, histograms = load(config['DIRECTORY'], _registry)
+    lines = []
+    for name, (kind, help, buckets_setting) in METRICS.items():
+        lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {float(value)!r}')
+            continue
+        bounds = [repr(float(bound)) for bound in config[buckets_setting]] + ['+Inf']
+        for (metric, labels), counts in sorted(histograms.items()):
+            if metric != name or len(counts) != len(bounds) + 1:
+                continue
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(
+                    f'{name}_bucket{format_labels(labels + (("le", bound),))} {float(cumulative)!r}'
+                )
+            lines.append(f'{name}_sum{format_labels(labels)} {float(counts[-1])!r}')
+            lines.append(f'{name}_count{format_labels(labels)} {float(cumulative)!r}')
+    return '\n'.join(lines) + '\n'
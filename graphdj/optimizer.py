@@ -0,0 +1,87 @@
+"""
+Selection-set driven ``select_related``/``prefetch_related``.
+
+Resolvers pass their root queryset through :func:`optimize`, which walks the
+fields requested below the current GraphQL field and joins exactly the
+relations the query asks for: forward foreign keys and one-to-one relations
+are joined with ``select_related``, reverse and many-to-many sets are fetched
+with a nested ``Prefetch`` whose queryset is optimized the same way.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+
+def _selected_fields(selection_set, fragments):
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            yield selection
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = fragments.get(selection.name.value)
+            if fragment is not None:
+                yield from _selected_fields(fragment.selection_set, fragments)
+        elif isinstance(selection, InlineFragmentNode):
+            yield from _selected_fields(selection.selection_set, fragments)
+
+
+def _relations(model, selection_sets, fragments, prefix=""):
+    """Return the ``select_related`` paths and prefetches for ``model``."""
+    select, prefetch = [], []
+    nested = {}
+    for selection_set in selection_sets:
+        for node in _selected_fields(selection_set, fragments):
+            if node.selection_set is None:
+                continue
+            name = to_snake_case(node.name.value)
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.is_relation:
+                nested.setdefault(name, (field, []))[1].append(node.selection_set)
+
+    for name, (field, sets) in nested.items():
+        path = prefix + name
+        if field.many_to_one or field.one_to_one:
+            select.append(path)
+            sub_select, sub_prefetch = _relations(
+                field.related_model, sets, fragments, path + "__"
+            )
+            select += sub_select
+            prefetch += sub_prefetch
+        else:
+            queryset = _optimized_queryset(
+                field.related_model._default_manager.order_by("pk"), sets, fragments
+            )
+            prefetch.append(Prefetch(path, queryset=queryset))
+    return select, prefetch
+
+
+def _optimized_queryset(queryset, selection_sets, fragments):
+    select, prefetch = _relations(queryset.model, selection_sets, fragments)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+def optimize(queryset, info, path=()):
+    """
+    Apply the joins needed by the selection set of ``info`` to ``queryset``.
+
+    ``path`` names the fields to descend through before the selection set
+    describes ``queryset`` rows, e.g. ``("edges", "node")`` for a connection.
+    """
+    selection_sets = [
+        node.selection_set for node in info.field_nodes if node.selection_set
+    ]
+    for name in path:
+        selection_sets = [
+            node.selection_set
+            for selection_set in selection_sets
+            for node in _selected_fields(selection_set, info.fragments)
+            if node.name.value == name and node.selection_set
+        ]
+    return _optimized_queryset(queryset, selection_sets, info.fragments)
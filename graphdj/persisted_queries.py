@@ -0,0 +1,75 @@
+"""
+Automatic persisted queries (APQ).
+
+Clients send ``extensions.persistedQuery = {"version": 1, "sha256Hash": ...}``
+and omit the query text. On a miss the server answers with
+``PERSISTED_QUERY_NOT_FOUND`` and the client retries once with the full
+query, which is stored under its hash. The hash -> query map lives in the
+Django cache named by ``GRAPHQL_APQ_CACHE``, whose ``MAX_ENTRIES`` bounds it.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+
+SUPPORTED_VERSION = 1
+CACHE_KEY_PREFIX = 'apq:'
+
+
+class PersistedQueryError(Exception):
+    def __init__(self, message, code, status=200):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.status = status
+
+    @property
+    def formatted(self):
+        return {'message': self.message, 'extensions': {'code': self.code}}
+
+
+def get_store():
+    return caches[getattr(settings, 'GRAPHQL_APQ_CACHE', 'default')]
+
+
+def get_extension(request, data):
+    """Return the ``persistedQuery`` extension of a GET or POST request, if any."""
+    extensions = request.GET.get('extensions') or data.get('extensions')
+    if not extensions:
+        return None
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            raise PersistedQueryError('Extensions are invalid JSON.', 'BAD_REQUEST', 400)
+    if not isinstance(extensions, dict):
+        return None
+    return extensions.get('persistedQuery')
+
+
+def resolve_query(query, extension):
+    """
+    Return the query text for a persisted-query request, registering
+    ``query`` under its hash when the client sends both.
+    """
+    if not isinstance(extension, dict) or extension.get('version') != SUPPORTED_VERSION:
+        raise PersistedQueryError(
+            'Unsupported persisted query version.', 'PERSISTED_QUERY_NOT_SUPPORTED', 400
+        )
+    query_hash = extension.get('sha256Hash')
+    if not isinstance(query_hash, str):
+        raise PersistedQueryError('Missing sha256Hash.', 'BAD_REQUEST', 400)
+
+    store = get_store()
+    key = CACHE_KEY_PREFIX + query_hash
+    if query:
+        if hashlib.sha256(query.encode()).hexdigest() != query_hash:
+            raise PersistedQueryError('Provided sha does not match query.', 'BAD_REQUEST', 400)
+        store.set(key, query, getattr(settings, 'GRAPHQL_APQ_TIMEOUT', None))
+        return query
+
+    query = store.get(key)
+    if query is None:
+        raise PersistedQueryError('PersistedQueryNotFound', 'PERSISTED_QUERY_NOT_FOUND')
+    return query
@@ -0,0 +1,138 @@
+"""
+On-demand profiling of single operations.
+
+A request carrying the ``GRAPHQL_PROFILING['HEADER']`` header has its
+operation executed under ``cProfile`` when it is authorized: the header
+value equals ``TOKEN``, or the authenticated user is staff. The stats are
+saved with ``dump_stats`` as ``<time>-<operation>-<id>.prof`` in
+``DIRECTORY`` (read them with ``python -m pstats`` or snakeviz), of which
+the newest ``KEEP`` are kept, and the file name is returned under
+``extensions.profile``. At most ``PER_MINUTE`` operations are profiled per
+minute, counted in the ``CACHE`` cache (shared by the workers when it is),
+and one at a time per process; requests over the limit run unprofiled.
+Unauthorized requests are served as if the header were absent; authorized
+ones skip the response cache so there is something to profile.
+"""
+import cProfile
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+
+DEFAULTS = {
+    'ENABLED': False,
+    'HEADER': 'X-GraphQL-Profile',
+    'TOKEN': None,
+    'DIRECTORY': None,
+    'KEEP': 100,
+    'PER_MINUTE': 6,
+    'CACHE': 'default',
+}
+
+_busy = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_PROFILING', {})}
+
+
+def get_directory(config):
+    return config['DIRECTORY'] or os.path.join(tempfile.gettempdir(), 'graphql-profiles')
+
+
+def requested(request):
+    config = get_config()
+    return bool(config['ENABLED'] and request.headers.get(config['HEADER']))
+
+
+def authorized(request, config):
+    value = request.headers.get(config['HEADER'], '')
+    if config['TOKEN'] and constant_time_compare(value, config['TOKEN']):
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_active and user.is_staff)
+
+
+def allowed(request):
+    """Whether ``request`` asked for a profile and may have one."""
+    config = get_config()
+    return requested(request) and authorized(request, config)
+
+
+def acquire(config):
+    """Take one of this minute's ``PER_MINUTE`` profiles, if any is left."""
+    cache = caches[config['CACHE']]
+    key = f'graphql-profiling:{int(time.time() // 60)}'
+    cache.add(key, 0, 120)
+    try:
+        return cache.incr(key) <= config['PER_MINUTE']
+    except ValueError:
+        # Evicted in between; start the count again
+        cache.add(key, 1, 120)
+        return True
+
+
+def operation_name(operation):
+    if operation.ast is not None and operation.ast.name is not None:
+        return operation.ast.name.value
+    return 'anonymous'
+
+
+def save(profiler, directory, name, keep):
+    os.makedirs(directory, exist_ok=True)
+    file_name = f'{time.strftime("%Y%m%dT%H%M%S")}-{name}-{uuid.uuid4().hex[:8]}.prof'
+    profiler.dump_stats(os.path.join(directory, file_name))
+    files = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith('.prof')),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in files[:max(len(files) - keep, 0)]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+    return file_name
+
+
+@contextmanager
+def profile(request, operation):
+    """
+    Profile the execution inside if ``request`` asked for it, is authorized
+    and within the rate limit; the outcome goes to ``operation.extensions``.
+    Must be entered on the thread the operation executes on.
+    """
+    if not allowed(request):
+        yield
+        return
+    config = get_config()
+    if not _busy.acquire(blocking=False):
+        operation.extensions['profile'] = {'skipped': 'Another operation is being profiled'}
+        yield
+        return
+    try:
+        if not acquire(config):
+            operation.extensions['profile'] = {'skipped': 'Profiling rate limit reached'}
+            yield
+            return
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - start
+            operation.extensions['profile'] = {
+                'file': save(
+                    profiler, get_directory(config), operation_name(operation), config['KEEP']
+                ),
+                'time': round(duration * 1000, 3),
+            }
+    finally:
+        _busy.release()
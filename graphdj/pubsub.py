@@ -0,0 +1,126 @@
+"""
+Publish/subscribe broker feeding GraphQL subscriptions.
+
+Mutations ``publish`` small JSON-serializable messages to named channels;
+subscription resolvers ``subscribe`` to a channel and get an async iterator of
+the messages published after they subscribed. The backend is chosen with
+``GRAPHQL_PUBSUB['BACKEND']``. ``InMemoryBackend`` only reaches subscribers
+in the same process; a multi-process deployment points the setting at a
+backend built on a shared bus (Redis PUBLISH/SUBSCRIBE, Postgres
+LISTEN/NOTIFY) that implements the same two methods.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+DEFAULTS = {
+    'BACKEND': 'graphdj.pubsub.InMemoryBackend',
+    'OPTIONS': {},
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_PUBSUB', {})}
+
+
+class PubSubBackend:
+    """Interface every broker backend implements."""
+
+    def publish(self, channel, message):
+        """Deliver ``message`` to the current subscribers of ``channel``."""
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        """Return an async iterator of the messages published to ``channel``."""
+        raise NotImplementedError
+
+
+class InMemoryBackend(PubSubBackend):
+    """
+    Fan-out to subscribers of this process. ``publish`` may be called from any
+    thread; each subscriber has a bounded queue on its own event loop and
+    drops its oldest message when it falls ``max_queue`` messages behind.
+    """
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscriber in subscribers:
+            subscriber.put(message)
+
+    def subscribe(self, channel):
+        # Registered right away, so nothing published after this call is missed
+        subscriber = InMemorySubscription(self, channel)
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        return subscriber
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscribers.get(channel, ()))
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.channel)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.channel]
+
+
+class InMemorySubscription:
+    def __init__(self, backend, channel):
+        self.backend = backend
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(backend.max_queue)
+
+    def put(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The subscriber's loop is closed
+            self.backend.unsubscribe(self)
+
+    def _put(self, message):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
+
+    async def aclose(self):
+        self.backend.unsubscribe(self)
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    config = get_config()
+    return import_string(config['BACKEND'])(**config['OPTIONS'])
+
+
+def publish(channel, message):
+    get_backend().publish(channel, message)
+
+
+def publish_on_commit(channel, message):
+    """Publish once the current transaction commits, so readers see the row."""
+    transaction.on_commit(lambda: publish(channel, message))
+
+
+def subscribe(channel):
+    return get_backend().subscribe(channel)
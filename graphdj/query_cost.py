@@ -0,0 +1,147 @@
+"""
+Static cost and depth analysis of GraphQL operations.
+
+Runs on the validated document before execution. Every object field costs its
+weight (``FIELD_WEIGHTS["Type.field"]``, default 1; scalars cost 0) plus its
+selection, and list fields multiply their selection by the page size the
+client asked for through ``first``/``last``, read from the coerced arguments
+so variable defaults count. Resolvers treat a missing or zero page size as no
+limit, so those count as ``DEFAULT_LIST_SIZE``. A ``first`` on a connection
+applies to its ``edges`` list.
+Introspection fields are free.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from graphql import (
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    InlineFragmentNode,
+    get_named_type,
+    get_nullable_type,
+    is_leaf_type,
+    is_list_type,
+)
+from graphql.execution.values import get_argument_values, get_variable_values
+
+DEFAULTS = {
+    'MAX_DEPTH': 10,
+    'MAX_COST': 50000,
+    'DEFAULT_LIST_SIZE': 50,
+    'FIELD_WEIGHTS': {},
+}
+
+QueryCost = namedtuple('QueryCost', ['cost', 'depth'])
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_QUERY_COST', {})}
+
+
+class QueryCostAnalyzer:
+    def __init__(self, schema, document, variables=None, config=None):
+        self.schema = schema
+        self.variables = variables or {}
+        self.config = config or get_config()
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if isinstance(definition, FragmentDefinitionNode)
+        }
+
+    def _page_size(self, field, node):
+        if not any(name in field.args for name in ('first', 'last')):
+            return None
+        try:
+            args = get_argument_values(field, node, self.variables)
+        except GraphQLError:
+            # Execution reports the invalid argument
+            return None
+        for name in ('first', 'last'):
+            value = args.get(name)
+            if isinstance(value, int) and value > 0:
+                return value
+        return None
+
+    def _fields(self, selection_set, parent_type):
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                yield selection, parent_type
+            elif isinstance(selection, (FragmentSpreadNode, InlineFragmentNode)):
+                if isinstance(selection, FragmentSpreadNode):
+                    fragment = self.fragments.get(selection.name.value)
+                    if fragment is None:
+                        continue
+                else:
+                    fragment = selection
+                fragment_type = parent_type
+                if fragment.type_condition is not None:
+                    fragment_type = self.schema.get_type(fragment.type_condition.name.value)
+                yield from self._fields(fragment.selection_set, fragment_type)
+
+    def measure(self, selection_set, parent_type, depth=1, page_size=None):
+        """Return ``QueryCost`` of ``selection_set`` nested at ``depth``."""
+        cost, max_depth = 0, depth - 1
+        for node, owner in self._fields(selection_set, parent_type):
+            name = node.name.value
+            if name.startswith('__'):
+                continue
+            field = getattr(owner, 'fields', {}).get(name)
+            if field is None:
+                continue
+            max_depth = max(max_depth, depth)
+            field_type = get_nullable_type(field.type)
+            if is_leaf_type(get_named_type(field_type)):
+                continue
+
+            size = self._page_size(field, node)
+            if is_list_type(field_type):
+                multiplier = size if size is not None else page_size
+                if multiplier is None:
+                    multiplier = self.config['DEFAULT_LIST_SIZE']
+                inherited = None
+            else:
+                multiplier, inherited = 1, size
+
+            child = QueryCost(0, depth)
+            if node.selection_set is not None:
+                child = self.measure(
+                    node.selection_set, get_named_type(field_type), depth + 1, inherited
+                )
+            weight = self.config['FIELD_WEIGHTS'].get(f'{owner.name}.{name}', 1)
+            cost += weight + multiplier * child.cost
+            max_depth = max(max_depth, child.depth)
+        return QueryCost(cost, max_depth)
+
+    def analyze(self, operation):
+        root_type = self.schema.get_root_type(operation.operation)
+        if root_type is None:
+            return QueryCost(0, 0)
+        return self.measure(operation.selection_set, root_type)
+
+
+def check_query_cost(schema, document, operation, variables=None):
+    """
+    Measure ``operation`` and return ``(QueryCost, errors)``; ``errors`` is
+    non-empty when the operation is over the configured depth or cost.
+    """
+    config = get_config()
+    coerced = get_variable_values(schema, operation.variable_definitions or [], variables or {})
+    if isinstance(coerced, list):
+        # Invalid variables fail execution; measure with what was sent
+        coerced = variables
+    result = QueryCostAnalyzer(schema, document, coerced, config).analyze(operation)
+    errors = []
+    if config['MAX_DEPTH'] is not None and result.depth > config['MAX_DEPTH']:
+        errors.append(GraphQLError(
+            f"Query depth {result.depth} exceeds the maximum of {config['MAX_DEPTH']}",
+            extensions={'code': 'QUERY_TOO_DEEP'},
+        ))
+    if config['MAX_COST'] is not None and result.cost > config['MAX_COST']:
+        errors.append(GraphQLError(
+            f"Query cost {result.cost} exceeds the maximum of {config['MAX_COST']}",
+            extensions={'code': 'QUERY_TOO_COMPLEX'},
+        ))
+    return result, errors
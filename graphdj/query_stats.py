@@ -0,0 +1,125 @@
+"""
+Per-operation SQL statistics.
+
+When ``GRAPHQL_QUERY_STATS['ENABLED']`` is set and a request carries the
+``HEADER`` header, ``GraphQLView`` collects every SQL statement run while
+preparing and executing each operation and returns the count, the total
+database time and the ``SLOWEST`` statements under ``extensions.sql``.
+Collection follows the operation through ``contextvars``, so statements run
+on the root field pool of ``graphdj.execution`` are counted too.
+Connections are instrumented as they open, and ``install`` instruments those
+opened earlier in the thread; statements run while nothing is collected cost
+one context variable lookup. ``graphdj.metrics`` has statements counted for
+every operation while only those asking for them get the extension.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+DEFAULTS = {
+    'ENABLED': False,
+    'HEADER': 'X-GraphQL-Debug',
+    'SLOWEST': 5,
+}
+
+_current = ContextVar('query_stats', default=None)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_QUERY_STATS', {})}
+
+
+class QueryStats:
+    """SQL statements of one operation, recorded from any thread."""
+
+    def __init__(self, slowest=5, reported=True):
+        self.slowest_count = slowest
+        self.reported = reported
+        self.count = 0
+        self.time = 0.0
+        self.slowest = []
+        self._lock = threading.Lock()
+
+    def record(self, sql, duration):
+        with self._lock:
+            self.count += 1
+            self.time += duration
+            self.slowest.append((duration, sql))
+            self.slowest.sort(key=lambda statement: statement[0], reverse=True)
+            del self.slowest[self.slowest_count:]
+
+    def as_extension(self):
+        return {
+            'count': self.count,
+            'time': round(self.time * 1000, 3),
+            'slowest': [
+                {'sql': sql, 'time': round(duration * 1000, 3)}
+                for duration, sql in self.slowest
+            ],
+        }
+
+
+def _record(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.record(sql, time.perf_counter() - start)
+
+
+def _instrument(connection):
+    if _record not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record)
+
+
+def install():
+    """Instrument this thread's connections if an operation is being collected."""
+    if _current.get() is not None:
+        for connection in connections.all():
+            _instrument(connection)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    _instrument(connection)
+
+
+connection_created.connect(_on_connection_created)
+
+
+def requested(request):
+    config = get_config()
+    return bool(config['ENABLED'] and request.headers.get(config['HEADER']))
+
+
+@contextmanager
+def collect(request, force=False):
+    """
+    Collect the statements run inside, if ``request`` asked for them or
+    ``force`` is set; only the former are reported by ``attach``.
+    """
+    reported = requested(request)
+    if not (reported or force):
+        yield None
+        return
+    stats = QueryStats(get_config()['SLOWEST'], reported)
+    token = _current.set(stats)
+    try:
+        install()
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def attach(stats, result):
+    """Add ``stats`` to the extensions of ``result``."""
+    if stats is not None and stats.reported and result is not None:
+        result.extensions = {**(result.extensions or {}), 'sql': stats.as_extension()}
+    return result
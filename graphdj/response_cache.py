@@ -0,0 +1,205 @@
+"""
+Shared cache of anonymous read-only GraphQL responses.
+
+Only query operations whose root fields are all listed in ``ROOT_FIELD_TAGS``
+are cached, and only for anonymous requests. Entries are keyed by the
+normalized document, operation name and variables, and carry tags derived
+statically from the root fields and the object types they select:
+
+* ``books:list`` / ``reviews:list`` for list fields and for nested types,
+  and ``reviews:list`` for fields denormalized from reviews (``FIELD_TAGS``),
+* ``users:list`` / ``profiles:list`` for nested users and profiles,
+* ``book:<id>`` for ``book(id)``,
+* ``book:<id>:reviews`` for ``bookReviews(bookId)``.
+
+Operations selecting a model type missing from ``TYPE_TAGS`` are not
+cached, since no write would expire them. Model signals in ``books.signals``,
+``reviews.signals``, ``users.signals`` and ``profiles.signals`` invalidate the
+tags a write affects. Each tag has a version stored in the same cache;
+:func:`invalidate` bumps it,
+which turns every entry recorded under the previous version into a miss. The
+backend is the Django cache named by ``GRAPHQL_RESPONSE_CACHE['CACHE']``, so
+a shared backend (Redis, Memcached) shares entries across worker processes.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from graphql import (
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    InlineFragmentNode,
+    OperationType,
+    get_named_type,
+    print_ast,
+)
+from graphql.execution.values import get_argument_values
+
+ROOT_FIELD_TAGS = {
+    'books': lambda args: ['books:list'],
+    'booksConnection': lambda args: ['books:list'],
+    'book': lambda args: [book_tag(args['id'])],
+    'bookReviews': lambda args: [book_reviews_tag(args['book_id'])],
+    'reviews': lambda args: ['reviews:list'],
+}
+TYPE_TAGS = {
+    'BookType': 'books:list',
+    'ReviewType': 'reviews:list',
+    'UserType': 'users:list',
+    'ProfileType': 'profiles:list',
+}
+# Fields denormalized from another type's rows
+FIELD_TAGS = {
+    'BookType.reviewCount': 'reviews:list',
+}
+
+DEFAULTS = {
+    'CACHE': 'default',
+    'TIMEOUT': 300,
+}
+
+KEY_PREFIX = 'graphql-response:'
+TAG_PREFIX = 'graphql-tag:'
+
+
+def book_tag(book_id):
+    return f'book:{book_id}'
+
+
+def book_reviews_tag(book_id):
+    return f'book:{book_id}:reviews'
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_RESPONSE_CACHE', {})}
+
+
+def get_cache():
+    return caches[get_config()['CACHE']]
+
+
+def is_anonymous(request):
+    if 'HTTP_AUTHORIZATION' in request.META:
+        return False
+    user = getattr(request, 'user', None)
+    return user is None or not user.is_authenticated
+
+
+def _fields(selection_set, fragments):
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            yield selection
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = fragments.get(selection.name.value)
+            if fragment is not None:
+                yield from _fields(fragment.selection_set, fragments)
+        elif isinstance(selection, InlineFragmentNode):
+            yield from _fields(selection.selection_set, fragments)
+
+
+def _model(graphql_type):
+    graphene_type = getattr(graphql_type, 'graphene_type', None)
+    return getattr(getattr(graphene_type, '_meta', None), 'model', None)
+
+
+def _selected(selection_set, parent_type, fragments, types, fields):
+    """Collect the model types and ``Type.field`` names selected below."""
+    for node in _fields(selection_set, fragments):
+        field = getattr(parent_type, 'fields', {}).get(node.name.value)
+        if field is None:
+            continue
+        fields.add(f'{parent_type.name}.{node.name.value}')
+        if node.selection_set is None:
+            continue
+        named_type = get_named_type(field.type)
+        if _model(named_type) is not None:
+            types.add(named_type.name)
+        _selected(node.selection_set, named_type, fragments, types, fields)
+
+
+def get_tags(schema, document, operation, variables):
+    """
+    Return the tags for ``operation``, or ``None`` when it must not be
+    cached.
+    """
+    if operation.operation != OperationType.QUERY:
+        return None
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+    query_type = schema.query_type
+    tags = set()
+    for node in _fields(operation.selection_set, fragments):
+        name = node.name.value
+        if name == '__typename':
+            continue
+        if name not in ROOT_FIELD_TAGS:
+            return None
+        field = query_type.fields[name]
+        tags.update(ROOT_FIELD_TAGS[name](get_argument_values(field, node, variables or {})))
+        if node.selection_set is not None:
+            root_type = get_named_type(field.type)
+            types, fields = set(), set()
+            # Types are collected below the root field only, so the root's own
+            # type is tagged when it is selected again further down
+            _selected(node.selection_set, root_type, fragments, types, fields)
+            if not types <= TYPE_TAGS.keys():
+                return None
+            tags.update(TYPE_TAGS[t] for t in types)
+            tags.update(FIELD_TAGS[f] for f in fields if f in FIELD_TAGS)
+    return sorted(tags)
+
+
+def make_key(document, operation_name, variables, scope='anonymous'):
+    payload = json.dumps(
+        [print_ast(document), operation_name, variables or {}, scope],
+        sort_keys=True, separators=(',', ':'), default=str,
+    )
+    return KEY_PREFIX + hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _tag_versions(cache, tags):
+    keys = {TAG_PREFIX + tag: tag for tag in tags}
+    versions = cache.get_many(list(keys))
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def lookup(key, tags):
+    """
+    Return ``(data, versions)``: the cached response data for ``key`` (or
+    ``None``) and the current tag versions to :func:`store` a fresh result
+    under. Versions are read before execution so an invalidation that lands
+    while the query runs is not masked.
+    """
+    cache = get_cache()
+    versions = _tag_versions(cache, tags)
+    entry = cache.get(key)
+    if entry is None or entry['tags'] != versions:
+        return None, versions
+    return entry['data'], versions
+
+
+def store(key, versions, data):
+    get_cache().set(key, {'tags': versions, 'data': data}, get_config()['TIMEOUT'])
+
+
+def invalidate(tags):
+    """Expire every cached response carrying any of ``tags``."""
+    version = time.time_ns()
+    get_cache().set_many({TAG_PREFIX + tag: version for tag in tags}, None)
+
+
+def invalidate_on_commit(tags):
+    """Invalidate ``tags`` once the current transaction commits."""
+    tags = list(tags)
+    transaction.on_commit(lambda: invalidate(tags))
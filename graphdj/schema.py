@@ -13,4 +13,7 @@ class Mutation(users.schema.Mutation,profiles.schema.Mutation,books.schema.Mutat
     verify_token = graphql_jwt.Verify.Field()
     refresh_token = graphql_jwt.Refresh.Field()
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
\ No newline at end of file
+class Subscription(reviews.schema.Subscription, graphene.ObjectType):
+    pass
+
+schema = graphene.Schema(query=Query, mutation=Mutation, subscription=Subscription)
\ No newline at end of file
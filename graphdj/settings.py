@@ -60,11 +60,22 @@ ROOT_URLCONF = 'graphdj.urls'
 GRAPHENE = {
     'SCHEMA': 'graphdj.schema.schema',
     'MIDDLEWARE': [
-        'graphql_jwt.middleware.JSONWebTokenMiddleware',
+        'users.middleware.JSONWebTokenMiddleware',
     ],
 }
+# Full-text index used by the books search argument; use
+# 'books.search.ContainsBackend' on databases without FTS5.
+BOOK_SEARCH_BACKEND = 'books.search.SQLiteFTSBackend'
+
+# Verified JWTs and their user snapshots are cached per process for at most
+# TIMEOUT seconds (never past the token's exp); see users.backends.
+JWT_TOKEN_CACHE = {
+    'TIMEOUT': 60,
+    'MAX_ENTRIES': 10000,
+}
+
 AUTHENTICATION_BACKENDS = [
-    'graphql_jwt.backends.JSONWebTokenBackend',
+    'users.backends.CachedJSONWebTokenBackend',
     'django.contrib.auth.backends.ModelBackend',
 ]
 TEMPLATES = [
@@ -97,6 +108,142 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'persisted-queries': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'persisted-queries',
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+    # Point this at Redis/Memcached in production so workers share responses.
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
+# Automatic persisted queries: hash -> query store, entry lifetime
+# (None = until evicted) and Cache-Control max-age for anonymous GETs.
+GRAPHQL_APQ_CACHE = 'persisted-queries'
+GRAPHQL_APQ_TIMEOUT = None
+GRAPHQL_APQ_GET_MAX_AGE = 60
+
+# Anonymous read responses (see graphdj.response_cache); TIMEOUT in seconds.
+GRAPHQL_RESPONSE_CACHE = {
+    'CACHE': 'responses',
+    'TIMEOUT': 300,
+}
+
+# Number of parsed and validated GraphQL documents kept in memory per process.
+GRAPHQL_DOCUMENT_CACHE_SIZE = 256
+
+# Serve /graphql/ with the async view (set by graphdj.asgi). Root fields of a
+# query then resolve concurrently on a pool of GRAPHQL_ASYNC_MAX_WORKERS threads.
+GRAPHQL_ASYNC = os.environ.get('GRAPHQL_ASYNC') == '1'
+GRAPHQL_ASYNC_MAX_WORKERS = 8
+
+# createBooks/createReviews: at most MAX_ITEMS inputs per call, inserted
+# BATCH_SIZE rows per statement (see graphdj.bulk).
+GRAPHQL_BULK = {
+    'MAX_ITEMS': 500,
+    'BATCH_SIZE': 100,
+}
+
+# topBooks/topAuthors: the first SIZE ranks are served from a materialized
+# board holding SIZE + BUFFER rows, kept current by the mutations
+# (see books.leaderboards).
+LEADERBOARDS = {
+    'SIZE': 100,
+    'BUFFER': 100,
+}
+
+# Requests sending the HEADER header get the SQL count, total time and SLOWEST
+# statements of each operation under extensions.sql (see graphdj.query_stats).
+# Exposes SQL, so keep it off where untrusted clients can reach /graphql/.
+GRAPHQL_QUERY_STATS = {
+    'ENABLED': DEBUG,
+    'HEADER': 'X-GraphQL-Debug',
+    'SLOWEST': 5,
+}
+
+# Prometheus metrics of /graphql/ served on /metrics (see graphdj.metrics).
+# Each worker process writes its samples to DIRECTORY, and /metrics sums them,
+# so give all workers of a deployment the same directory and empty it on
+# deploy; without one only the process answering the scrape is reported.
+# Scrapers must send "Authorization: Bearer <TOKEN>" when TOKEN is set.
+GRAPHQL_METRICS = {
+    'ENABLED': True,
+    'DIRECTORY': os.environ.get('GRAPHQL_METRICS_DIR'),
+    'TOKEN': os.environ.get('GRAPHQL_METRICS_TOKEN'),
+    'MAX_OPERATIONS': 100,
+    # Times root fields and custom resolvers per operation; costs a few
+    # microseconds per timed field, so leave it off unless investigating
+    'RESOLVER_TIMING': os.environ.get('GRAPHQL_METRICS_RESOLVER_TIMING') == '1',
+    'RESOLVER_SLOWEST': 5,
+}
+
+# Requests sending the HEADER header have their operation run under cProfile
+# if the header equals TOKEN or the user is staff; the .prof files go to
+# DIRECTORY (a temporary directory by default). At most PER_MINUTE profiles
+# are taken, counted in the CACHE cache (see graphdj.profiling).
+GRAPHQL_PROFILING = {
+    'ENABLED': True,
+    'HEADER': 'X-GraphQL-Profile',
+    'TOKEN': os.environ.get('GRAPHQL_PROFILING_TOKEN'),
+    'DIRECTORY': os.environ.get('GRAPHQL_PROFILE_DIR'),
+    'KEEP': 100,
+    'PER_MINUTE': 6,
+    'CACHE': 'default',
+}
+
+# Multipart uploads on /graphql/ are streamed to temporary files and rejected
+# as soon as a limit is crossed or the first HEADER_BYTES are not an image of
+# FORMATS within MAX_DIMENSION pixels a side (see graphdj.uploads).
+GRAPHQL_UPLOADS = {
+    'MAX_FILE_SIZE': 5 * 2**20,
+    'MAX_REQUEST_SIZE': 10 * 2**20,
+    'MAX_DIMENSION': 4096,
+    'FORMATS': ['JPEG', 'PNG', 'GIF', 'WEBP'],
+    'HEADER_BYTES': 64 * 2**10,
+}
+
+# Variants rendered for every profile image: longest side in pixels times
+# Pillow format, on MAX_WORKERS background threads (see profiles.thumbnails).
+PROFILE_THUMBNAILS = {
+    'SIZES': [64, 128, 512],
+    'FORMATS': ['webp', 'jpeg'],
+    'QUALITY': 80,
+    'MAX_WORKERS': 2,
+}
+
+# Broker feeding GraphQL subscriptions (see graphdj.pubsub). The in-memory
+# backend only reaches WebSocket clients connected to the same process.
+GRAPHQL_PUBSUB = {
+    'BACKEND': 'graphdj.pubsub.InMemoryBackend',
+    'OPTIONS': {'max_queue': 100},
+}
+
+# Static query budget checked before execution (see graphdj.query_cost).
+# List fields without first/last are assumed to return DEFAULT_LIST_SIZE items;
+# FIELD_WEIGHTS maps "Type.field" to the cost of resolving it once.
+GRAPHQL_QUERY_COST = {
+    'MAX_DEPTH': 10,
+    'MAX_COST': 50000,
+    'DEFAULT_LIST_SIZE': 50,
+    'FIELD_WEIGHTS': {
+        'Query.books': 2,
+        'Mutation.createProfile': 10,
+        'Mutation.updateProfile': 10,
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
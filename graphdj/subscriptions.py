@@ -0,0 +1,249 @@
+"""
+GraphQL subscriptions over WebSocket, speaking ``graphql-transport-ws``.
+
+``graphdj.asgi`` hands WebSocket connections to ``/graphql/`` to
+``websocket_application``. The client opens with ``connection_init``, whose
+payload may carry ``{"Authorization": "JWT <token>"}``, then sends one
+``subscribe`` message per subscription and ``complete`` to stop one. Source
+streams come from ``graphdj.pubsub``; each event is executed on the pool of
+``graphdj.execution`` so resolvers keep using the synchronous ORM.
+Queries and mutations stay on the HTTP endpoint.
+"""
+import asyncio
+import json
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import AnonymousUser
+from graphene_django.settings import graphene_settings
+from graphql import (
+    ExecutionResult,
+    GraphQLError,
+    OperationType,
+    create_source_event_stream,
+    execute,
+    get_operation_ast,
+)
+from graphql_jwt.exceptions import JSONWebTokenError
+
+from .document_cache import document_cache
+from .execution import pooled
+from .query_cost import check_query_cost
+
+PROTOCOL = 'graphql-transport-ws'
+PATH = '/graphql/'
+CONNECTION_INIT_TIMEOUT = 10
+
+# Close codes defined by the protocol
+INVALID_MESSAGE = 4400
+UNAUTHORIZED = 4401
+FORBIDDEN = 4403
+CONNECTION_INIT_TIMEOUT_EXPIRED = 4408
+SUBSCRIBER_ALREADY_EXISTS = 4409
+TOO_MANY_INITIALISATION_REQUESTS = 4429
+
+
+class SubscriptionContext:
+    """``info.context`` of subscription resolvers, in place of a request."""
+
+    def __init__(self, scope, user, authorization=None):
+        self.scope = scope
+        self.user = user
+        self.META = {'HTTP_AUTHORIZATION': authorization} if authorization else {}
+        self.COOKIES = {}
+        self.jwt_operation_authenticated = True
+
+
+def format_result(result):
+    payload = {'data': result.data}
+    if result.errors:
+        payload['errors'] = [error.formatted for error in result.errors]
+    return payload
+
+
+class GraphQLWebSocket:
+    """One client connection and the subscriptions running on it."""
+
+    def __init__(self, scope, receive, send, schema):
+        self.scope = scope
+        self.receive = receive
+        self._send = send
+        self.schema = schema
+        self.user = AnonymousUser()
+        self.authorization = None
+        self.acknowledged = False
+        self.operations = {}
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message):
+        async with self._send_lock:
+            await self._send(message)
+
+    async def send_json(self, data):
+        await self.send({'type': 'websocket.send', 'text': json.dumps(data)})
+
+    async def close(self, code, reason=''):
+        await self.send({'type': 'websocket.close', 'code': code, 'reason': reason})
+
+    async def run(self):
+        message = await self.receive()
+        if message['type'] != 'websocket.connect':
+            return
+        if PROTOCOL not in self.scope.get('subprotocols', ()):
+            await self.send({'type': 'websocket.close', 'code': 1002})
+            return
+        await self.send({'type': 'websocket.accept', 'subprotocol': PROTOCOL})
+
+        watchdog = asyncio.ensure_future(self.expire_init())
+        try:
+            while True:
+                message = await self.receive()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                if not await self.handle(message.get('text')):
+                    break
+        finally:
+            watchdog.cancel()
+            for task in self.operations.values():
+                task.cancel()
+
+    async def expire_init(self):
+        await asyncio.sleep(CONNECTION_INIT_TIMEOUT)
+        if not self.acknowledged:
+            await self.close(CONNECTION_INIT_TIMEOUT_EXPIRED, 'Connection initialisation timeout')
+
+    async def handle(self, text):
+        """Act on one client message; return ``False`` once the socket is closed."""
+        try:
+            message = json.loads(text or '')
+            message_type = message['type']
+        except (ValueError, TypeError, KeyError):
+            await self.close(INVALID_MESSAGE, 'Invalid message')
+            return False
+
+        if message_type == 'connection_init':
+            if self.acknowledged:
+                await self.close(TOO_MANY_INITIALISATION_REQUESTS, 'Too many initialisation requests')
+                return False
+            if not await self.authenticate(message.get('payload') or {}):
+                await self.close(FORBIDDEN, 'Forbidden')
+                return False
+            self.acknowledged = True
+            await self.send_json({'type': 'connection_ack'})
+        elif message_type == 'ping':
+            await self.send_json({'type': 'pong'})
+        elif message_type == 'pong':
+            pass
+        elif message_type == 'subscribe':
+            if not self.acknowledged:
+                await self.close(UNAUTHORIZED, 'Unauthorized')
+                return False
+            id = message.get('id')
+            if not isinstance(id, str) or not isinstance(message.get('payload'), dict):
+                await self.close(INVALID_MESSAGE, 'Invalid message')
+                return False
+            if id in self.operations:
+                await self.close(SUBSCRIBER_ALREADY_EXISTS, f'Subscriber for {id} already exists')
+                return False
+            self.operations[id] = asyncio.ensure_future(
+                self.subscribe(id, message['payload'])
+            )
+        elif message_type == 'complete':
+            id = message.get('id')
+            if not isinstance(id, str):
+                await self.close(INVALID_MESSAGE, 'Invalid message')
+                return False
+            task = self.operations.pop(id, None)
+            if task is not None:
+                task.cancel()
+        else:
+            await self.close(INVALID_MESSAGE, f'Unexpected message type {message_type}')
+            return False
+        return True
+
+    async def authenticate(self, payload):
+        authorization = payload.get('Authorization') or payload.get('authorization')
+        if not authorization:
+            return True
+        context = SubscriptionContext(self.scope, self.user, authorization)
+        try:
+            user = await pooled(authenticate)(request=context)
+        except JSONWebTokenError:
+            return False
+        if user is None:
+            return False
+        self.user = user
+        self.authorization = authorization
+        return True
+
+    def get_context(self):
+        # A fresh context per event, so loaders never serve stale rows
+        return SubscriptionContext(self.scope, self.user, self.authorization)
+
+    async def subscribe(self, id, payload):
+        try:
+            document, stream = await self.create_stream(payload)
+            if isinstance(stream, ExecutionResult):
+                await self.send_json({
+                    'id': id, 'type': 'error',
+                    'payload': [error.formatted for error in stream.errors],
+                })
+                return
+            try:
+                async for event in stream:
+                    result = await pooled(execute)(
+                        self.schema,
+                        document,
+                        root_value=event,
+                        context_value=self.get_context(),
+                        variable_values=payload.get('variables'),
+                        operation_name=payload.get('operationName'),
+                    )
+                    await self.send_json({'id': id, 'type': 'next', 'payload': format_result(result)})
+            finally:
+                if hasattr(stream, 'aclose'):
+                    await stream.aclose()
+            await self.send_json({'id': id, 'type': 'complete'})
+        finally:
+            self.operations.pop(id, None)
+
+    async def create_stream(self, payload):
+        """
+        Return ``(document, stream)``; ``stream`` is an ``ExecutionResult``
+        holding the errors when the subscription cannot start.
+        """
+        query = payload.get('query')
+        if not isinstance(query, str):
+            return None, ExecutionResult(errors=[GraphQLError('Must provide query string.')])
+        if not isinstance(payload.get('variables') or {}, dict):
+            return None, ExecutionResult(errors=[GraphQLError('Variables must be an object.')])
+        document, errors = document_cache.get(
+            self.schema, query, None, graphene_settings.MAX_VALIDATION_ERRORS
+        )
+        if document is None or errors:
+            return document, ExecutionResult(errors=errors)
+
+        operation = get_operation_ast(document, payload.get('operationName'))
+        if operation is None or operation.operation != OperationType.SUBSCRIPTION:
+            return document, ExecutionResult(errors=[GraphQLError(
+                'Only subscriptions are served over WebSocket; use POST /graphql/.'
+            )])
+        _, errors = check_query_cost(self.schema, document, operation, payload.get('variables'))
+        if errors:
+            return document, ExecutionResult(errors=errors)
+
+        return document, await create_source_event_stream(
+            self.schema,
+            document,
+            context_value=self.get_context(),
+            variable_values=payload.get('variables'),
+            operation_name=payload.get('operationName'),
+        )
+
+
+async def websocket_application(scope, receive, send):
+    """ASGI application for the ``websocket`` scope type."""
+    if scope['path'] != PATH:
+        await receive()
+        await send({'type': 'websocket.close', 'code': 1000})
+        return
+    await GraphQLWebSocket(scope, receive, send, graphene_settings.SCHEMA.graphql_schema).run()
@@ -0,0 +1,155 @@
+"""
+Streaming, size-capped multipart uploads for ``/graphql/``.
+
+``GraphQLView`` installs ``ImageUploadHandler`` as the only upload handler of
+multipart requests, so every file is written chunk by chunk to a temporary
+file instead of being buffered in memory. While streaming, the handler
+enforces ``GRAPHQL_UPLOADS['MAX_FILE_SIZE']`` per file and
+``['MAX_REQUEST_SIZE']`` across the request, and identifies the image from its
+first ``HEADER_BYTES``: files that are not one of ``FORMATS`` or exceed
+``MAX_DIMENSION`` pixels on a side are rejected there. Accepted files carry
+the SHA-256 of their content (``content_hash``), their Pillow
+``image_format`` and their ``image_dimensions``, all worked out while
+streaming. A rejection stops the
+upload without reading the rest of the body and is recorded on the request
+for ``parse`` to raise. Requests whose Content-Length is already over the
+limit are refused before parsing.
+"""
+import hashlib
+import io
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from PIL import Image, UnidentifiedImageError
+
+DEFAULTS = {
+    'MAX_FILE_SIZE': 5 * 2**20,
+    'MAX_REQUEST_SIZE': 10 * 2**20,
+    'MAX_DIMENSION': 4096,
+    'FORMATS': ['JPEG', 'PNG', 'GIF', 'WEBP'],
+    'HEADER_BYTES': 64 * 2**10,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_UPLOADS', {})}
+
+
+class UploadRejected(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def parse(request):
+    """
+    Parse the multipart body of ``request`` through ``ImageUploadHandler``;
+    raise ``UploadRejected`` if it stopped the upload.
+    """
+    if not hasattr(request, '_upload_rejection'):
+        request._upload_rejection = None
+        max_size = get_config()['MAX_REQUEST_SIZE']
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > max_size:
+            request._upload_rejection = UploadRejected(
+                f'Request body is larger than {max_size} bytes', 413
+            )
+        else:
+            request.upload_handlers = [ImageUploadHandler(request)]
+            request.POST  # Parses the body through the handler
+    if request._upload_rejection is not None:
+        raise request._upload_rejection
+
+
+def identify(header):
+    """
+    Return ``(format, size)`` of the image starting with ``header``, or
+    ``None`` when more bytes are needed to tell.
+    """
+    try:
+        with Image.open(io.BytesIO(header)) as image:
+            return image.format, image.size
+    except Image.DecompressionBombError:
+        raise UploadRejected('Image has too many pixels')
+    except UnidentifiedImageError:
+        return None
+    except Exception:
+        # Truncated headers fail in format-specific ways
+        return None
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """Streams image files to disk, checking limits and headers as they arrive."""
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.config = get_config()
+        self.request_size = 0
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = TemporaryUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+        )
+        self.file_size = 0
+        self.header = bytearray()
+        self.identified = None
+        self.hash = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file_size += len(raw_data)
+        self.request_size += len(raw_data)
+        if self.file_size > self.config['MAX_FILE_SIZE']:
+            self.reject(UploadRejected(
+                f'{self.file_name} is larger than {self.config["MAX_FILE_SIZE"]} bytes', 413
+            ))
+        if self.request_size > self.config['MAX_REQUEST_SIZE']:
+            self.reject(UploadRejected(
+                f'Uploads are larger than {self.config["MAX_REQUEST_SIZE"]} bytes', 413
+            ))
+        if not self.identified:
+            self.header += raw_data[:self.config['HEADER_BYTES'] - len(self.header)]
+            self.inspect(complete=len(self.header) >= self.config['HEADER_BYTES'])
+        self.hash.update(raw_data)
+        self.file.write(raw_data)
+
+    def inspect(self, complete=False):
+        try:
+            identified = identify(bytes(self.header))
+        except UploadRejected as e:
+            self.reject(e)
+        if identified is None:
+            if complete:
+                self.reject(UploadRejected(f'{self.file_name} is not a supported image'))
+            return
+        self.identified = identified
+        format, (width, height) = identified
+        if format not in self.config['FORMATS']:
+            self.reject(UploadRejected(f'{self.file_name} is not a supported image'))
+        max_dimension = self.config['MAX_DIMENSION']
+        if width > max_dimension or height > max_dimension:
+            self.reject(UploadRejected(
+                f'{self.file_name} is larger than {max_dimension}x{max_dimension} pixels'
+            ))
+
+    def reject(self, rejection):
+        self.request._upload_rejection = rejection
+        raise StopUpload(connection_reset=True)
+
+    def file_complete(self, file_size):
+        if not self.identified:
+            self.inspect(complete=True)
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.content_hash = self.hash.hexdigest()
+        self.file.image_format, self.file.image_dimensions = self.identified
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
@@ -13,13 +13,17 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
-from graphene_file_upload.django import FileUploadGraphQLView
 from django.views.decorators.csrf import csrf_exempt
 
+from .views import AsyncGraphQLView, GraphQLView, metrics_view
+
+graphql_view = AsyncGraphQLView if settings.GRAPHQL_ASYNC else GraphQLView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('graphql/',csrf_exempt(FileUploadGraphQLView.as_view(graphiql=True)))
+    path('graphql/',csrf_exempt(graphql_view.as_view(graphiql=True))),
+    path('metrics', metrics_view, name='metrics'),
 ]
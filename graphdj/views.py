@@ -0,0 +1,421 @@
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed
+from django.http.response import HttpResponseBadRequest
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import HttpError
+from graphene_file_upload.django import FileUploadGraphQLView
+from graphql import (
+    ExecutionResult,
+    GraphQLError,
+    OperationType,
+    execute,
+    get_operation_ast,
+    validate_schema,
+)
+from graphql.pyutils import is_awaitable
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.middleware import JSONWebTokenMiddleware
+
+from users.middleware import authenticate_operation
+
+from . import metrics, persisted_queries, profiling, query_stats, response_cache, uploads
+from .document_cache import document_cache
+from .execution import ConcurrentExecutionContext
+from .query_cost import check_query_cost
+
+
+class Operation:
+    """What ``GraphQLView.prepare_operation`` learned about one request."""
+
+    def __init__(self, schema, document, ast):
+        self.schema = schema
+        self.document = document
+        self.ast = ast
+        self.extensions = {}
+        self.cache_key = None
+        self.tags = None
+        self.versions = None
+
+    @property
+    def is_mutation(self):
+        return self.ast is not None and self.ast.operation == OperationType.MUTATION
+
+
+class GraphQLView(FileUploadGraphQLView):
+    """
+    The project's ``/graphql/`` view: multipart uploads, streamed to disk
+    and size-capped by ``uploads.ImageUploadHandler``, plus automatic
+    persisted queries, which may also be sent over GET so CDNs can cache
+    anonymous reads. Parsed and validated documents come from
+    ``document_cache`` instead of being rebuilt on every request, and
+    operations over the depth/cost budget are rejected before execution.
+    Anonymous reads are served from ``response_cache`` when possible. JWT
+    authentication runs once per operation (``authenticate_operation``) and
+    the per-field JWT middleware is then left out of the chain.
+    Whatever ends up in ``ExecutionResult.extensions`` is returned to the
+    client under ``extensions``, including per-operation SQL statistics
+    when they are enabled and asked for (``query_stats``). Every operation
+    is counted and timed for ``/metrics`` (``metrics``), and authorized
+    requests may have theirs profiled (``profiling``).
+    """
+    document_cache = document_cache
+    resolver_timing_middleware = metrics.ResolverTimingMiddleware()
+
+    def dispatch(self, request, *args, **kwargs):
+        request.persisted_query = False
+        response = super().dispatch(request, *args, **kwargs)
+        return self.patch_response(request, response)
+
+    def patch_response(self, request, response):
+        if (
+            request.method == 'GET'
+            and request.persisted_query
+            and response.status_code == 200
+            and 'HTTP_AUTHORIZATION' not in request.META
+        ):
+            max_age = getattr(settings, 'GRAPHQL_APQ_GET_MAX_AGE', 0)
+            if max_age:
+                patch_cache_control(response, public=True, max_age=max_age)
+            patch_vary_headers(response, ['Authorization'])
+        return response
+
+    def parse_body(self, request):
+        if self.get_content_type(request) == 'multipart/form-data':
+            try:
+                uploads.parse(request)
+            except uploads.UploadRejected as e:
+                raise HttpError(HttpResponse(status=e.status), e.message)
+        return super().parse_body(request)
+
+    def get_middleware(self, request):
+        middleware = self.middleware
+        if getattr(request, 'jwt_operation_authenticated', False) and isinstance(
+            middleware, list
+        ):
+            middleware = [
+                m for m in middleware if not isinstance(m, JSONWebTokenMiddleware)
+            ]
+        if metrics.timing_resolvers():
+            # First, so it times the resolver alone
+            middleware = [self.resolver_timing_middleware, *(middleware or [])]
+        return middleware
+
+    def resolve_persisted_query(self, request, data):
+        """Return ``data`` with the query of a persisted query filled in."""
+        extension = persisted_queries.get_extension(request, data)
+        if extension is None:
+            return data
+        query = request.GET.get('query') or data.get('query')
+        data = dict(data.items())
+        data['query'] = persisted_queries.resolve_query(query, extension)
+        request.persisted_query = True
+        return data
+
+    def get_response(self, request, data, show_graphiql=False):
+        try:
+            data = self.resolve_persisted_query(request, data)
+        except persisted_queries.PersistedQueryError as e:
+            return self.json_encode(request, {'errors': [e.formatted]}), e.status
+
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        return self.build_response(request, execution_result, id, show_graphiql)
+
+    def build_response(self, request, execution_result, id=None, show_graphiql=False):
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if execution_result:
+            response = {}
+
+            if execution_result.errors:
+                set_rollback()
+                response["errors"] = [
+                    self.format_error(e) for e in execution_result.errors
+                ]
+
+            if execution_result.errors and any(
+                not getattr(e, "path", None) for e in execution_result.errors
+            ):
+                status_code = 400
+            else:
+                response["data"] = execution_result.data
+
+            if execution_result.extensions:
+                response["extensions"] = execution_result.extensions
+
+            if self.batch:
+                response["id"] = id
+                response["status"] = status_code
+
+            result = self.json_encode(request, response, pretty=show_graphiql)
+        else:
+            result = None
+
+        return result, status_code
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        with metrics.collect() as sample, query_stats.collect(
+            request, force=sample is not None
+        ) as stats:
+            operation, result = self.prepare_operation(
+                request, query, variables, operation_name, show_graphiql
+            )
+            if operation is not None:
+                try:
+                    result = self.execute_operation(
+                        request, operation, variables, operation_name
+                    )
+                except Exception as e:
+                    result = ExecutionResult(errors=[e])
+                result = self.finish_operation(operation, result)
+            return query_stats.attach(stats, metrics.finish(sample, result, stats))
+
+    def prepare_operation(
+        self, request, query, variables, operation_name, show_graphiql=False
+    ):
+        """
+        Everything that happens before execution: parsing and validation,
+        cost limits, the response cache lookup and authentication.
+
+        Returns ``(operation, None)`` when the operation should be executed,
+        or ``(None, result)`` when ``result`` already answers the request.
+        """
+        # The async view prepares and mutates on another thread
+        query_stats.install()
+        if not query:
+            if show_graphiql:
+                return None, None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+        if not isinstance(variables or {}, dict):
+            return None, ExecutionResult(errors=[GraphQLError("Variables must be an object.")])
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return None, ExecutionResult(data=None, errors=schema_validation_errors)
+
+        document, errors = self.document_cache.get(
+            schema, query, self.validation_rules, graphene_settings.MAX_VALIDATION_ERRORS
+        )
+        if document is None:
+            return None, ExecutionResult(errors=errors)
+
+        operation_ast = get_operation_ast(document, operation_name)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None, None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        if errors:
+            return None, ExecutionResult(data=None, errors=errors)
+
+        # Only valid documents name series, so clients cannot invent fields
+        metrics.describe(document, operation_ast)
+
+        if operation_ast is not None and operation_ast.operation == OperationType.SUBSCRIPTION:
+            return None, ExecutionResult(errors=[GraphQLError(
+                "Subscriptions are only served over WebSocket."
+            )])
+
+        operation = Operation(schema, document, operation_ast)
+        extensions = operation.extensions
+        if operation_ast is not None:
+            cost, errors = check_query_cost(schema, document, operation_ast, variables)
+            extensions["cost"] = {"cost": cost.cost, "depth": cost.depth}
+            if errors:
+                return None, ExecutionResult(data=None, errors=errors, extensions=extensions)
+
+        if (
+            operation_ast is not None
+            and response_cache.is_anonymous(request)
+            and not profiling.allowed(request)
+        ):
+            try:
+                operation.tags = response_cache.get_tags(
+                    schema, document, operation_ast, variables
+                )
+            except GraphQLError:
+                # Bad variables; let execution report them
+                operation.tags = None
+        if operation.tags is not None:
+            operation.cache_key = response_cache.make_key(document, operation_name, variables)
+            data, operation.versions = response_cache.lookup(
+                operation.cache_key, operation.tags
+            )
+            if data is not None:
+                extensions["responseCache"] = "HIT"
+                return None, ExecutionResult(data=data, extensions=extensions)
+            extensions["responseCache"] = "MISS"
+
+        if operation_ast is not None:
+            try:
+                authenticate_operation(request, schema, operation_ast)
+            except JSONWebTokenError as e:
+                return None, ExecutionResult(
+                    errors=[GraphQLError(str(e))], extensions=extensions
+                )
+
+        return operation, None
+
+    def get_execute_options(self, request, variables, operation_name):
+        execute_options = {
+            "root_value": self.get_root_value(request),
+            "context_value": self.get_context(request),
+            "variable_values": variables,
+            "operation_name": operation_name,
+            "middleware": self.get_middleware(request),
+        }
+        if self.execution_context_class:
+            execute_options["execution_context_class"] = self.execution_context_class
+        return execute_options
+
+    def execute_operation(self, request, operation, variables, operation_name):
+        """
+        Execute ``operation``, inside a transaction for atomic mutations and
+        under the profiler when the request asked for it (``profiling``).
+        """
+        execute_options = self.get_execute_options(request, variables, operation_name)
+        with profiling.profile(request, operation):
+            if operation.is_mutation and (
+                graphene_settings.ATOMIC_MUTATIONS is True
+                or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+            ):
+                with transaction.atomic():
+                    result = execute(operation.schema, operation.document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+            return execute(operation.schema, operation.document, **execute_options)
+
+    def finish_operation(self, operation, result):
+        """Cache a fresh anonymous read and attach the extensions."""
+        if operation.tags is not None and not result.errors and result.data is not None:
+            response_cache.store(operation.cache_key, operation.versions, result.data)
+
+        result.extensions = {**operation.extensions, **(result.extensions or {})}
+        return result
+
+
+class AsyncGraphQLView(GraphQLView):
+    """
+    ``GraphQLView`` for ASGI deployments.
+
+    Body parsing (uploads included), preparation, mutations and profiled
+    operations run through ``sync_to_async``, but a query is executed with
+    graphql-core's async executor: the root fields are resolved concurrently
+    on the pool of ``graphdj.execution`` and the request holds no thread while
+    it waits for them. Batched requests and the GraphiQL page are served by
+    the synchronous code path.
+    """
+    view_is_async = True
+    concurrent_execution_context_class = ConcurrentExecutionContext
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.persisted_query = False
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+
+            # Multipart uploads are streamed to disk while parsing
+            data = await sync_to_async(self.parse_body)(request)
+            if self.batch or (self.graphiql and self.can_display_graphiql(request, data)):
+                return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+            result, status_code = await self.get_response_async(request, data)
+            response = HttpResponse(
+                status=status_code, content=result, content_type="application/json"
+            )
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(
+                request, {"errors": [self.format_error(e)]}
+            )
+        return self.patch_response(request, response)
+
+    async def get_response_async(self, request, data):
+        try:
+            data = await sync_to_async(self.resolve_persisted_query)(request, data)
+        except persisted_queries.PersistedQueryError as e:
+            return self.json_encode(request, {'errors': [e.formatted]}), e.status
+
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        with metrics.collect() as sample, query_stats.collect(
+            request, force=sample is not None
+        ) as stats:
+            operation, result = await sync_to_async(self.prepare_operation)(
+                request, query, variables, operation_name
+            )
+            if operation is not None:
+                try:
+                    # cProfile follows one thread, so profiled queries run serially on it
+                    profiled = profiling.requested(request) and await sync_to_async(
+                        profiling.allowed
+                    )(request)
+                    if operation.is_mutation or profiled:
+                        result = await sync_to_async(self.execute_operation)(
+                            request, operation, variables, operation_name
+                        )
+                    else:
+                        execute_options = self.get_execute_options(
+                            request, variables, operation_name
+                        )
+                        execute_options["execution_context_class"] = (
+                            self.concurrent_execution_context_class
+                        )
+                        if sample is not None:
+                            sample.lock = threading.Lock()
+                        result = execute(operation.schema, operation.document, **execute_options)
+                        if is_awaitable(result):
+                            result = await result
+                except Exception as e:
+                    result = ExecutionResult(errors=[e])
+                result = await sync_to_async(self.finish_operation)(operation, result)
+            query_stats.attach(stats, metrics.finish(sample, result, stats))
+        return self.build_response(request, result, id)
+
+
+def metrics_view(request):
+    """Serve ``metrics.render`` to Prometheus, behind ``TOKEN`` when set."""
+    config = metrics.get_config()
+    if not config['ENABLED']:
+        raise Http404
+    if config['TOKEN'] and not constant_time_compare(
+        request.headers.get('Authorization', ''), f"Bearer {config['TOKEN']}"
+    ):
+        return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer'})
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,113 @@
+"""
+Content-addressed storage of profile images.
+
+``store`` saves an upload as ``profileImages/<sha256>.<ext>`` and counts a
+reference on its ``ImageBlob``, so identical uploads share one file (and one
+URL, which upstream caches then hit). The hash and dimensions are the ones
+``graphdj.uploads.ImageUploadHandler`` worked out while streaming the
+upload, or are computed here for files that did not come through it.
+``attach`` stores an upload for a profile and copies the blob's metadata
+onto it, so ``ProfileType`` serves it without touching the file. ``release``
+drops a reference; the file and its thumbnail variants are deleted once the
+last one is released and the transaction commits. Both must run inside the
+transaction that saves or deletes the profile.
+"""
+import hashlib
+import os
+
+from django.core.files.images import get_image_dimensions
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from . import thumbnails
+from .models import ImageBlob, Profile
+
+DIRECTORY = 'profileImages'
+
+
+def get_storage():
+    return Profile._meta.get_field('image').storage
+
+
+def content_hash(file):
+    digest = getattr(file, 'content_hash', None)
+    if digest is None:
+        hasher = hashlib.sha256()
+        for chunk in file.chunks():
+            hasher.update(chunk)
+        digest = hasher.hexdigest()
+        file.seek(0)
+    return digest
+
+
+def blob_name(file, digest):
+    image_format = getattr(file, 'image_format', None)
+    if image_format:
+        extension = '.' + image_format.lower().replace('jpeg', 'jpg')
+    else:
+        extension = os.path.splitext(file.name)[1].lower()
+    return f'{DIRECTORY}/{digest}{extension}'
+
+
+def dimensions(file):
+    size = getattr(file, 'image_dimensions', None)
+    if size is None:
+        size = get_image_dimensions(file)
+        file.seek(0)
+    return size
+
+
+def store(file):
+    """Store ``file`` (or find its twin) and return its ``ImageBlob``."""
+    digest = content_hash(file)
+    blob = ImageBlob.objects.select_for_update().filter(content_hash=digest).first()
+    if blob is not None:
+        ImageBlob.objects.filter(pk=digest).update(references=F('references') + 1)
+        return blob
+
+    width, height = dimensions(file)
+    byte_size = file.size
+    name = blob_name(file, digest)
+    storage = get_storage()
+    # Left behind by a rolled back store, or not deleted yet by a release
+    if not storage.exists(name):
+        name = storage.save(name, file)
+    try:
+        with transaction.atomic():
+            return ImageBlob.objects.create(
+                content_hash=digest, name=name, references=1,
+                width=width, height=height, byte_size=byte_size,
+            )
+    except IntegrityError:
+        # A concurrent upload of the same content got there first
+        return store(file)
+
+
+def attach(profile, file):
+    """Make ``file`` the image of ``profile`` (not saved yet)."""
+    blob = store(file)
+    profile.image = blob.name
+    profile.image_width = blob.width
+    profile.image_height = blob.height
+    profile.image_byte_size = blob.byte_size
+    profile.image_hash = blob.content_hash
+
+
+def release(name):
+    """Drop one reference to the image ``name``."""
+    blob = ImageBlob.objects.select_for_update().filter(name=name).first()
+    if blob is not None and blob.references > 1:
+        ImageBlob.objects.filter(pk=blob.pk).update(references=F('references') - 1)
+        return
+    if blob is not None:
+        blob.delete()
+    # Images stored before deduplication have no blob and a single owner
+    transaction.on_commit(lambda: _delete_unreferenced(name))
+
+
+def _delete_unreferenced(name):
+    # A store may have claimed the same content again since the release
+    if ImageBlob.objects.filter(name=name).exists():
+        return
+    get_storage().delete(name)
+    thumbnails.delete_variants(name)
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from profiles import thumbnails
+from profiles.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Render the resized variants of profile images, inline"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Re-render profiles that already have variants, e.g. after changing the sizes",
+        )
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.exclude(image="")
+        if not options["all"]:
+            profiles = profiles.filter(thumbnails={})
+        count = 0
+        rendered = set()
+        for profile in profiles.iterator():
+            # Profiles sharing an image share its variants; render them once
+            force = options["all"] and profile.image.name not in rendered
+            rendered.add(profile.image.name)
+            stale = set(profile.thumbnails.values())
+            stale -= set(thumbnails.generate(profile.pk, profile.image.name, force=force).values())
+            thumbnails.delete(stale)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Rendered thumbnails of {count} profile(s)"))
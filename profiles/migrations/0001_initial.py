@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-17 23:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('content_hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('references', models.PositiveIntegerField(default=0)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('byte_size', models.PositiveBigIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('image', models.ImageField(upload_to='profileImages')),
+                ('thumbnails', models.JSONField(blank=True, default=dict, editable=False)),
+                ('image_width', models.PositiveIntegerField(blank=True, editable=False, null=True)),
+                ('image_height', models.PositiveIntegerField(blank=True, editable=False, null=True)),
+                ('image_byte_size', models.PositiveBigIntegerField(blank=True, editable=False, null=True)),
+                ('image_hash', models.CharField(blank=True, editable=False, max_length=64)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -5,7 +5,27 @@ from django.contrib.auth import get_user_model
 class Profile(models.Model):
     name = models.CharField(max_length=100)
     image = models.ImageField(upload_to="profileImages")
+    # Variant key ("128.webp") -> stored name, filled by profiles.thumbnails
+    thumbnails = models.JSONField(default=dict, blank=True, editable=False)
+    # Copied from the ImageBlob at upload time, so reads never open the file
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_byte_size = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    image_hash = models.CharField(max_length=64, blank=True, editable=False)
     user= models.OneToOneField(get_user_model(), on_delete=models.CASCADE)
 
+    def __str__(self):
+        return self.name
+
+
+class ImageBlob(models.Model):
+    """One stored profile image, shared by every profile uploading the same bytes."""
+    content_hash = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=100, unique=True)
+    references = models.PositiveIntegerField(default=0)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    byte_size = models.PositiveBigIntegerField()
+
     def __str__(self):
         return self.name
\ No newline at end of file
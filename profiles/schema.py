@@ -1,11 +1,15 @@
 import graphene
 from django.core.exceptions import ValidationError
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from graphene_django import DjangoObjectType
 from graphene_file_upload.scalars import Upload
 from graphql import GraphQLError
 from graphql_jwt.decorators import login_required
 
+from graphdj.loaders import load_related, track
+from graphdj.optimizer import optimize
+
+from . import images, thumbnails
 from .models import Profile
 
 
@@ -14,6 +18,48 @@ class  ProfileType(DjangoObjectType):
         model = Profile
         fields = ("id","name","user")
 
+    thumbnail = graphene.String(
+        size=graphene.Int(required=True),
+        format=graphene.String(default_value='webp'),
+        description="URL of the smallest variant at least `size` px on its longest side; "
+                    "the original until the variants are rendered",
+    )
+
+    # Served from the columns filled at upload time, never from the file
+    image_url = graphene.String()
+    width = graphene.Int()
+    height = graphene.Int()
+    byte_size = graphene.Int()
+    content_hash = graphene.String()
+
+    def resolve_user(self, info):
+        return load_related(info, self, 'user')
+
+    def resolve_image_url(self, info):
+        return self.image.url if self.image else None
+
+    def resolve_width(self, info):
+        return self.image_width
+
+    def resolve_height(self, info):
+        return self.image_height
+
+    def resolve_byte_size(self, info):
+        return self.image_byte_size
+
+    def resolve_content_hash(self, info):
+        return self.image_hash or None
+
+    def resolve_thumbnail(self, info, size, format):
+        if format.lower() not in thumbnails.get_config()['FORMATS']:
+            raise GraphQLError(f'Unsupported thumbnail format: {format}')
+        if not self.image:
+            return None
+        name = self.thumbnails.get(thumbnails.variant_key(thumbnails.pick_size(size), format))
+        if name is None:
+            return self.image.url
+        return thumbnails.get_storage().url(name)
+
 class Query(graphene.ObjectType):
     profiles = graphene.List(ProfileType)
     profile = graphene.Field(ProfileType, id=graphene.Int(required=True))
@@ -21,13 +67,13 @@ class Query(graphene.ObjectType):
 
     def resolve_profiles(self, info):
         try:
-            return Profile.objects.all()
+            return track(info, optimize(Profile.objects.all(), info))
         except Exception as e:
             raise GraphQLError(f'Failed to fetch profiles: {str(e)}')
 
     def resolve_profile(self, info, id):
         try:
-            return Profile.objects.get(id=id)
+            return track(info, [Profile.objects.get(id=id)])[0]
         except Profile.DoesNotExist:
             raise GraphQLError('Profile with given ID does not exist')
         except Exception as e:
@@ -36,7 +82,7 @@ class Query(graphene.ObjectType):
     @login_required
     def resolve_my_profile(self, info):
         try:
-            return Profile.objects.get(user=info.context.user)
+            return track(info, [Profile.objects.get(user=info.context.user)])[0]
         except Profile.DoesNotExist:
             raise GraphQLError('You do not have a profile')
         except Exception as e:
@@ -67,7 +113,10 @@ class CreateProfile(graphene.Mutation):
             
             try:
                 profile.full_clean()  # Validate the model
-                profile.save()
+                with transaction.atomic():
+                    images.attach(profile, file[0])
+                    profile.save()
+                thumbnails.schedule(profile)
                 return CreateProfile(profile=profile, success=True)
                 
             except ValidationError as e:
@@ -91,11 +140,11 @@ class DeleteProfile(graphene.Mutation):
             if profile.user.id != info.context.user.id:
                 raise GraphQLError('You cannot delete a profile that is not yours')
             
-            # Delete image first
-            if profile.image:
-                profile.image.delete()
-                
-            profile.delete()
+            # The image and its variants go with the last profile using them
+            with transaction.atomic():
+                profile.delete()
+                if profile.image:
+                    images.release(profile.image.name)
             return DeleteProfile(success=True)
             
         except Profile.DoesNotExist:
@@ -124,19 +173,23 @@ class UpdateProfile(graphene.Mutation):
                 raise GraphQLError('You cannot modify a profile that is not yours')
                 
             # Save old image reference for cleanup
-            old_image = profile.image
+            old_image = profile.image.name
             
             # Update profile
             profile.name = file[0].name
             profile.image = file[0]
+            profile.thumbnails = {}
             
             try:
                 profile.full_clean()  # Validate the model
-                profile.save()
+                with transaction.atomic():
+                    images.attach(profile, file[0])
+                    profile.save()
+                    # Only release old image with a successful save
+                    if old_image:
+                        images.release(old_image)
                 
-                # Only delete old image after successful save
-                if old_image:
-                    old_image.delete()
+                thumbnails.schedule(profile)
                     
                 return UpdateProfile(profile=profile, success=True)
                 
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from graphdj import response_cache
+
+from .models import Profile
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_profile(sender, instance, **kwargs):
+    response_cache.invalidate_on_commit(['profiles:list'])
@@ -0,0 +1,173 @@
+"""
+Resized variants of profile images.
+
+Every saved profile image is rendered once per ``PROFILE_THUMBNAILS['SIZES']``
+and ``['FORMATS']`` entry (longest side in pixels, Pillow format name) under
+``profileThumbnails/``. ``schedule`` queues the work on a small thread pool
+once the transaction commits, so the upload request never waits for Pillow;
+``MAX_WORKERS = 0`` renders inline instead. Variants are named after the
+original, so profiles sharing an image (see ``profiles.images``) share its
+variants too and existing ones are not rendered again unless forced;
+``delete_variants`` runs when the original itself is deleted. The names of the finished
+variants are recorded on ``Profile.thumbnails`` only while the profile still
+points at the same original, so a render that loses the race against a newer
+upload or a deletion cleans up after itself. ``manage.py
+generate_profile_thumbnails`` renders whatever is missing, and re-renders
+everything with ``--all``. Failed background renders are logged.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from graphdj import response_cache
+
+DIRECTORY = 'profileThumbnails'
+
+DEFAULTS = {
+    'SIZES': [64, 128, 512],
+    'FORMATS': ['webp', 'jpeg'],
+    'QUALITY': 80,
+    'MAX_WORKERS': 2,
+}
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'PROFILE_THUMBNAILS', {})}
+
+
+def get_storage():
+    from .models import Profile
+    return Profile._meta.get_field('image').storage
+
+
+def variant_key(size, format):
+    return f'{size}.{format.lower()}'
+
+
+def variant_name(image_name, size, format):
+    """Where the ``size``/``format`` variant of ``image_name`` is stored."""
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return f'{DIRECTORY}/{stem}_{size}.{format.lower()}'
+
+
+def pick_size(size):
+    """The smallest configured size covering ``size``, else the largest."""
+    sizes = sorted(get_config()['SIZES'])
+    return next((s for s in sizes if s >= size), sizes[-1])
+
+
+def render(image, size, format, quality):
+    variant = image.copy()
+    variant.thumbnail((size, size), Image.LANCZOS)
+    if format.lower() in ('jpeg', 'jpg') and variant.mode != 'RGB':
+        variant = variant.convert('RGB')
+    buffer = io.BytesIO()
+    variant.save(buffer, format=format.upper(), quality=quality)
+    return buffer.getvalue()
+
+
+def generate(profile_id, image_name, force=False):
+    """
+    Render every variant of ``image_name`` for the profile ``profile_id``,
+    replacing those already stored if ``force``.
+    """
+    from .models import Profile
+
+    config = get_config()
+    storage = get_storage()
+    image = None
+    thumbnails = {}
+    for size in config['SIZES']:
+        for format in config['FORMATS']:
+            name = variant_name(image_name, size, format)
+            exists = storage.exists(name)
+            if force or not exists:
+                if image is None:
+                    image = load(image_name)
+                content = ContentFile(render(image, size, format, config['QUALITY']))
+                if exists:
+                    # Storages pick another name rather than overwrite
+                    storage.delete(name)
+                name = storage.save(name, content)
+            thumbnails[variant_key(size, format)] = name
+
+    updated = Profile.objects.filter(pk=profile_id, image=image_name).update(thumbnails=thumbnails)
+    if updated:
+        # update() sends no post_save; thumbnail URLs changed
+        response_cache.invalidate_on_commit(['profiles:list'])
+    elif not Profile.objects.filter(image=image_name).exists():
+        # The image was replaced or removed while rendering
+        delete(thumbnails.values())
+    return thumbnails
+
+
+def load(image_name):
+    with get_storage().open(image_name) as original:
+        image = Image.open(original)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+    return image
+
+
+def delete(names):
+    storage = get_storage()
+    for name in names:
+        storage.delete(name)
+
+
+def delete_variants(image_name):
+    """Delete every configured variant of ``image_name``."""
+    config = get_config()
+    delete(
+        variant_name(image_name, size, format)
+        for size in config['SIZES']
+        for format in config['FORMATS']
+    )
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_config()['MAX_WORKERS'],
+                thread_name_prefix='thumbnails',
+            )
+    return _executor
+
+
+def _run(profile_id, image_name):
+    close_old_connections()
+    try:
+        generate(profile_id, image_name)
+    except Exception:
+        # Nobody waits on the future, so the error would be lost
+        logger.exception('Could not render the thumbnails of profile %s', profile_id)
+    finally:
+        close_old_connections()
+
+
+def schedule(profile):
+    """Render the variants of ``profile.image`` after the transaction commits."""
+    profile_id, image_name = profile.pk, profile.image.name
+
+    def submit():
+        if get_config()['MAX_WORKERS']:
+            get_executor().submit(_run, profile_id, image_name)
+        else:
+            generate(profile_id, image_name)
+
+    transaction.on_commit(submit)
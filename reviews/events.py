@@ -0,0 +1,21 @@
+"""
+Review events for the subscriptions in ``reviews.schema``.
+
+Each book has one ``graphdj.pubsub`` channel per event kind. Messages only
+carry ids, so they stay JSON-serializable for multi-process backends; the
+subscription resolvers load the current row when the event is executed.
+"""
+from graphdj import pubsub
+
+ADDED = 'added'
+UPDATED = 'updated'
+DELETED = 'deleted'
+
+
+def channel(book_id, event):
+    return f'book:{book_id}:reviews:{event}'
+
+
+def publish(event, book_id, review_id):
+    """Publish ``event`` for review ``review_id`` once the transaction commits."""
+    pubsub.publish_on_commit(channel(book_id, event), {'review_id': review_id})
@@ -4,5 +4,14 @@ from django.contrib.auth import get_user_model
 # Create your models here.
 class Review(models.Model):
     text = models.TextField()
-    user=models.ForeignKey(get_user_model(),on_delete=models.CASCADE,related_name="reviews")
-    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="reviews")
\ No newline at end of file
+    # Both foreign keys are indexed by the composite indexes leading with them
+    user=models.ForeignKey(get_user_model(),on_delete=models.CASCADE,related_name="reviews",db_index=False)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="reviews", db_index=False)
+
+    class Meta:
+        indexes = [
+            # bookReviews and the per-book review counts
+            models.Index(fields=["book", "id"], name="review_book_idx"),
+            # myReviews
+            models.Index(fields=["user", "id"], name="review_user_idx"),
+        ]
\ No newline at end of file
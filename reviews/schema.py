@@ -3,12 +3,24 @@ from graphene_django import DjangoObjectType
 from .models import Review
 from graphql_jwt.decorators import login_required
 from graphql import GraphQLError
+from books import aggregates
 from books.models import Book
+from django.db import transaction
+from graphdj import bulk, pubsub, response_cache
+from graphdj.loaders import load_related, track
+from graphdj.optimizer import optimize
+from . import events
 
 class ReviewType(DjangoObjectType):
     class Meta:
         model = Review
 
+    def resolve_user(self, info):
+        return load_related(info, self, 'user')
+
+    def resolve_book(self, info):
+        return load_related(info, self, 'book')
+
 class Query(graphene.ObjectType):
     reviews = graphene.List(ReviewType)
     review = graphene.Field(ReviewType, id=graphene.Int(required=True))
@@ -16,30 +28,38 @@ class Query(graphene.ObjectType):
     book_reviews = graphene.List(ReviewType,book_id=graphene.Int(required=True))
 
     def resolve_reviews(self, info):
-        reviews = Review.objects.all()
-        return reviews
+        reviews = optimize(Review.objects.all(), info)
+        return track(info, reviews)
 
     def resolve_review(self,info,id):
         try:
             review = Review.objects.get(id=id)
         except Review.DoesNotExist:
             raise GraphQLError("Review with this id doesn't exist")
-        return review
+        return track(info, [review])[0]
 
     @login_required
     def resolve_my_reviews(self,info):
-        return Review.objects.all().filter(user=info.context.user)
+        return track(info, optimize(Review.objects.filter(user=info.context.user).order_by('id'), info))
 
     def resolve_book_reviews(self, info,book_id):
         try:
             book = Book.objects.get(id=book_id)
         except Book.DoesNotExist:
             raise GraphQLError("Book with this id doesn't exist")
-        return Review.objects.all().filter(book=book)
+        return track(info, optimize(Review.objects.filter(book=book).order_by('id'), info))
 class CreateReviewInput(graphene.InputObjectType):
         text = graphene.String(required=True)
         book_id = graphene.Int(required=True)
 
+def create_review_errors(user, book):
+    """Validation shared by ``createReview`` and ``createReviews``."""
+    if book is None:
+        return ["Book with this id doesn't exist"]
+    if book.author_id == user.id:
+        return ["You cannot review your own book"]
+    return []
+
 class CreateReview(graphene.Mutation):
     review = graphene.Field(ReviewType)
 
@@ -48,20 +68,60 @@ class CreateReview(graphene.Mutation):
 
     @login_required
     def mutate(self, info, create_review_input):
-            try:
-                book = Book.objects.get(id=create_review_input.book_id)
-            except Book.DoesNotExist:
-                raise GraphQLError("Book with this id doesn't exist")
-            if book.author.id is info.context.user.id:
-                 raise GraphQLError("You cannot review your own book")
+            book = Book.objects.filter(id=create_review_input.book_id).first()
+            errors = create_review_errors(info.context.user, book)
+            if errors:
+                raise GraphQLError(errors[0])
             review = Review()
             review.book = book
             review.user = info.context.user
-            review.save()
+            with transaction.atomic():
+                review.save()
+                aggregates.reviews_added([book.id])
+            book.refresh_from_db(fields=['review_count'])
+            events.publish(events.ADDED, review.book_id, review.id)
             return CreateReview(
                 review=review
             )
 
+class CreateReviews(graphene.Mutation):
+    reviews = graphene.List(ReviewType)
+    success = graphene.Boolean()
+    errors = graphene.List(bulk.ItemError)
+
+    class Arguments:
+        inputs = graphene.List(graphene.NonNull(CreateReviewInput), required=True)
+
+    @login_required
+    def mutate(self, info, inputs):
+        bulk.check_size(inputs)
+        user = info.context.user
+        books = Book.objects.in_bulk({review_input.book_id for review_input in inputs})
+        errors = bulk.item_errors(
+            inputs,
+            lambda review_input: create_review_errors(user, books.get(review_input.book_id))
+        )
+        if errors:
+            return CreateReviews(success=False, errors=errors)
+
+        reviews = [
+            Review(text=review_input.text, book=books[review_input.book_id], user=user)
+            for review_input in inputs
+        ]
+        with transaction.atomic():
+            reviews = bulk.bulk_create(Review, reviews)
+            aggregates.reviews_added([review.book_id for review in reviews])
+            book_ids = {review.book_id for review in reviews}
+            counts = dict(Book.objects.filter(id__in=book_ids).values_list('id', 'review_count'))
+            for book in books.values():
+                book.review_count = counts.get(book.id, book.review_count)
+            response_cache.invalidate_on_commit(
+                ['reviews:list'] + [response_cache.book_reviews_tag(book_id) for book_id in book_ids]
+            )
+            for review in reviews:
+                events.publish(events.ADDED, review.book_id, review.id)
+        return CreateReviews(reviews=track(info, reviews), success=True)
+
 class UpdateReviewInput(graphene.InputObjectType):
     review_id = graphene.Int(required=True)
     text = graphene.String(required=True)
@@ -82,6 +142,7 @@ class UpdateReview(graphene.Mutation):
             raise GraphQLError("You cannot update a review which is not yours")
         review.text = update_review_input.text
         review.save()
+        events.publish(events.UPDATED, review.book_id, review.id)
         return UpdateReview(review=review)
 
 class DeleteReview(graphene.Mutation):
@@ -97,12 +158,85 @@ class DeleteReview(graphene.Mutation):
             raise GraphQLError("Book with this id doesn't exist")
         if review.user.id is not info.context.user.id:
             raise GraphQLError("You cannot delete a review which is not yours")
-        review.delete()
+        book_id = review.book_id
+        with transaction.atomic():
+            review.delete()
+            aggregates.reviews_removed([book_id])
+        events.publish(events.DELETED, book_id, review_id)
         return DeleteReview(success=True)
 
 
+class DeleteReviews(graphene.Mutation):
+    deleted = graphene.List(graphene.Int)
+    denied = graphene.List(graphene.Int)
+    missing = graphene.List(graphene.Int)
+    success = graphene.Boolean()
+
+    class Arguments:
+        ids = graphene.List(graphene.NonNull(graphene.Int), required=True)
+
+    @login_required
+    def mutate(self, info, ids):
+        bulk.check_size(ids)
+        with transaction.atomic():
+            owned = Review.objects.filter(id__in=ids, user=info.context.user)
+            rows = sorted(owned.values_list('id', 'book_id'))
+            deleted = [review_id for review_id, _ in rows]
+            denied, missing = bulk.denied_and_missing(Review.objects.all(), ids, deleted)
+            owned.delete()
+            aggregates.reviews_removed([book_id for _, book_id in rows])
+            for review_id, book_id in rows:
+                events.publish(events.DELETED, book_id, review_id)
+        return DeleteReviews(
+            deleted=deleted,
+            denied=denied,
+            missing=missing,
+            success=not denied and not missing
+        )
+
+
 class Mutation(graphene.ObjectType):
     create_review = CreateReview.Field()
+    create_reviews = CreateReviews.Field()
     update_review = UpdateReview.Field()
     delete_review = DeleteReview.Field()
+    delete_reviews = DeleteReviews.Field()
+
+
+async def subscribe_to_book(book_id, event):
+    if not await Book.objects.filter(id=book_id).aexists():
+        raise GraphQLError("Book with this id doesn't exist")
+    return pubsub.subscribe(events.channel(book_id, event))
+
+
+def load_review(info, message):
+    review = Review.objects.filter(id=message['review_id']).first()
+    # Gone again before the event was delivered
+    if review is None:
+        return None
+    return track(info, [review])[0]
+
+
+class Subscription(graphene.ObjectType):
+    review_added = graphene.Field(ReviewType, book_id=graphene.Int(required=True))
+    review_updated = graphene.Field(ReviewType, book_id=graphene.Int(required=True))
+    review_deleted = graphene.Int(book_id=graphene.Int(required=True))
+
+    async def subscribe_review_added(root, info, book_id):
+        return await subscribe_to_book(book_id, events.ADDED)
+
+    async def subscribe_review_updated(root, info, book_id):
+        return await subscribe_to_book(book_id, events.UPDATED)
+
+    async def subscribe_review_deleted(root, info, book_id):
+        return await subscribe_to_book(book_id, events.DELETED)
+
+    def resolve_review_added(root, info, book_id):
+        return load_review(info, root)
+
+    def resolve_review_updated(root, info, book_id):
+        return load_review(info, root)
+
+    def resolve_review_deleted(root, info, book_id):
+        return root['review_id']
     
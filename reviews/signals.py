@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from graphdj import response_cache
+
+from .models import Review
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review(sender, instance, **kwargs):
+    response_cache.invalidate_on_commit([
+        'reviews:list',
+        response_cache.book_reviews_tag(instance.book_id),
+    ])
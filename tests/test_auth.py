@@ -1,5 +1,8 @@
+from unittest import mock
+
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from graphql_jwt.middleware import JSONWebTokenMiddleware
 from .utils import GraphQLTestClient, create_test_user
 
 User = get_user_model()
@@ -91,3 +94,59 @@ class AuthenticationTests(TestCase):
         
         # The me query should return null for unauthenticated users
         self.assertIsNone(response['data']['me'])
+
+    def test_authenticated_user_is_cached_per_token(self):
+        """Test that a verified token skips the user lookup until the user changes"""
+        client = GraphQLTestClient()
+        client.login('testuser', 'password123')
+        query = '''
+        query {
+            me {
+                username
+            }
+        }
+        '''
+
+        client.query(query)
+        with self.assertNumQueries(0):
+            response = client.query(query)
+        self.assertEqual(response['data']['me']['username'], 'testuser')
+
+        self.user.username = 'renamed'
+        self.user.save()
+
+        # The token names a username that no longer exists
+        response = client.query(query)
+        self.assertIsNone(response['data']['me'])
+
+    def test_authentication_runs_once_per_operation(self):
+        """Test that the JWT middleware is not run for every resolved field"""
+        self.client.login('testuser', 'password123')
+        query = '''
+        query {
+            me {
+                username
+            }
+            myBooks {
+                id
+            }
+        }
+        '''
+
+        with mock.patch.object(
+            JSONWebTokenMiddleware, 'resolve', autospec=True
+        ) as resolve:
+            response = self.client.query(query)
+
+        self.assertNotIn('errors', response)
+        self.assertEqual(response['data']['me']['username'], 'testuser')
+        resolve.assert_not_called()
+
+    def test_invalid_token_is_rejected(self):
+        """Test that a bad token fails the operation before execution"""
+        self.client.token = 'not-a-token'
+
+        response = self.client.query('query { me { username } }')
+
+        self.assertIn('errors', response)
+        self.assertNotIn('data', response)
@@ -1,6 +1,15 @@
-from django.test import TestCase
+import io
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from .utils import GraphQLTestClient, create_test_user
-from books.models import Book
+from books import aggregates, leaderboards
+from books.models import Book, Leaderboard
+from reviews.models import Review
 
 class BookTests(TestCase):
     def setUp(self):
@@ -208,3 +217,594 @@ class BookTests(TestCase):
         
         self.assertNotIn('errors', response)
         self.assertEqual(len(response['data']['books']), 2)
+
+    def test_books_join_only_selected_relations(self):
+        """Test that books joins relations only when the query selects them"""
+        reader = create_test_user(username="reader", email="reader@example.com")
+        Review.objects.create(text="Nice", user=reader, book=self.book)
+
+        with CaptureQueriesContext(connection) as lean:
+            response = self.client.query('query { books { title } }')
+
+        self.assertNotIn('errors', response)
+        book_sql = [q['sql'] for q in lean if 'FROM "books_book"' in q['sql']]
+        self.assertEqual(len(book_sql), 1)
+        self.assertNotIn('JOIN', book_sql[0])
+
+        query = '''
+        query {
+            books {
+                title
+                author {
+                    username
+                }
+                reviews {
+                    text
+                    user {
+                        username
+                    }
+                }
+            }
+        }
+        '''
+
+        with CaptureQueriesContext(connection) as deep:
+            response = self.client.query(query)
+
+        self.assertNotIn('errors', response)
+        book = response['data']['books'][0]
+        self.assertEqual(book['author']['username'], 'testuser')
+        self.assertEqual(book['reviews'][0]['user']['username'], 'reader')
+        book_sql = [q['sql'] for q in deep if 'FROM "books_book"' in q['sql']]
+        review_sql = [q['sql'] for q in deep if 'FROM "reviews_review"' in q['sql']]
+        self.assertEqual(len(book_sql), 1)
+        self.assertIn('JOIN "auth_user"', book_sql[0])
+        self.assertEqual(len(review_sql), 1)
+        self.assertIn('JOIN "auth_user"', review_sql[0])
+
+    def test_query_budgets(self):
+        """Test that book queries run a fixed number of SQL statements however many rows they return"""
+        for i in range(5):
+            reader = create_test_user(username=f"budget{i}", email=f"budget{i}@example.com")
+            book = Book.objects.create(
+                title=f"Budget Book {i}",
+                description="One of many",
+                year_published=2000 + i,
+                author=self.user
+            )
+            Review.objects.create(text=f"Review {i}", user=reader, book=book)
+
+        self.client.assert_query_budget(3, '''
+        query {
+            books {
+                title
+                author {
+                    username
+                }
+                reviews {
+                    text
+                    user {
+                        username
+                    }
+                }
+            }
+        }
+        ''')
+        self.client.assert_query_budget(2, 'query { myBooks { title reviews { text } } }')
+        self.client.assert_query_budget(1, '''
+        query {
+            booksConnection(first: 3, orderBy: YEAR_PUBLISHED) {
+                edges {
+                    node {
+                        title
+                        author {
+                            username
+                        }
+                    }
+                }
+            }
+        }
+        ''')
+        # Rows created through the ORM; reads are budgeted once the boards are built
+        for name in leaderboards.BOARDS:
+            leaderboards.rebuild(name)
+        self.client.assert_query_budget(3, 'query { topBooks { rank book { title author { username } } } }')
+        self.client.assert_query_budget(3, 'query { topAuthors { rank author { username } } }')
+
+    def test_books_connection_keyset_pagination(self):
+        """Test paging through books with keyset cursors"""
+        for year in (2001, 2003, 2002, 2003):
+            Book.objects.create(
+                title=f"Python {year}",
+                description="Paged book",
+                year_published=year,
+                author=self.user
+            )
+
+        query = '''
+        query Page($after: String, $search: String) {
+            booksConnection(first: 2, after: $after, orderBy: YEAR_PUBLISHED, search: $search) {
+                edges {
+                    cursor
+                    node {
+                        title
+                        yearPublished
+                    }
+                }
+                pageInfo {
+                    hasNextPage
+                    endCursor
+                }
+            }
+        }
+        '''
+
+        years = []
+        after = None
+        while True:
+            response = self.client.query(query, {'after': after, 'search': 'Python'})
+            self.assertNotIn('errors', response)
+            connection = response['data']['booksConnection']
+            years += [edge['node']['yearPublished'] for edge in connection['edges']]
+            if not connection['pageInfo']['hasNextPage']:
+                break
+            after = connection['pageInfo']['endCursor']
+
+        self.assertEqual(years, [2001, 2002, 2003, 2003])
+
+        response = self.client.query(query, {'after': 'not-a-cursor'})
+        self.assertIn('errors', response)
+
+    def test_search_books_ranked_with_highlight(self):
+        """Test that search ranks title matches first and highlights them"""
+        Book.objects.create(
+            title="Cooking Basics",
+            description="Recipes, with a chapter on pythons",
+            year_published=2020,
+            author=self.user
+        )
+        python_book = Book.objects.create(
+            title="Python Tricks",
+            description="Idiomatic code",
+            year_published=2021,
+            author=self.user
+        )
+
+        query = '''
+        query {
+            books(search: "pyth", highlight: true) {
+                title
+                snippet
+            }
+        }
+        '''
+
+        response = self.client.query(query)
+
+        self.assertNotIn('errors', response)
+        books = response['data']['books']
+        self.assertEqual([book['title'] for book in books], ['Python Tricks', 'Cooking Basics'])
+        self.assertIn('<b>Python</b>', books[0]['snippet'])
+
+        # The index follows updates and deletes
+        python_book.title = "Snake Tricks"
+        python_book.save()
+        response = self.client.query(query)
+        self.assertEqual([book['title'] for book in response['data']['books']], ['Cooking Basics'])
+
+        Book.objects.filter(title="Cooking Basics").delete()
+        response = self.client.query(query)
+        self.assertEqual(response['data']['books'], [])
+
+    def test_search_snippets_escape_book_text(self):
+        """Test that snippets escape the book's own markup and bold only the matches"""
+        Book.objects.create(
+            title="Python <script>alert(1)</script>",
+            description="Fish & <b>chips</b>",
+            year_published=2021,
+            author=self.user
+        )
+
+        response = self.client.query('''
+        query {
+            books(search: "python", highlight: true) {
+                snippet
+            }
+        }
+        ''')
+
+        self.assertNotIn('errors', response)
+        self.assertEqual(
+            response['data']['books'][0]['snippet'],
+            '<b>Python</b> &lt;script&gt;alert(1)&lt;/script&gt;'
+        )
+
+    def test_create_books_in_bulk(self):
+        """Test that createBooks inserts every valid input in one go"""
+        mutation = '''
+        mutation CreateBooks($inputs: [CreateBookInput!]!) {
+            createBooks(inputs: $inputs) {
+                success
+                books {
+                    title
+                    author {
+                        username
+                    }
+                }
+                errors {
+                    index
+                    errors
+                }
+            }
+        }
+        '''
+        inputs = [
+            {'title': f'Imported {i}', 'description': 'Bulk import', 'yearPublished': 2000 + i}
+            for i in range(3)
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.query(mutation, {'inputs': inputs})
+
+        self.assertNotIn('errors', response)
+        result = response['data']['createBooks']
+        self.assertTrue(result['success'])
+        self.assertEqual([book['title'] for book in result['books']], ['Imported 0', 'Imported 1', 'Imported 2'])
+        self.assertEqual(result['books'][0]['author']['username'], 'testuser')
+        self.assertEqual(Book.objects.filter(title__startswith='Imported').count(), 3)
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "books_book"')]
+        self.assertEqual(len(inserts), 1)
+
+        # Bulk-created books are searchable too
+        response = self.client.query('query { books(search: "imported") { title } }')
+        self.assertEqual(len(response['data']['books']), 3)
+
+        inputs[1]['yearPublished'] = -1
+        response = self.client.query(mutation, {'inputs': inputs})
+
+        result = response['data']['createBooks']
+        self.assertFalse(result['success'])
+        self.assertEqual(result['errors'], [{'index': 1, 'errors': ['Year published cannot be negative']}])
+        self.assertEqual(Book.objects.filter(title__startswith='Imported').count(), 3)
+
+    def test_update_and_delete_books_in_bulk(self):
+        """Test that updateBooks and deleteBooks only touch the user's books"""
+        other = create_test_user(username="other", email="other@example.com")
+        foreign = Book.objects.create(
+            title="Not Mine",
+            description="Someone else's book",
+            year_published=2001,
+            author=other
+        )
+        second = Book.objects.create(
+            title="Second Book",
+            description="Another of mine",
+            year_published=2010,
+            author=self.user
+        )
+        update = '''
+        mutation UpdateBooks($inputs: [UpdateBookInput!]!) {
+            updateBooks(inputs: $inputs) {
+                success
+                books {
+                    id
+                    title
+                    yearPublished
+                }
+                denied
+                missing
+                errors {
+                    index
+                    errors
+                }
+            }
+        }
+        '''
+
+        response = self.client.query(update, {'inputs': [
+            {'id': self.book.id, 'title': 'Renamed'},
+            {'id': second.id, 'yearPublished': -5},
+        ]})
+        self.assertEqual(response['data']['updateBooks']['errors'], [
+            {'index': 1, 'errors': ['Year published cannot be negative']}
+        ])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.query(update, {'inputs': [
+                {'id': self.book.id, 'title': 'Renamed'},
+                {'id': second.id, 'yearPublished': 2011},
+                {'id': foreign.id, 'title': 'Stolen'},
+                {'id': 0, 'title': 'Nothing'},
+            ]})
+
+        result = response['data']['updateBooks']
+        self.assertFalse(result['success'])
+        self.assertEqual(
+            [(book['title'], book['yearPublished']) for book in result['books']],
+            [('Renamed', 2023), ('Second Book', 2011)]
+        )
+        self.assertEqual(result['denied'], [foreign.id])
+        self.assertEqual(result['missing'], [0])
+        updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "books_book"')]
+        self.assertEqual(len(updates), 1)
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.title, 'Not Mine')
+
+        # The search index follows bulk updates
+        response = self.client.query('query { books(search: "renamed") { id } }')
+        self.assertEqual(response['data']['books'], [{'id': str(self.book.id)}])
+
+        response = self.client.query('''
+        mutation DeleteBooks($ids: [Int!]!) {
+            deleteBooks(ids: $ids) {
+                success
+                deleted
+                denied
+                missing
+            }
+        }
+        ''', {'ids': [self.book.id, second.id, foreign.id]})
+
+        result = response['data']['deleteBooks']
+        self.assertEqual(result['deleted'], sorted([self.book.id, second.id]))
+        self.assertEqual(result['denied'], [foreign.id])
+        self.assertEqual(result['missing'], [])
+        self.assertEqual(list(Book.objects.values_list('id', flat=True)), [foreign.id])
+
+    @override_settings(LEADERBOARDS={'SIZE': 2, 'BUFFER': 1})
+    def test_top_books_leaderboard(self):
+        """Test that the top books board is maintained and rebuilt when needed"""
+        books = [
+            Book.objects.create(
+                title=f"Ranked {i}",
+                description="A reviewed book",
+                year_published=2020,
+                author=self.user,
+                review_count=count
+            )
+            for i, count in enumerate([5, 4, 3, 2])
+        ]
+        query = '''
+        query {
+            topBooks(limit: 2) {
+                rank
+                reviewCount
+                book {
+                    title
+                }
+            }
+        }
+        '''
+
+        response = self.client.query(query)
+
+        self.assertNotIn('errors', response)
+        self.assertEqual(response['data']['topBooks'], [
+            {'rank': 1, 'reviewCount': 5, 'book': {'title': 'Ranked 0'}},
+            {'rank': 2, 'reviewCount': 4, 'book': {'title': 'Ranked 1'}},
+        ])
+
+        # Ranked 3 climbs past the lowest entry and evicts it
+        with self.captureOnCommitCallbacks(execute=True):
+            aggregates.reviews_added([books[3].id] * 3)
+        with self.assertNumQueries(2):
+            top = leaderboards.top(leaderboards.BOOKS, 2)
+        self.assertEqual(top, [(books[0].id, 5), (books[3].id, 5)])
+
+        # Members dropping below the evicted scores force a rebuild
+        with self.captureOnCommitCallbacks(execute=True):
+            aggregates.reviews_removed([books[0].id] * 4 + [books[3].id] * 4)
+        self.assertEqual(
+            leaderboards.top(leaderboards.BOOKS, 2), [(books[1].id, 4), (books[2].id, 3)]
+        )
+
+    @override_settings(LEADERBOARDS={'SIZE': 2, 'BUFFER': 1})
+    def test_leaderboard_batch_updates(self):
+        """Test that updating many scores costs as many statements as updating one"""
+        books = [
+            Book.objects.create(
+                title=f"Batched {i}",
+                description="A reviewed book",
+                year_published=2020,
+                author=self.user,
+                review_count=count
+            )
+            for i, count in enumerate([8, 7, 6, 0, 0, 0, 0, 0])
+        ]
+        leaderboards.rebuild(leaderboards.BOOKS)
+
+        Book.objects.filter(id=books[3].id).update(review_count=1)
+        with CaptureQueriesContext(connection) as single:
+            leaderboards.refresh(leaderboards.BOOKS, {books[3].id})
+
+        for book, count in zip(books[3:], [9, 1, 2, 10, 3]):
+            Book.objects.filter(id=book.id).update(review_count=count)
+        Book.objects.filter(id=books[0].id).update(review_count=0)
+        Book.objects.filter(id=books[1].id).update(review_count=11)
+        changed = [book.id for book in books[3:]] + [books[0].id, books[1].id]
+        with CaptureQueriesContext(connection) as batch:
+            leaderboards.refresh(leaderboards.BOOKS, set(changed))
+
+        self.assertEqual(len(batch), len(single) + 3)  # + one delete, bulk update and bulk create
+        board = Leaderboard.objects.get(name=leaderboards.BOOKS)
+        self.assertEqual(
+            list(board.entries.order_by('-score').values_list('object_id', 'score')),
+            [(books[1].id, 11), (books[6].id, 10), (books[3].id, 9)]
+        )
+        self.assertEqual((board.floor, board.floor_object_id), (6, books[2].id))
+        self.assertEqual(
+            leaderboards.top(leaderboards.BOOKS, 2), [(books[1].id, 11), (books[6].id, 10)]
+        )
+
+    @override_settings(LEADERBOARDS={'SIZE': 1, 'BUFFER': 1})
+    def test_leaderboard_ties_rank_by_id(self):
+        """Test that an outsider tied with the lowest entry is admitted when its id is lower"""
+        books = [
+            Book.objects.create(
+                title=f"Tied {i}",
+                description="A reviewed book",
+                year_published=2020,
+                author=self.user,
+                review_count=count
+            )
+            for i, count in enumerate([0, 5, 3])
+        ]
+        leaderboards.rebuild(leaderboards.BOOKS)
+
+        Book.objects.filter(id=books[0].id).update(review_count=3)
+        leaderboards.refresh(leaderboards.BOOKS, {books[0].id})
+
+        board = Leaderboard.objects.get(name=leaderboards.BOOKS)
+        self.assertEqual(
+            list(board.entries.order_by('-score', 'object_id').values_list('object_id', 'score')),
+            [(books[1].id, 5), (books[0].id, 3)]
+        )
+        self.assertEqual((board.floor, board.floor_object_id), (3, books[2].id))
+        self.assertEqual(leaderboards.top(leaderboards.BOOKS, 1), [(books[1].id, 5)])
+
+        # A left-out object tied with the last entry but ranked above it is
+        # noticed and the board rebuilt
+        Leaderboard.objects.filter(pk=board.pk).update(floor=5, floor_object_id=books[0].id)
+        self.assertEqual(leaderboards.top(leaderboards.BOOKS, 1), [(books[1].id, 5)])
+        self.assertEqual(
+            Leaderboard.objects.get(pk=board.pk).floor_object_id, books[2].id
+        )
+
+    @override_settings(LEADERBOARDS={'SIZE': 2, 'BUFFER': 1})
+    def test_leaderboard_refresh_retries_on_conflict(self):
+        """Test that a refresh losing the race to another writer reads the board again"""
+        books = [
+            Book.objects.create(
+                title=f"Raced {i}",
+                description="A reviewed book",
+                year_published=2020,
+                author=self.user,
+                review_count=count
+            )
+            for i, count in enumerate([3, 2, 0])
+        ]
+        leaderboards.rebuild(leaderboards.BOOKS)
+        Book.objects.filter(id=books[2].id).update(review_count=4)
+        ranking_of, scores_of = leaderboards.BOARDS[leaderboards.BOOKS]
+        calls = []
+
+        def racing_scores(ids):
+            calls.append(ids)
+            if len(calls) == 1:
+                # Another writer commits between this read and the write
+                Leaderboard.objects.filter(name=leaderboards.BOOKS).update(
+                    version=F('version') + 1
+                )
+            return scores_of(ids)
+
+        with mock.patch.dict(
+            leaderboards.BOARDS, {leaderboards.BOOKS: (ranking_of, racing_scores)}
+        ):
+            leaderboards.refresh(leaderboards.BOOKS, {books[2].id})
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(
+            leaderboards.top(leaderboards.BOOKS, 2), [(books[2].id, 4), (books[0].id, 3)]
+        )
+
+    def test_top_authors_leaderboard(self):
+        """Test that book mutations keep the top authors board current"""
+        other = create_test_user(username="prolific", email="prolific@example.com")
+        for i in range(2):
+            Book.objects.create(
+                title=f"Other {i}",
+                description="By someone else",
+                year_published=2020,
+                author=other
+            )
+        query = '''
+        query {
+            topAuthors {
+                rank
+                bookCount
+                author {
+                    username
+                }
+            }
+        }
+        '''
+
+        response = self.client.query(query)
+        self.assertEqual(
+            [(row['author']['username'], row['bookCount']) for row in response['data']['topAuthors']],
+            [('prolific', 2), ('testuser', 1)]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.query('''
+            mutation CreateBooks($inputs: [CreateBookInput!]!) {
+                createBooks(inputs: $inputs) {
+                    books {
+                        id
+                    }
+                }
+            }
+            ''', {'inputs': [
+                {'title': f'Mine {i}', 'description': 'More books', 'yearPublished': 2021}
+                for i in range(2)
+            ]})
+        new_ids = [int(book['id']) for book in response['data']['createBooks']['books']]
+
+        response = self.client.query(query)
+        self.assertEqual(
+            [(row['author']['username'], row['bookCount']) for row in response['data']['topAuthors']],
+            [('testuser', 3), ('prolific', 2)]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.query('''
+            mutation DeleteBooks($ids: [Int!]!) {
+                deleteBooks(ids: $ids) {
+                    success
+                }
+            }
+            ''', {'ids': new_ids})
+
+        response = self.client.query(query)
+        self.assertEqual(response['data']['topAuthors'][0]['author']['username'], 'prolific')
+
+    def test_seed_data(self):
+        """Test that seed_data inserts skewed books and reviews the API can read"""
+        call_command(
+            'seed_data', users=20, books=50, reviews=300, batch_size=40, stdout=io.StringIO()
+        )
+
+        seeded = Book.objects.filter(author__username__startswith='seed')
+        self.assertEqual(seeded.count(), 50)
+        self.assertEqual(Review.objects.filter(book__in=seeded).count(), 300)
+        self.assertFalse(Review.objects.filter(user=F('book__author')).exists())
+        # review_count was set at insert time, without the signals
+        self.assertFalse(
+            seeded.annotate(reviews_found=Count('reviews'))
+            .exclude(review_count=F('reviews_found')).exists()
+        )
+
+        # Seeded users log in with the shared password
+        client = GraphQLTestClient()
+        client.login('seed0', 'password123')
+        response = client.query('''
+        query {
+            topBooks(limit: 1) {
+                reviewCount
+            }
+        }
+        ''')
+        self.assertEqual(
+            response['data']['topBooks'][0]['reviewCount'],
+            seeded.order_by('-review_count').first().review_count
+        )
+
+        title = seeded.first().title
+        response = client.query('''
+        query Books($search: String) {
+            books(search: $search) {
+                title
+            }
+        }
+        ''', {'search': title.split()[-1]})
+        self.assertIn(title, [book['title'] for book in response['data']['books']])
@@ -0,0 +1,94 @@
+import io
+import unittest
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from books import leaderboards
+from books.models import Book
+from reviews.models import Review
+
+from .utils import GraphQLTestClient, create_test_user
+
+
+class MigrationTests(TestCase):
+    def test_migrations_match_the_models(self):
+        """Test that every model change has a committed migration"""
+        call_command('makemigrations', '--check', '--dry-run', stdout=io.StringIO())
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Query plans are read with SQLite's EXPLAIN QUERY PLAN")
+class QueryPlanTests(TestCase):
+    def setUp(self):
+        self.client = GraphQLTestClient()
+        self.user = create_test_user()
+        self.client.login('testuser', 'password123')
+        self.book = Book.objects.create(
+            title="Indexed Book",
+            description="A book to plan queries for",
+            year_published=2020,
+            author=self.user
+        )
+        Review.objects.create(text="Indexed review", user=self.user, book=self.book)
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return ' | '.join(row[-1] for row in cursor.fetchall())
+
+    def assertUsesIndex(self, query, table, index, variables=None):
+        """
+        Run ``query`` and assert the plan of its first statement reading
+        ``table`` uses ``index``
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.query(query, variables)
+        self.assertNotIn('errors', response)
+
+        statements = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('SELECT') and f'FROM "{table}"' in query['sql']
+        ]
+        self.assertTrue(statements, f"No statement read {table}")
+        plan = self.plan(statements[0])
+        self.assertIn(index, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_my_books(self):
+        """Test that myBooks reads the author's books newest first from the index"""
+        self.assertUsesIndex(
+            'query { myBooks { id title } }', 'books_book', 'book_author_recent_idx'
+        )
+
+    def test_book_reviews(self):
+        """Test that bookReviews reads one book's reviews from the index"""
+        self.assertUsesIndex(
+            'query BookReviews($id: Int!) { bookReviews(bookId: $id) { id text } }',
+            'reviews_review', 'review_book_idx', {'id': self.book.id}
+        )
+
+    def test_my_reviews(self):
+        """Test that myReviews reads the user's reviews from the index"""
+        self.assertUsesIndex(
+            'query { myReviews { id text } }', 'reviews_review', 'review_user_idx'
+        )
+
+    def test_books_by_year(self):
+        """Test that booksConnection pages by year along the index"""
+        self.assertUsesIndex(
+            'query { booksConnection(orderBy: YEAR_PUBLISHED, first: 10) { edges { node { id } } } }',
+            'books_book', 'book_year_idx'
+        )
+
+    def test_top_books_rebuild(self):
+        """Test that rebuilding the top books board reads the ranking index"""
+        with CaptureQueriesContext(connection) as context:
+            leaderboards.rebuild(leaderboards.BOOKS)
+
+        statements = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('SELECT') and '"review_count"' in query['sql']
+        ]
+        self.assertIn('book_review_rank_idx', self.plan(statements[0]))
@@ -1,9 +1,19 @@
+import hashlib
+import io
+import json
 import os
 import tempfile
-from django.test import TestCase, override_settings
+from unittest import mock
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import StopUpload
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
 from .utils import GraphQLTestClient, create_test_user
-from profiles.models import Profile
+from graphdj import uploads
+from profiles import thumbnails
+from profiles.models import ImageBlob, Profile
 
 # Create a temporary media directory for testing file uploads
 TEMP_MEDIA_ROOT = tempfile.mkdtemp()
@@ -137,3 +147,400 @@ class ProfileTests(TestCase):
         
         # Verify profile was deleted from the database
         self.assertFalse(Profile.objects.filter(id=profile.id).exists())
+
+
+def create_test_image(name='photo.png', size=(600, 300), color='red', noise=False):
+    """
+    Create an uploadable PNG of the given size; noise makes it incompressible
+    """
+    if noise:
+        image = Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3))
+    else:
+        image = Image.new('RGB', size, color)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return SimpleUploadedFile(name=name, content=buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    PROFILE_THUMBNAILS={'SIZES': [64, 512], 'FORMATS': ['webp', 'jpeg'], 'MAX_WORKERS': 0},
+)
+class ProfileThumbnailTests(TestCase):
+    create_mutation = '''
+    mutation CreateProfile($file: Upload!) {
+        createProfile(file: $file) {
+            profile {
+                id
+            }
+        }
+    }
+    '''
+    update_mutation = '''
+    mutation UpdateProfile($id: Int!, $file: Upload!) {
+        updateProfile(id: $id, file: $file) {
+            success
+        }
+    }
+    '''
+
+    def setUp(self):
+        self.client = GraphQLTestClient()
+        self.user = create_test_user()
+        self.client.login('testuser', 'password123')
+
+    def tearDown(self):
+        for root, dirs, files in os.walk(TEMP_MEDIA_ROOT):
+            for file in files:
+                os.remove(os.path.join(root, file))
+
+    def create_profile(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.upload(
+                self.create_mutation, {'file': [None]}, {'variables.file.0': create_test_image()}
+            )
+        self.assertNotIn('errors', response)
+        return Profile.objects.get(id=response['data']['createProfile']['profile']['id'])
+
+    def stored(self, name):
+        return os.path.exists(os.path.join(TEMP_MEDIA_ROOT, name))
+
+    def test_create_profile_renders_thumbnails(self):
+        """Test that uploads are rendered to every configured size and format"""
+        profile = self.create_profile()
+
+        self.assertEqual(sorted(profile.thumbnails), ['512.jpeg', '512.webp', '64.jpeg', '64.webp'])
+        with Image.open(os.path.join(TEMP_MEDIA_ROOT, profile.thumbnails['512.webp'])) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (512, 256)))
+        with Image.open(os.path.join(TEMP_MEDIA_ROOT, profile.thumbnails['64.jpeg'])) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (64, 32)))
+
+        response = self.client.query('''
+        query Thumbnails($id: Int!) {
+            profile(id: $id) {
+                small: thumbnail(size: 48)
+                large: thumbnail(size: 2000, format: "jpeg")
+            }
+        }
+        ''', {'id': profile.id})
+
+        self.assertNotIn('errors', response)
+        self.assertEqual(response['data']['profile'], {
+            'small': '/media/' + profile.thumbnails['64.webp'],
+            'large': '/media/' + profile.thumbnails['512.jpeg'],
+        })
+
+    def test_thumbnail_falls_back_to_original(self):
+        """Test that unrendered profiles serve the original and bad formats fail"""
+        profile = Profile.objects.create(name="Plain", image=create_test_image(), user=self.user)
+        query = '''
+        query Thumbnail($id: Int!, $format: String!) {
+            profile(id: $id) {
+                thumbnail(size: 64, format: $format)
+            }
+        }
+        '''
+
+        response = self.client.query(query, {'id': profile.id, 'format': 'webp'})
+        self.assertEqual(response['data']['profile']['thumbnail'], profile.image.url)
+
+        response = self.client.query(query, {'id': profile.id, 'format': 'bmp'})
+        self.assertIn('Unsupported thumbnail format', response['errors'][0]['message'])
+
+    def test_update_and_delete_clean_up_thumbnails(self):
+        """Test that replaced and deleted images take their variants along"""
+        profile = self.create_profile()
+        old_image = profile.image.name
+        old_variants = list(profile.thumbnails.values())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.upload(
+                self.update_mutation,
+                {'id': profile.id, 'file': [None]},
+                {'variables.file.0': create_test_image('new.png', color='blue')},
+            )
+        self.assertTrue(response['data']['updateProfile']['success'])
+
+        profile.refresh_from_db()
+        self.assertNotEqual(profile.image.name, old_image)
+        self.assertFalse(self.stored(old_image))
+        self.assertTrue(all(not self.stored(name) for name in old_variants))
+        self.assertTrue(all(self.stored(name) for name in profile.thumbnails.values()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.query(
+                'mutation Delete($id: Int!) { deleteProfile(id: $id) { success } }', {'id': profile.id}
+            )
+        self.assertTrue(response['data']['deleteProfile']['success'])
+        self.assertFalse(self.stored(profile.image.name))
+        self.assertTrue(all(not self.stored(name) for name in profile.thumbnails.values()))
+
+    def test_stale_render_is_discarded(self):
+        """Test that a render finishing after the image changed leaves nothing behind"""
+        profile = Profile.objects.create(name="Racy", image=create_test_image(), user=self.user)
+        original = profile.image.name
+        Profile.objects.filter(pk=profile.pk).update(image='profileImages/other.png')
+
+        rendered = thumbnails.generate(profile.pk, original)
+
+        self.assertEqual(Profile.objects.get(pk=profile.pk).thumbnails, {})
+        self.assertTrue(all(not self.stored(name) for name in rendered.values()))
+
+    def test_generate_profile_thumbnails_command(self):
+        """Test that the command renders profiles created without the mutations"""
+        profile = Profile.objects.create(name="Imported", image=create_test_image(), user=self.user)
+
+        call_command('generate_profile_thumbnails', stdout=io.StringIO())
+
+        profile.refresh_from_db()
+        self.assertEqual(len(profile.thumbnails), 4)
+        self.assertTrue(all(self.stored(name) for name in profile.thumbnails.values()))
+
+        # --all replaces the variants already stored, under the same names
+        variant = thumbnails.get_storage().path(profile.thumbnails['64.webp'])
+        with open(variant, 'wb') as f:
+            f.write(b'stale')
+        call_command('generate_profile_thumbnails', all=True, stdout=io.StringIO())
+
+        rendered = profile.thumbnails
+        profile.refresh_from_db()
+        self.assertEqual(profile.thumbnails, rendered)
+        with open(variant, 'rb') as f:
+            self.assertNotEqual(f.read(), b'stale')
+
+    def test_background_failures_are_logged(self):
+        """Test that a render failing on the thread pool is logged, not lost"""
+        with mock.patch.object(thumbnails, 'generate', side_effect=OSError('disk full')), \
+                self.assertLogs('profiles.thumbnails', 'ERROR') as logs:
+            thumbnails._run(1, 'profileImages/missing.png')
+
+        self.assertIn('Could not render the thumbnails of profile 1', logs.output[0])
+        self.assertIn('disk full', logs.output[0])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ProfileUploadTests(TestCase):
+    mutation = ProfileThumbnailTests.create_mutation
+
+    def setUp(self):
+        self.client = GraphQLTestClient()
+        self.user = create_test_user()
+        self.token = self.client.login('testuser', 'password123')
+
+    def tearDown(self):
+        for root, dirs, files in os.walk(TEMP_MEDIA_ROOT):
+            for file in files:
+                os.remove(os.path.join(root, file))
+
+    def post(self, file):
+        """
+        Post a createProfile multipart request, returning the raw response
+        """
+        return self.client.client.post('/graphql/', {
+            'operations': json.dumps({'query': self.mutation, 'variables': {'file': [None]}}),
+            'map': json.dumps({'0': ['variables.file.0']}),
+            '0': file,
+        }, HTTP_AUTHORIZATION=f'JWT {self.token}')
+
+    def assertRejected(self, response, status, message):
+        self.assertEqual(response.status_code, status)
+        self.assertIn(message, response.json()['errors'][0]['message'])
+        self.assertFalse(Profile.objects.exists())
+
+    def test_valid_upload(self):
+        """Test that images within the limits are accepted"""
+        response = self.post(create_test_image())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('errors', response.json())
+        self.assertTrue(Profile.objects.filter(user=self.user).exists())
+
+    @override_settings(GRAPHQL_UPLOADS={'MAX_FILE_SIZE': 10000})
+    def test_file_size_limit(self):
+        """Test that files over the per-file limit are rejected while streaming"""
+        response = self.post(create_test_image(size=(200, 200), noise=True))
+
+        self.assertRejected(response, 413, 'larger than 10000 bytes')
+
+    @override_settings(GRAPHQL_UPLOADS={'MAX_REQUEST_SIZE': 1000})
+    def test_request_size_limit(self):
+        """Test that request bodies over the limit are refused before parsing"""
+        response = self.post(create_test_image(size=(200, 200), noise=True))
+
+        self.assertRejected(response, 413, 'Request body is larger than 1000 bytes')
+
+    def test_non_image_upload(self):
+        """Test that files that are not images are rejected"""
+        response = self.post(SimpleUploadedFile('notes.png', b'just some text', 'image/png'))
+
+        self.assertRejected(response, 400, 'notes.png is not a supported image')
+
+    @override_settings(GRAPHQL_UPLOADS={'MAX_DIMENSION': 100})
+    def test_dimension_limit(self):
+        """Test that images over the dimension limit are rejected"""
+        response = self.post(create_test_image(size=(300, 50)))
+
+        self.assertRejected(response, 400, 'larger than 100x100 pixels')
+
+    @override_settings(GRAPHQL_UPLOADS={'MAX_DIMENSION': 100})
+    def test_rejection_from_the_first_chunk(self):
+        """Test that the header check stops the upload on the first chunk"""
+        content = create_test_image(size=(400, 400), noise=True).read()
+        handler = uploads.ImageUploadHandler(RequestFactory().post('/graphql/'))
+        chunk_size = handler.chunk_size
+        self.assertGreater(len(content), 2 * chunk_size)
+
+        handler.new_file('0', 'big.png', 'image/png', len(content))
+        with self.assertRaises(StopUpload):
+            handler.receive_data_chunk(content[:chunk_size], 0)
+
+        self.assertEqual(handler.file_size, chunk_size)
+        self.assertEqual(handler.request._upload_rejection.status, 400)
+        handler.upload_interrupted()
+
+    def test_uploads_are_written_to_temporary_files(self):
+        """Test that accepted files are streamed to disk rather than memory"""
+        content = create_test_image().read()
+        handler = uploads.ImageUploadHandler(RequestFactory().post('/graphql/'))
+
+        handler.new_file('0', 'photo.png', 'image/png', len(content))
+        for start in range(0, len(content), 100):
+            handler.receive_data_chunk(content[start:start + 100], start)
+        file = handler.file_complete(len(content))
+
+        with open(file.temporary_file_path(), 'rb') as stored:
+            self.assertEqual(stored.read(), content)
+        file.close()
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    PROFILE_THUMBNAILS={'SIZES': [64], 'FORMATS': ['webp'], 'MAX_WORKERS': 0},
+)
+class ProfileImageStoreTests(TestCase):
+    def setUp(self):
+        self.users, self.clients = [], []
+        for username in ('first', 'second'):
+            self.users.append(create_test_user(username=username, email=f'{username}@example.com'))
+            client = GraphQLTestClient()
+            client.login(username, 'password123')
+            self.clients.append(client)
+        self.content = create_test_image(noise=True).read()
+
+    def tearDown(self):
+        for root, dirs, files in os.walk(TEMP_MEDIA_ROOT):
+            for file in files:
+                os.remove(os.path.join(root, file))
+
+    def stored(self, name):
+        return os.path.exists(os.path.join(TEMP_MEDIA_ROOT, name))
+
+    def upload(self, client, mutation, variables, content, name='avatar.png'):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.upload(
+                mutation, {**variables, 'file': [None]},
+                {'variables.file.0': SimpleUploadedFile(name, content, 'image/png')},
+            )
+        self.assertNotIn('errors', response)
+        return response['data']
+
+    def create_profile(self, client, content, name='avatar.png'):
+        data = self.upload(client, ProfileThumbnailTests.create_mutation, {}, content, name)
+        return Profile.objects.get(id=data['createProfile']['profile']['id'])
+
+    def delete_profile(self, client, profile):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.query(
+                'mutation Delete($id: Int!) { deleteProfile(id: $id) { success } }', {'id': profile.id}
+            )
+        self.assertTrue(response['data']['deleteProfile']['success'])
+
+    def test_identical_uploads_share_one_blob(self):
+        """Test that identical uploads are stored once under their content hash"""
+        first = self.create_profile(self.clients[0], self.content, 'mine.png')
+        second = self.create_profile(self.clients[1], self.content, 'theirs.png')
+
+        digest = hashlib.sha256(self.content).hexdigest()
+        self.assertEqual(first.image.name, f'profileImages/{digest}.png')
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(second.thumbnails, first.thumbnails)
+        self.assertEqual(os.listdir(os.path.join(TEMP_MEDIA_ROOT, 'profileImages')), [f'{digest}.png'])
+        self.assertEqual(ImageBlob.objects.get(content_hash=digest).references, 2)
+
+    def test_blob_is_deleted_with_its_last_reference(self):
+        """Test that deleting or replacing an image keeps blobs others still use"""
+        first = self.create_profile(self.clients[0], self.content)
+        second = self.create_profile(self.clients[1], self.content)
+        name, variants = first.image.name, list(first.thumbnails.values())
+
+        self.delete_profile(self.clients[0], first)
+
+        self.assertEqual(ImageBlob.objects.get(name=name).references, 1)
+        self.assertTrue(self.stored(name))
+        self.assertTrue(all(self.stored(variant) for variant in variants))
+
+        self.upload(
+            self.clients[1], ProfileThumbnailTests.update_mutation, {'id': second.id},
+            create_test_image(color='green').read(),
+        )
+
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+        self.assertFalse(self.stored(name))
+        self.assertTrue(all(not self.stored(variant) for variant in variants))
+
+    def test_reuploading_the_same_image(self):
+        """Test that updating a profile with its current image keeps the blob"""
+        profile = self.create_profile(self.clients[0], self.content)
+
+        self.upload(
+            self.clients[0], ProfileThumbnailTests.update_mutation, {'id': profile.id}, self.content
+        )
+
+        profile.refresh_from_db()
+        self.assertTrue(self.stored(profile.image.name))
+        self.assertEqual(ImageBlob.objects.get(name=profile.image.name).references, 1)
+
+    def test_image_metadata_is_read_without_the_file(self):
+        """Test that image fields come from the columns filled at upload time"""
+        for client in self.clients:
+            profile = self.create_profile(client, self.content)
+        query = '''
+        query {
+            profiles {
+                imageUrl
+                width
+                height
+                byteSize
+                contentHash
+                thumbnail(size: 64)
+            }
+        }
+        '''
+        untouchable = mock.Mock(side_effect=AssertionError('the file was accessed'))
+
+        with mock.patch.object(FileSystemStorage, 'open', untouchable), \
+                mock.patch.object(FileSystemStorage, 'size', untouchable), \
+                mock.patch.object(FileSystemStorage, 'exists', untouchable), \
+                mock.patch.object(Image, 'open', untouchable):
+            response = self.clients[0].query(query)
+
+        self.assertNotIn('errors', response)
+        self.assertEqual(response['data']['profiles'], [{
+            'imageUrl': '/media/' + profile.image.name,
+            'width': 600,
+            'height': 300,
+            'byteSize': len(self.content),
+            'contentHash': hashlib.sha256(self.content).hexdigest(),
+            'thumbnail': '/media/' + profile.thumbnails['64.webp'],
+        }] * 2)
+
+    def test_images_stored_before_deduplication(self):
+        """Test that profiles without a blob still delete their own image"""
+        profile = Profile.objects.create(
+            name="Legacy", image=create_test_image('legacy.png'), user=self.users[0]
+        )
+        name = profile.image.name
+
+        self.delete_profile(self.clients[0], profile)
+
+        self.assertFalse(self.stored(name))
@@ -1,5 +1,10 @@
 from django.contrib.auth import get_user_model
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from books.models import Book
 from reviews.models import Review
@@ -235,3 +240,216 @@ class ReviewTests(TestCase):
 
         # Should get an error because users can't review their own books
         self.assertIn('errors', response)
+
+    def test_reviews_batch_related_lookups(self):
+        """Test that review users and books are loaded in one query per type"""
+        query = '''
+        query {
+            reviews {
+                text
+                user {
+                    username
+                }
+                book {
+                    title
+                    author {
+                        username
+                    }
+                }
+            }
+        }
+        '''
+
+        # Warm up authentication so both runs only count resolver queries
+        self.client.query(query)
+        with CaptureQueriesContext(connection) as single:
+            self.client.query(query)
+
+        for i in range(5):
+            user = create_test_user(username=f"reader{i}", email=f"reader{i}@example.com")
+            book = Book.objects.create(
+                title=f"Book {i}",
+                description="Another book",
+                year_published=2020,
+                author=self.author
+            )
+            Review.objects.create(text=f"Review {i}", user=user, book=book)
+
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.query(query)
+
+        self.assertNotIn('errors', response)
+        self.assertEqual(len(response['data']['reviews']), 6)
+        self.assertEqual(response['data']['reviews'][-1]['user']['username'], 'reader4')
+        self.assertEqual(response['data']['reviews'][-1]['book']['author']['username'], 'bookauthor')
+        self.assertEqual(len(many), len(single))
+
+    def test_query_budgets(self):
+        """Test that review queries run a fixed number of SQL statements however many rows they return"""
+        for i in range(5):
+            user = create_test_user(username=f"budget{i}", email=f"budget{i}@example.com")
+            Review.objects.create(text=f"Review {i}", user=user, book=self.book)
+            Review.objects.create(
+                text=f"Own review {i}",
+                user=self.reviewer,
+                book=Book.objects.create(
+                    title=f"Budget Book {i}",
+                    description="One of many",
+                    year_published=2020,
+                    author=user
+                )
+            )
+
+        self.client.assert_query_budget(2, '''
+        query {
+            reviews {
+                text
+                user {
+                    username
+                }
+                book {
+                    title
+                    author {
+                        username
+                    }
+                }
+            }
+        }
+        ''')
+        self.client.assert_query_budget(1, 'query { myReviews { text book { title } } }')
+        self.client.assert_query_budget(
+            2, 'query Reviews($id: Int!) { bookReviews(bookId: $id) { text user { username } } }',
+            {'id': self.book.id}
+        )
+
+    def test_create_reviews_in_bulk(self):
+        """Test that createReviews validates every input before inserting"""
+        other_book = Book.objects.create(
+            title="Reviewer's Book",
+            description="Written by the reviewer",
+            year_published=2022,
+            author=self.reviewer
+        )
+        mutation = '''
+        mutation CreateReviews($inputs: [CreateReviewInput!]!) {
+            createReviews(inputs: $inputs) {
+                success
+                reviews {
+                    text
+                    book {
+                        title
+                    }
+                }
+                errors {
+                    index
+                    errors
+                }
+            }
+        }
+        '''
+        inputs = [
+            {'text': 'First', 'bookId': self.book.id},
+            {'text': 'Own book', 'bookId': other_book.id},
+            {'text': 'Missing book', 'bookId': 0},
+        ]
+
+        response = self.client.query(mutation, {'inputs': inputs})
+
+        result = response['data']['createReviews']
+        self.assertFalse(result['success'])
+        self.assertEqual(result['errors'], [
+            {'index': 1, 'errors': ['You cannot review your own book']},
+            {'index': 2, 'errors': ["Book with this id doesn't exist"]},
+        ])
+        self.assertEqual(Review.objects.count(), 1)
+
+        response = self.client.query(mutation, {'inputs': [inputs[0], {'text': 'Second', 'bookId': self.book.id}]})
+
+        result = response['data']['createReviews']
+        self.assertTrue(result['success'])
+        self.assertEqual([review['text'] for review in result['reviews']], ['First', 'Second'])
+        self.assertEqual(result['reviews'][0]['book']['title'], 'Book to Review')
+        self.assertEqual(Review.objects.filter(book=self.book).count(), 3)
+
+    def test_delete_reviews_in_bulk(self):
+        """Test that deleteReviews checks ownership in one statement"""
+        mutation = '''
+        mutation DeleteReviews($ids: [Int!]!) {
+            deleteReviews(ids: $ids) {
+                success
+                deleted
+                denied
+                missing
+            }
+        }
+        '''
+        other = create_test_user(username="other", email="other@example.com")
+        foreign = Review.objects.create(text="Not mine", user=other, book=self.book)
+        mine = [
+            Review.objects.create(text=f"Mine {i}", user=self.reviewer, book=self.book).id
+            for i in range(3)
+        ]
+        # Warm up authentication so only the mutation's queries are counted
+        self.client.query('query { myReviews { id } }')
+
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.query(mutation, {'ids': mine[:1]})
+        self.assertTrue(response['data']['deleteReviews']['success'])
+
+        ids = mine[1:] + [self.review.id, foreign.id, 0]
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.query(mutation, {'ids': ids})
+
+        result = response['data']['deleteReviews']
+        self.assertFalse(result['success'])
+        self.assertEqual(result['deleted'], sorted(mine[1:] + [self.review.id]))
+        self.assertEqual(result['denied'], [foreign.id])
+        self.assertEqual(result['missing'], [0])
+        self.assertEqual(list(Review.objects.values_list('id', flat=True)), [foreign.id])
+        # One more query to tell denied ids from missing ones, whatever the count
+        self.assertEqual(len(many), len(few) + 1)
+
+    def test_review_count_is_maintained(self):
+        """Test the denormalized review count and its repair command"""
+        query = f'''
+        query {{
+            book(id: {self.book.id}) {{
+                reviewCount
+            }}
+        }}
+        '''
+        # setUp wrote its review straight through the ORM
+        self.assertEqual(self.client.query(query)['data']['book']['reviewCount'], 0)
+
+        out = StringIO()
+        call_command('repair_review_aggregates', batch_size=1, stdout=out)
+        self.assertIn('1 book(s)', out.getvalue())
+        self.assertEqual(self.client.query(query)['data']['book']['reviewCount'], 1)
+
+        response = self.client.query('''
+        mutation CreateReview($input: CreateReviewInput!) {
+            createReview(createReviewInput: $input) {
+                review {
+                    id
+                    book {
+                        reviewCount
+                    }
+                }
+            }
+        }
+        ''', {'input': {'text': 'Counted', 'bookId': self.book.id}})
+        self.assertEqual(response['data']['createReview']['review']['book']['reviewCount'], 2)
+
+        response = self.client.query('''
+        mutation DeleteReviews($ids: [Int!]!) {
+            deleteReviews(ids: $ids) {
+                success
+            }
+        }
+        ''', {'ids': [self.review.id, int(response['data']['createReview']['review']['id'])]})
+        self.assertTrue(response['data']['deleteReviews']['success'])
+        self.assertEqual(self.client.query(query)['data']['book']['reviewCount'], 0)
+
+        out = StringIO()
+        call_command('repair_review_aggregates', stdout=out)
+        self.assertIn('0 book(s)', out.getvalue())
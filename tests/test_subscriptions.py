@@ -0,0 +1,174 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.test import TransactionTestCase
+
+from books.models import Book
+from graphdj import pubsub
+from graphdj.subscriptions import websocket_application
+from reviews import events
+
+from .utils import GraphQLTestClient, WebSocketTestClient, create_test_user
+
+
+class SubscriptionTests(TransactionTestCase):
+    subscription = '''
+    subscription ReviewAdded($bookId: Int!) {
+        reviewAdded(bookId: $bookId) {
+            id
+            user {
+                username
+            }
+        }
+    }
+    '''
+
+    def setUp(self):
+        self.client = GraphQLTestClient()
+        self.author = create_test_user(username="bookauthor", email="author@example.com")
+        self.reviewer = create_test_user(username="reviewer", email="reviewer@example.com")
+        self.token = self.client.login('reviewer', 'password123')
+        self.book = Book.objects.create(
+            title="Book to Watch",
+            description="A book with live reviews",
+            year_published=2023,
+            author=self.author
+        )
+
+    def tearDown(self):
+        # Unindex through the signals; flushing would leave the search index behind
+        Book.objects.all().delete()
+
+    async def open_socket(self, payload=None):
+        socket = WebSocketTestClient(websocket_application)
+        accepted = await socket.connect()
+        self.assertEqual(accepted['subprotocol'], 'graphql-transport-ws')
+        await socket.send_json({'type': 'connection_init', 'payload': payload or {}})
+        self.assertEqual(await socket.receive_json(), {'type': 'connection_ack'})
+        return socket
+
+    async def subscribe(self, socket, id, query, variables, event):
+        await socket.send_json({
+            'id': id,
+            'type': 'subscribe',
+            'payload': {'query': query, 'variables': variables},
+        })
+        channel = events.channel(variables['bookId'], event)
+        while not pubsub.get_backend().subscriber_count(channel):
+            await asyncio.sleep(0.01)
+
+    async def mutate(self, query, variables):
+        response = await sync_to_async(self.client.query)(query, variables)
+        self.assertNotIn('errors', response)
+        return response['data']
+
+    async def test_review_mutations_are_streamed(self):
+        """Test that creating, updating and deleting a review reach subscribers"""
+        socket = await self.open_socket({'Authorization': f'JWT {self.token}'})
+        variables = {'bookId': self.book.id}
+        await self.subscribe(socket, 'added', self.subscription, variables, events.ADDED)
+        await self.subscribe(socket, 'updated', '''
+        subscription ($bookId: Int!) { reviewUpdated(bookId: $bookId) { id text } }
+        ''', variables, events.UPDATED)
+        await self.subscribe(socket, 'deleted', '''
+        subscription ($bookId: Int!) { reviewDeleted(bookId: $bookId) }
+        ''', variables, events.DELETED)
+
+        data = await self.mutate('''
+        mutation CreateReview($input: CreateReviewInput!) {
+            createReview(createReviewInput: $input) { review { id } }
+        }
+        ''', {'input': {'bookId': self.book.id, 'text': 'Live review'}})
+        review_id = data['createReview']['review']['id']
+
+        message = await socket.receive_json()
+        self.assertEqual(message['id'], 'added')
+        self.assertEqual(message['type'], 'next')
+        self.assertEqual(message['payload']['data']['reviewAdded'], {
+            'id': review_id, 'user': {'username': 'reviewer'}
+        })
+
+        await self.mutate('''
+        mutation UpdateReview($input: UpdateReviewInput!) {
+            updateReview(updateReviewInput: $input) { review { id } }
+        }
+        ''', {'input': {'reviewId': int(review_id), 'text': 'Edited'}})
+
+        message = await socket.receive_json()
+        self.assertEqual(message['id'], 'updated')
+        self.assertEqual(message['payload']['data']['reviewUpdated']['text'], 'Edited')
+
+        await self.mutate('''
+        mutation DeleteReview($id: Int!) { deleteReview(reviewId: $id) { success } }
+        ''', {'id': int(review_id)})
+
+        message = await socket.receive_json()
+        self.assertEqual(message['id'], 'deleted')
+        self.assertEqual(message['payload']['data']['reviewDeleted'], int(review_id))
+
+        await socket.disconnect()
+
+    async def test_other_books_and_completed_subscriptions(self):
+        """Test that events are filtered by book and stop after complete"""
+        other = await Book.objects.acreate(
+            title="Other Book",
+            description="Nobody watches this one",
+            year_published=2020,
+            author=self.author
+        )
+        socket = await self.open_socket()
+        await self.subscribe(socket, '1', self.subscription, {'bookId': self.book.id}, events.ADDED)
+
+        await sync_to_async(pubsub.publish)(events.channel(other.id, events.ADDED), {'review_id': 0})
+        await socket.send_json({'type': 'ping'})
+        self.assertEqual(await socket.receive_json(), {'type': 'pong'})
+
+        await socket.send_json({'id': '1', 'type': 'complete'})
+        channel = events.channel(self.book.id, events.ADDED)
+        while pubsub.get_backend().subscriber_count(channel):
+            await asyncio.sleep(0.01)
+
+        await socket.disconnect()
+
+    async def test_protocol_errors(self):
+        """Test unauthenticated subscribes, bad tokens, bad variables and ids, and non-subscriptions"""
+        socket = WebSocketTestClient(websocket_application)
+        await socket.connect()
+        await socket.send_json({'id': '1', 'type': 'subscribe', 'payload': {'query': self.subscription}})
+        self.assertEqual((await socket.receive())['code'], 4401)
+        await socket.disconnect()
+
+        socket = WebSocketTestClient(websocket_application)
+        await socket.connect()
+        await socket.send_json({'type': 'connection_init', 'payload': {'Authorization': 'JWT nope'}})
+        self.assertEqual((await socket.receive())['code'], 4403)
+        await socket.disconnect()
+
+        socket = await self.open_socket()
+        await socket.send_json({'id': '1', 'type': 'subscribe', 'payload': {'query': '{ books { id } }'}})
+        message = await socket.receive_json()
+        self.assertEqual(message['type'], 'error')
+        await socket.send_json({
+            'id': '2', 'type': 'subscribe',
+            'payload': {'query': self.subscription, 'variables': {'bookId': 0}},
+        })
+        message = await socket.receive_json()
+        self.assertEqual(message['type'], 'error')
+        self.assertIn("doesn't exist", message['payload'][0]['message'])
+        await socket.send_json({
+            'id': '3', 'type': 'subscribe',
+            'payload': {'query': self.subscription, 'variables': [1]},
+        })
+        message = await socket.receive_json()
+        self.assertEqual(message['type'], 'error')
+        self.assertEqual(message['payload'][0]['message'], 'Variables must be an object.')
+        await socket.send_json({'id': ['1'], 'type': 'complete'})
+        self.assertEqual((await socket.receive())['code'], 4400)
+        await socket.disconnect()
+
+    def test_subscriptions_are_not_served_over_http(self):
+        """Test that the HTTP endpoint refuses subscription operations"""
+        response = self.client.query(self.subscription, {'bookId': self.book.id})
+
+        self.assertIn('errors', response)
+        self.assertNotIn('data', response)
@@ -5,8 +5,25 @@ from django.test.runner import DiscoverRunner
 # Import all test modules
 from .test_auth import AuthenticationTests
 from .test_books import BookTests
+from .test_migrations import MigrationTests, QueryPlanTests
 from .test_reviews import ReviewTests
-from .test_profiles import ProfileTests
+from .test_profiles import (
+    ProfileImageStoreTests,
+    ProfileTests,
+    ProfileThumbnailTests,
+    ProfileUploadTests,
+)
+from .test_subscriptions import SubscriptionTests
+from .test_view import (
+    AsyncViewTests,
+    DocumentCacheTests,
+    MetricsTests,
+    PersistedQueryTests,
+    ProfilingTests,
+    QueryCostTests,
+    QueryStatsTests,
+    ResponseCacheTests,
+)
 
 def suite():
     """
@@ -19,6 +36,20 @@ def suite():
     test_suite.addTest(unittest.makeSuite(BookTests))
     test_suite.addTest(unittest.makeSuite(ReviewTests))
     test_suite.addTest(unittest.makeSuite(ProfileTests))
+    test_suite.addTest(unittest.makeSuite(ProfileThumbnailTests))
+    test_suite.addTest(unittest.makeSuite(ProfileUploadTests))
+    test_suite.addTest(unittest.makeSuite(ProfileImageStoreTests))
+    test_suite.addTest(unittest.makeSuite(SubscriptionTests))
+    test_suite.addTest(unittest.makeSuite(PersistedQueryTests))
+    test_suite.addTest(unittest.makeSuite(DocumentCacheTests))
+    test_suite.addTest(unittest.makeSuite(QueryCostTests))
+    test_suite.addTest(unittest.makeSuite(ResponseCacheTests))
+    test_suite.addTest(unittest.makeSuite(QueryStatsTests))
+    test_suite.addTest(unittest.makeSuite(MetricsTests))
+    test_suite.addTest(unittest.makeSuite(ProfilingTests))
+    test_suite.addTest(unittest.makeSuite(AsyncViewTests))
+    test_suite.addTest(unittest.makeSuite(MigrationTests))
+    test_suite.addTest(unittest.makeSuite(QueryPlanTests))
     
     return test_suite
 
@@ -0,0 +1,837 @@
+import hashlib
+import json
+import os
+import pstats
+import tempfile
+import threading
+from unittest import mock
+
+import graphene
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from graphql import parse
+
+from books.models import Book
+from profiles.models import Profile
+from reviews.models import Review
+from graphdj import metrics, response_cache
+from graphdj.document_cache import DocumentCache
+from graphdj.schema import Query, schema
+from graphdj.views import AsyncGraphQLView, GraphQLView
+
+from .utils import GraphQLTestClient, create_test_user
+
+
+class PersistedQueryTests(TestCase):
+    query = 'query { books { title } }'
+
+    def setUp(self):
+        caches['persisted-queries'].clear()
+        caches['responses'].clear()
+        self.client = GraphQLTestClient()
+        self.user = create_test_user()
+        Book.objects.create(
+            title="Persisted Book",
+            description="A book behind a persisted query",
+            year_published=2023,
+            author=self.user
+        )
+        self.extensions = {
+            'persistedQuery': {
+                'version': 1,
+                'sha256Hash': hashlib.sha256(self.query.encode()).hexdigest()
+            }
+        }
+
+    def test_hash_only_request_negotiation(self):
+        """Test that an unknown hash is reported and then registered"""
+        response = self.client.query(None, extensions=self.extensions)
+        self.assertEqual(
+            response['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_NOT_FOUND'
+        )
+
+        response = self.client.query(self.query, extensions=self.extensions)
+        self.assertNotIn('errors', response)
+
+        response = self.client.query(None, extensions=self.extensions)
+        self.assertNotIn('errors', response)
+        self.assertEqual(response['data']['books'][0]['title'], 'Persisted Book')
+
+    def test_hash_mismatch_is_rejected(self):
+        """Test that a query is not stored under somebody else's hash"""
+        response = self.client.query('query { reviews { id } }', extensions=self.extensions)
+        self.assertIn('errors', response)
+
+        response = self.client.query(None, extensions=self.extensions)
+        self.assertEqual(
+            response['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_NOT_FOUND'
+        )
+
+    def test_persisted_query_over_get(self):
+        """Test that anonymous persisted GET requests are cacheable"""
+        self.client.query(self.query, extensions=self.extensions)
+
+        response = self.client.client.get(
+            '/graphql/',
+            {'extensions': json.dumps(self.extensions)},
+            HTTP_ACCEPT='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data['data']['books'][0]['title'], 'Persisted Book')
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('Authorization', response['Vary'])
+
+
+class DocumentCacheTests(TestCase):
+    def setUp(self):
+        self.client = GraphQLTestClient()
+        self.cache = GraphQLView.document_cache
+
+    def test_repeated_documents_hit_the_cache(self):
+        """Test that a repeated document is parsed and validated once"""
+        query = 'query { books { title } }'
+        self.client.query(query)
+        before = self.cache.info()
+
+        response = self.client.query(query)
+
+        self.assertNotIn('errors', response)
+        after = self.cache.info()
+        self.assertEqual(after.hits, before.hits + 1)
+        self.assertEqual(after.misses, before.misses)
+
+    def test_validation_errors_are_cached(self):
+        """Test that invalid documents keep failing from the cache"""
+        for _ in range(2):
+            response = self.client.query('query { books { noSuchField } }')
+            self.assertIn('errors', response)
+
+    def test_cache_is_bounded_and_follows_schema(self):
+        """Test LRU eviction and invalidation on a new schema object"""
+        cache = DocumentCache(maxsize=2)
+        graphql_schema = schema.graphql_schema
+        for field in ('books', 'reviews', 'profiles'):
+            cache.get(graphql_schema, f'query {{ {field} {{ id }} }}')
+        self.assertEqual(cache.info().currsize, 2)
+
+        cache.get(graphql_schema, 'query { profiles { id } }')
+        self.assertEqual(cache.info().hits, 1)
+
+        other = graphene.Schema(query=Query).graphql_schema
+        cache.get(other, 'query { profiles { id } }')
+        self.assertEqual(cache.info().currsize, 1)
+        self.assertEqual(cache.info().misses, 4)
+
+
+class QueryCostTests(TestCase):
+    def setUp(self):
+        self.client = GraphQLTestClient()
+
+    def test_cost_is_reported_in_extensions(self):
+        """Test that the computed cost is returned with the response"""
+        response = self.client.query('query { booksConnection(first: 10) { edges { node { author { username } } } } }')
+
+        self.assertNotIn('errors', response)
+        # booksConnection + edges + 10 * (node + author)
+        self.assertEqual(response['extensions']['cost'], {'cost': 22, 'depth': 5})
+
+    def test_variables_must_be_an_object(self):
+        """Test that list or string variables are a GraphQL error, not a crash"""
+        query = 'query Books($first: Int) { books(first: $first) { id } }'
+        for variables in ([1], '[1]'):
+            response = self.client.client.post(
+                '/graphql/',
+                json.dumps({'query': query, 'variables': variables}),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(
+                json.loads(response.content)['errors'][0]['message'], 'Variables must be an object.'
+            )
+
+    def test_page_size_variables_drive_the_multiplier(self):
+        """Test that first passed as a variable is used as the list size"""
+        query = '''
+        query Books($first: Int) {
+            books(first: $first) {
+                reviews {
+                    id
+                }
+            }
+        }
+        '''
+
+        response = self.client.query(query, {'first': 3})
+
+        self.assertEqual(response['extensions']['cost']['cost'], 2 + 3 * 1)
+
+    def test_variable_defaults_drive_the_multiplier(self):
+        """Test that a page size left to the variable's default uses the default"""
+        query = '''
+        query Books($first: Int = 3) {
+            books(first: $first) {
+                reviews {
+                    id
+                }
+            }
+        }
+        '''
+
+        response = self.client.query(query)
+
+        self.assertEqual(response['extensions']['cost']['cost'], 2 + 3 * 1)
+
+    def test_zero_page_size_counts_as_unbounded(self):
+        """Test that first: 0, which the resolver treats as no limit, is not free"""
+        unbounded = self.client.query('query { books { reviews { id } } }')
+        zero = self.client.query('query { books(first: 0) { reviews { id } } }')
+
+        self.assertEqual(zero['extensions']['cost'], unbounded['extensions']['cost'])
+        self.assertEqual(zero['extensions']['cost']['cost'], 2 + 50 * 1)
+
+    def test_deep_cyclic_query_is_rejected(self):
+        """Test that a query over the depth limit never executes"""
+        query = '''
+        query {
+            books { author { books { reviews { user { reviews { book {
+                author { books { reviews { id } } }
+            } } } } } } }
+        }
+        '''
+
+        with self.assertNumQueries(0):
+            response = self.client.query(query)
+
+        codes = [error['extensions']['code'] for error in response['errors']]
+        self.assertIn('QUERY_TOO_DEEP', codes)
+        self.assertIn('QUERY_TOO_COMPLEX', codes)
+        self.assertNotIn('data', response)
+
+
+class ResponseCacheTests(TestCase):
+    query = '''
+    query {
+        books {
+            title
+            reviews {
+                text
+            }
+        }
+    }
+    '''
+
+    def setUp(self):
+        caches['responses'].clear()
+        self.client = GraphQLTestClient()
+        self.user = create_test_user()
+        self.reader = create_test_user(username="reader", email="reader@example.com")
+        self.book = Book.objects.create(
+            title="Cached Book",
+            description="A book behind the response cache",
+            year_published=2023,
+            author=self.user
+        )
+
+    def test_anonymous_reads_are_cached(self):
+        """Test that a repeated anonymous query is served without SQL"""
+        response = self.client.query(self.query)
+        self.assertEqual(response['extensions']['responseCache'], 'MISS')
+
+        with self.assertNumQueries(0):
+            response = self.client.query(self.query)
+
+        self.assertEqual(response['extensions']['responseCache'], 'HIT')
+        self.assertEqual(response['data']['books'][0]['title'], 'Cached Book')
+
+    def test_writes_invalidate_matching_entries(self):
+        """Test that book and review writes expire the entries they affect"""
+        other = '''
+        query Other($id: Int!) {
+            book(id: $id) {
+                title
+            }
+        }
+        '''
+        other_book = Book.objects.create(
+            title="Other Book",
+            description="Unrelated",
+            year_published=2020,
+            author=self.user
+        )
+        self.client.query(self.query)
+        self.client.query(other, {'id': other_book.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(text="Fresh review", user=self.reader, book=self.book)
+
+        response = self.client.query(self.query)
+        self.assertEqual(response['extensions']['responseCache'], 'MISS')
+        self.assertEqual(response['data']['books'][0]['reviews'][0]['text'], 'Fresh review')
+
+        # Denormalized review counts are tagged with the reviews they count
+        count_query = 'query { books { reviewCount } }'
+        self.client.query(count_query)
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(text="Another review", user=self.reader, book=other_book)
+        response = self.client.query(count_query)
+        self.assertEqual(response['extensions']['responseCache'], 'MISS')
+
+        # A review elsewhere does not touch book(id) entries
+        response = self.client.query(other, {'id': other_book.id})
+        self.assertEqual(response['extensions']['responseCache'], 'HIT')
+
+        self.client.login('testuser', 'password123')
+        mutation = '''
+        mutation UpdateBook($input: UpdateBookInput!) {
+            updateBook(updateBookInput: $input) {
+                success
+            }
+        }
+        '''
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.query(mutation, {'input': {'id': other_book.id, 'title': 'Renamed'}})
+        self.client.token = None
+
+        response = self.client.query(other, {'id': other_book.id})
+        self.assertEqual(response['extensions']['responseCache'], 'MISS')
+        self.assertEqual(response['data']['book']['title'], 'Renamed')
+
+    def test_anonymous_book_reviews_are_cached(self):
+        """Test that anonymous bookReviews is cached per book and invalidated by its reviews"""
+        query = '''
+        query BookReviews($bookId: Int!) {
+            bookReviews(bookId: $bookId) {
+                text
+            }
+        }
+        '''
+        variables = {'bookId': self.book.id}
+        response = self.client.query(query, variables)
+        self.assertNotIn('errors', response)
+        self.assertEqual(response['extensions']['responseCache'], 'MISS')
+
+        response = self.client.query(query, variables)
+        self.assertEqual(response['extensions']['responseCache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(text="Fresh review", user=self.reader, book=self.book)
+
+        response = self.client.query(query, variables)
+        self.assertEqual(response['extensions']['responseCache'], 'MISS')
+        self.assertEqual(response['data']['bookReviews'][0]['text'], 'Fresh review')
+
+    def test_root_types_selected_below_are_tagged(self):
+        """Test that the root field's type nested below it is tagged as a list"""
+        def tags(query):
+            document = parse(query)
+            return response_cache.get_tags(
+                schema.graphql_schema, document, document.definitions[0], {}
+            )
+
+        self.assertEqual(tags('query { book(id: 1) { title } }'), ['book:1'])
+        self.assertEqual(
+            tags('query { book(id: 1) { author { books { title } } } }'),
+            ['book:1', 'books:list', 'users:list']
+        )
+        self.assertEqual(
+            tags('query { bookReviews(bookId: 1) { user { reviews { text } } } }'),
+            ['book:1:reviews', 'reviews:list', 'users:list']
+        )
+
+        query = '''
+        query Book($id: Int!) {
+            book(id: $id) {
+                author {
+                    books {
+                        title
+                    }
+                }
+            }
+        }
+        '''
+        self.client.query(query, {'id': self.book.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(
+                title="Second Book",
+                description="By the same author",
+                year_published=2024,
+                author=self.user
+            )
+
+        response = self.client.query(query, {'id': self.book.id})
+        self.assertEqual(response['extensions']['responseCache'], 'MISS')
+        self.assertEqual(len(response['data']['book']['author']['books']), 2)
+
+    def test_profile_writes_invalidate_nested_profiles(self):
+        """Test that entries selecting a nested profile expire when it changes"""
+        profile = Profile.objects.create(name="Old Name", user=self.user)
+        query = '''
+        query Book($id: Int!) {
+            book(id: $id) {
+                author {
+                    profile {
+                        name
+                    }
+                }
+            }
+        }
+        '''
+        variables = {'id': self.book.id}
+        self.client.query(query, variables)
+        response = self.client.query(query, variables)
+        self.assertEqual(response['extensions']['responseCache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.name = "New Name"
+            profile.save()
+
+        response = self.client.query(query, variables)
+        self.assertEqual(response['extensions']['responseCache'], 'MISS')
+        self.assertEqual(response['data']['book']['author']['profile']['name'], 'New Name')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.delete()
+
+        response = self.client.query(query, variables)
+        self.assertEqual(response['extensions']['responseCache'], 'MISS')
+        self.assertIsNone(response['data']['book']['author']['profile'])
+
+    def test_untagged_model_types_are_not_cached(self):
+        """Test that selecting a model type no write would expire skips the cache"""
+        document = parse('query { book(id: 1) { author { profile { name } } } }')
+        tags = {'BookType': 'books:list', 'UserType': 'users:list'}
+        with mock.patch.dict(response_cache.TYPE_TAGS, tags, clear=True):
+            self.assertIsNone(response_cache.get_tags(
+                schema.graphql_schema, document, document.definitions[0], {}
+            ))
+
+    def test_authenticated_reads_bypass_the_cache(self):
+        """Test that requests carrying a token are never cached"""
+        self.client.login('testuser', 'password123')
+
+        response = self.client.query(self.query)
+
+        self.assertNotIn('responseCache', response['extensions'])
+
+
+@override_settings(GRAPHQL_QUERY_STATS={'ENABLED': True, 'SLOWEST': 2})
+class QueryStatsTests(TestCase):
+    query = '''
+    query {
+        books {
+            title
+            reviews {
+                text
+            }
+        }
+        reviews {
+            id
+        }
+    }
+    '''
+    debug = {'X-GraphQL-Debug': '1'}
+
+    def setUp(self):
+        caches['responses'].clear()
+        self.client = GraphQLTestClient()
+        self.user = create_test_user()
+        Book.objects.create(
+            title="Counted Book",
+            description="A book whose queries are counted",
+            year_published=2023,
+            author=self.user
+        )
+
+    def test_stats_are_returned_on_request(self):
+        """Test that the debug header adds the operation's SQL statistics"""
+        response = self.client.query(self.query, headers=self.debug)
+
+        self.assertNotIn('errors', response)
+        stats = response['extensions']['sql']
+        self.assertEqual(stats['count'], 3)
+        self.assertGreaterEqual(stats['time'], 0)
+        self.assertEqual(len(stats['slowest']), 2)
+        self.assertTrue(all(statement['sql'].startswith('SELECT') for statement in stats['slowest']))
+        self.assertGreaterEqual(stats['slowest'][0]['time'], stats['slowest'][1]['time'])
+
+        # Served from the response cache without touching the database
+        response = self.client.query(self.query, headers=self.debug)
+        self.assertEqual(response['extensions']['responseCache'], 'HIT')
+        self.assertEqual(response['extensions']['sql']['count'], 0)
+
+    def test_stats_are_opt_in(self):
+        """Test that stats need both the setting and the header"""
+        response = self.client.query(self.query)
+        self.assertNotIn('sql', response['extensions'])
+
+        with self.settings(GRAPHQL_QUERY_STATS={'ENABLED': False}):
+            response = self.client.query(self.query, headers=self.debug)
+        self.assertNotIn('sql', response['extensions'])
+
+    def test_budget_helper_reports_overruns(self):
+        """Test that the test client's budget helper fails over-budget queries"""
+        with self.assertRaisesMessage(AssertionError, 'over its budget of 1'):
+            self.client.assert_query_budget(1, self.query)
+
+
+class MetricsTests(TestCase):
+    query = '''
+    query Catalogue {
+        books {
+            title
+        }
+        reviews {
+            id
+        }
+    }
+    '''
+
+    def setUp(self):
+        caches['responses'].clear()
+        metrics.get_registry().reset()
+        self.client = GraphQLTestClient()
+        self.user = create_test_user()
+        Book.objects.create(
+            title="Measured Book",
+            description="A book whose operations are measured",
+            year_published=2023,
+            author=self.user
+        )
+
+    def scrape(self, **headers):
+        response = self.client.client.get('/metrics', **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        return response.content.decode()
+
+    def value(self, text, name, *labels):
+        """The value of the ``name`` sample with ``labels``, or None"""
+        prefix = f'{name}{metrics.format_labels(labels)} '
+        for line in text.splitlines():
+            if line.startswith(prefix):
+                return float(line[len(prefix):])
+        return None
+
+    @override_settings(GRAPHQL_METRICS={'ENABLED': True, 'RESOLVER_TIMING': True})
+    def test_operations_are_measured(self):
+        """Test that /metrics counts, times and counts the SQL of operations per root field"""
+        self.client.query(self.query)
+        self.client.query('query { nope }')
+
+        text = self.scrape()
+        for root_field in ('books', 'reviews'):
+            labels = (('operation', 'Catalogue'), ('root_field', root_field))
+            self.assertEqual(self.value(text, 'graphql_requests_total', *labels), 1)
+            self.assertIsNone(self.value(text, 'graphql_errors_total', *labels))
+            self.assertEqual(
+                self.value(text, 'graphql_request_duration_seconds_count', *labels), 1
+            )
+            self.assertEqual(self.value(
+                text, 'graphql_request_duration_seconds_bucket', *labels, ('le', '+Inf')
+            ), 1)
+            self.assertEqual(self.value(text, 'graphql_db_queries_sum', *labels), 2)
+        self.assertNotIn('books,reviews', text)
+        self.assertEqual(self.value(
+            text, 'graphql_resolver_duration_seconds_count', ('type', 'Query'), ('field', 'books')
+        ), 1)
+        # Fields the default resolver reads off their parent are not timed
+        self.assertNotIn('field="title"', text)
+
+        # Invalid documents do not name series after their fields
+        invalid = (('operation', 'anonymous'), ('root_field', ''))
+        self.assertEqual(self.value(text, 'graphql_requests_total', *invalid), 1)
+        self.assertEqual(self.value(text, 'graphql_errors_total', *invalid), 1)
+        self.assertNotIn('nope', text)
+
+    @override_settings(GRAPHQL_METRICS={'ENABLED': True, 'MAX_OPERATIONS': 1})
+    def test_operation_names_are_capped(self):
+        """Test that operation names past MAX_OPERATIONS are reported as other"""
+        self.client.query('query First { books { id } }')
+        self.client.query('query Second { books { id } }')
+
+        text = self.scrape()
+        self.assertEqual(self.value(
+            text, 'graphql_requests_total', ('operation', 'First'), ('root_field', 'books')
+        ), 1)
+        self.assertEqual(self.value(
+            text, 'graphql_requests_total', ('operation', 'other'), ('root_field', 'books')
+        ), 1)
+        # Resolvers are only timed with RESOLVER_TIMING
+        self.assertNotIn('graphql_resolver_duration_seconds_count{', text)
+
+    def test_processes_are_summed(self):
+        """Test that /metrics adds up the samples every worker wrote"""
+        with tempfile.TemporaryDirectory() as directory, self.settings(
+            GRAPHQL_METRICS={'ENABLED': True, 'DIRECTORY': directory, 'FLUSH_INTERVAL': 0}
+        ):
+            # Another worker process, with its own file
+            worker = metrics.Registry()
+            sample = metrics.Sample()
+            sample.operation, sample.root_fields, sample.queries = 'Catalogue', ['books'], 2
+            worker.record(sample, metrics.get_config())
+
+            self.client.query(self.query)
+            text = self.scrape()
+
+        labels = (('operation', 'Catalogue'), ('root_field', 'books'))
+        self.assertEqual(self.value(text, 'graphql_requests_total', *labels), 2)
+        self.assertEqual(self.value(text, 'graphql_db_queries_sum', *labels), 4)
+        self.assertEqual(
+            self.value(text, 'graphql_db_queries_bucket', *labels, ('le', '2.0')), 2
+        )
+
+    def test_access(self):
+        """Test that /metrics honours TOKEN and ENABLED"""
+        with self.settings(GRAPHQL_METRICS={'ENABLED': True, 'TOKEN': 'secret'}):
+            self.assertEqual(self.client.client.get('/metrics').status_code, 401)
+            self.assertEqual(
+                self.client.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code,
+                401
+            )
+            self.scrape(HTTP_AUTHORIZATION='Bearer secret')
+
+        with self.settings(GRAPHQL_METRICS={'ENABLED': False}):
+            self.assertEqual(self.client.client.get('/metrics').status_code, 404)
+            self.client.query(self.query)
+        self.assertNotIn('Catalogue', self.scrape())
+
+
+class ProfilingTests(TestCase):
+    query = '''
+    query Catalogue {
+        books {
+            title
+        }
+    }
+    '''
+
+    def setUp(self):
+        caches['default'].clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.config = {
+            'ENABLED': True, 'DIRECTORY': self.directory, 'TOKEN': 'secret', 'PER_MINUTE': 6,
+        }
+        self.client = GraphQLTestClient()
+        self.user = create_test_user()
+        Book.objects.create(
+            title="Profiled Book",
+            description="A book served under the profiler",
+            year_published=2023,
+            author=self.user
+        )
+
+    def profiled(self, value='1', **config):
+        with self.settings(GRAPHQL_PROFILING={**self.config, **config}):
+            response = self.client.query(self.query, headers={'X-GraphQL-Profile': value})
+        self.assertNotIn('errors', response)
+        return response['extensions'].get('profile')
+
+    def test_staff_operations_are_profiled(self):
+        """Test that a staff user's operation is saved as pstats named after it"""
+        self.user.is_staff = True
+        self.user.save()
+        self.client.login('testuser', 'password123')
+
+        profile = self.profiled()
+
+        self.assertTrue(profile['file'].endswith('.prof'))
+        self.assertIn('-Catalogue-', profile['file'])
+        self.assertGreater(profile['time'], 0)
+        stats = pstats.Stats(os.path.join(self.directory, profile['file']))
+        self.assertIn('resolve_books', {function for _, _, function in stats.stats})
+
+    def test_token_authorizes_profiling(self):
+        """Test that the header must carry TOKEN unless the user is staff"""
+        self.assertIsNone(self.profiled('wrong'))
+        self.client.login('testuser', 'password123')
+        self.assertIsNone(self.profiled())
+        self.assertEqual(os.listdir(self.directory), [])
+
+        self.assertIn('file', self.profiled('secret'))
+        with self.settings(GRAPHQL_PROFILING={**self.config, 'ENABLED': False}):
+            response = self.client.query(self.query, headers={'X-GraphQL-Profile': 'secret'})
+        self.assertNotIn('profile', response['extensions'])
+
+    def test_profiles_are_rate_limited(self):
+        """Test that PER_MINUTE caps profiles and KEEP prunes old files"""
+        self.assertIn('file', self.profiled('secret', PER_MINUTE=2, KEEP=1))
+        second = self.profiled('secret', PER_MINUTE=2, KEEP=1)
+        self.assertEqual(
+            self.profiled('secret', PER_MINUTE=2, KEEP=1),
+            {'skipped': 'Profiling rate limit reached'}
+        )
+        self.assertEqual(os.listdir(self.directory), [second['file']])
+
+
+class AsyncViewTests(TransactionTestCase):
+    query = '''
+    query {
+        books {
+            title
+            author {
+                username
+            }
+        }
+        reviews {
+            id
+        }
+        profiles {
+            id
+        }
+    }
+    '''
+
+    def setUp(self):
+        caches['responses'].clear()
+        self.factory = AsyncRequestFactory()
+        self.view = AsyncGraphQLView.as_view()
+        self.user = create_test_user()
+        Book.objects.create(
+            title="Async Book",
+            description="A book served by the async view",
+            year_published=2023,
+            author=self.user
+        )
+
+    def tearDown(self):
+        # Unindex through the signals; flushing would leave the search index behind
+        Book.objects.all().delete()
+
+    async def post(self, query, variables=None, view=None, headers=None):
+        request = self.factory.post(
+            '/graphql/',
+            json.dumps({'query': query, 'variables': variables or {}}),
+            content_type='application/json',
+            headers=headers
+        )
+        # What AuthenticationMiddleware would have set
+        request.user = AnonymousUser()
+        response = await (view or self.view)(request)
+        return json.loads(response.content)
+
+    async def test_async_view_matches_sync_view(self):
+        """Test that the async view returns the same data as the sync one"""
+        response = await self.post(self.query)
+
+        self.assertNotIn('errors', response)
+        self.assertEqual(response['data']['books'][0]['author']['username'], 'testuser')
+
+        caches['responses'].clear()
+        sync_response = await sync_to_async(GraphQLTestClient().query)(self.query)
+        self.assertEqual(response['data'], sync_response['data'])
+
+    @override_settings(GRAPHQL_QUERY_STATS={'ENABLED': True})
+    async def test_query_stats_count_pool_threads(self):
+        """Test that SQL run by root fields on the pool is counted"""
+        response = await self.post(self.query, headers={'X-GraphQL-Debug': '1'})
+
+        self.assertNotIn('errors', response)
+        self.assertEqual(response['extensions']['sql']['count'], 3)
+
+    @override_settings(GRAPHQL_METRICS={'ENABLED': True, 'RESOLVER_TIMING': True})
+    async def test_metrics_time_pool_threads(self):
+        """Test that root fields resolved on the pool are timed and their SQL counted"""
+        metrics.get_registry().reset()
+        response = await self.post(self.query)
+        self.assertNotIn('errors', response)
+
+        registry = metrics.get_registry()
+        for root_field in ('books', 'reviews', 'profiles'):
+            labels = (('operation', 'anonymous'), ('root_field', root_field))
+            self.assertEqual(registry.counters['graphql_requests_total', labels], 1)
+            self.assertEqual(registry.histograms['graphql_db_queries', labels][-1], 3)
+        self.assertIn(
+            ('graphql_resolver_duration_seconds', (('type', 'Query'), ('field', 'books'))),
+            registry.histograms
+        )
+
+    async def test_profiled_queries(self):
+        """Test that a profiled query runs on one thread and is saved"""
+        with tempfile.TemporaryDirectory() as directory, self.settings(GRAPHQL_PROFILING={
+            'ENABLED': True, 'DIRECTORY': directory, 'TOKEN': 'secret',
+        }):
+            await sync_to_async(caches['default'].clear)()
+            response = await self.post(self.query, headers={'X-GraphQL-Profile': 'secret'})
+
+            self.assertNotIn('errors', response)
+            self.assertEqual(response['data']['books'][0]['author']['username'], 'testuser')
+            stats = pstats.Stats(os.path.join(directory, response['extensions']['profile']['file']))
+            functions = {function for _, _, function in stats.stats}
+            self.assertTrue({'resolve_books', 'resolve_reviews', 'resolve_profiles'} <= functions)
+
+    async def test_body_is_parsed_off_the_event_loop(self):
+        """Test that the request body, uploads included, is read on a worker thread"""
+        threads = []
+
+        class RecordingView(AsyncGraphQLView):
+            def parse_body(self, request):
+                threads.append(threading.current_thread())
+                return super().parse_body(request)
+
+        response = await self.post(self.query, view=RecordingView.as_view())
+
+        self.assertNotIn('errors', response)
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    async def test_root_fields_resolve_concurrently(self):
+        """Test that sibling root fields run at the same time on the pool"""
+        barrier = threading.Barrier(2, timeout=5)
+
+        class SlowQuery(graphene.ObjectType):
+            first = graphene.String()
+            second = graphene.String()
+
+            def resolve_first(root, info):
+                barrier.wait()
+                return threading.current_thread().name
+
+            def resolve_second(root, info):
+                barrier.wait()
+                return threading.current_thread().name
+
+        view = AsyncGraphQLView.as_view(schema=graphene.Schema(query=SlowQuery))
+        response = await self.post('query { first second }', view=view)
+
+        self.assertNotIn('errors', response)
+        threads = set(response['data'].values())
+        self.assertEqual(len(threads), 2)
+        self.assertTrue(all(name.startswith('graphql') for name in threads))
+
+        # An unauthorized profiling header changes nothing
+        with self.settings(GRAPHQL_PROFILING={'ENABLED': True, 'TOKEN': 'secret'}):
+            response = await self.post(
+                'query { first second }', view=view, headers={'X-GraphQL-Profile': 'wrong'}
+            )
+        self.assertNotIn('errors', response)
+        self.assertNotIn('profile', response['extensions'])
+        self.assertEqual(len(set(response['data'].values())), 2)
+
+    async def test_mutations_and_authentication(self):
+        """Test token auth and an authenticated query through the async view"""
+        mutation = '''
+        mutation TokenAuth($username: String!, $password: String!) {
+            tokenAuth(username: $username, password: $password) {
+                token
+            }
+        }
+        '''
+        response = await self.post(
+            mutation, {'username': 'testuser', 'password': 'password123'}
+        )
+        token = response['data']['tokenAuth']['token']
+
+        response = await self.post(
+            'query { me { username } myBooks { title } }',
+            headers={'Authorization': f'JWT {token}'}
+        )
+
+        self.assertNotIn('errors', response)
+        self.assertEqual(response['data']['me']['username'], 'testuser')
+        self.assertEqual(response['data']['myBooks'][0]['title'], 'Async Book')
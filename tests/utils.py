@@ -1,5 +1,6 @@
+import asyncio
 import json
-from django.test import Client
+from django.test import Client, override_settings
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -12,7 +13,7 @@ class GraphQLTestClient:
         self.client = client or Client()
         self.token = None
     
-    def query(self, query, variables=None, headers=None):
+    def query(self, query, variables=None, headers=None, extensions=None):
         """
         Execute a GraphQL query
         """
@@ -20,6 +21,8 @@ class GraphQLTestClient:
             'query': query,
             'variables': variables or {}
         }
+        if extensions:
+            data['extensions'] = extensions
         
         request_headers = {'Content-Type': 'application/json'}
         if self.token:
@@ -37,6 +40,43 @@ class GraphQLTestClient:
         
         return json.loads(response.content.decode())
     
+    def assert_query_budget(self, max_queries, query, variables=None, headers=None):
+        """
+        Execute a GraphQL query and fail if it ran more than max_queries SQL
+        statements, counted by the view's query stats extension
+        """
+        headers = {**(headers or {}), 'X-GraphQL-Debug': '1'}
+        with override_settings(GRAPHQL_QUERY_STATS={'ENABLED': True, 'HEADER': 'X-GraphQL-Debug'}):
+            response = self.query(query, variables, headers)
+        
+        stats = response['extensions']['sql']
+        if stats['count'] > max_queries:
+            statements = '\n'.join(statement['sql'] for statement in stats['slowest'])
+            raise AssertionError(
+                f"Query ran {stats['count']} SQL statements, over its budget of "
+                f"{max_queries}. Slowest:\n{statements}"
+            )
+        return response
+    
+    def upload(self, query, variables, files):
+        """
+        Execute a GraphQL multipart request; ``files`` maps variable paths
+        such as ``variables.file.0`` to uploaded files
+        """
+        data = {
+            'operations': json.dumps({'query': query, 'variables': variables}),
+            'map': json.dumps({str(i): [path] for i, path in enumerate(files)}),
+        }
+        data.update({str(i): file for i, file in enumerate(files.values())})
+        
+        headers = {}
+        if self.token:
+            headers['HTTP_AUTHORIZATION'] = f'JWT {self.token}'
+        
+        response = self.client.post('/graphql/', data, **headers)
+        
+        return json.loads(response.content.decode())
+    
     def login(self, username, password):
         """
         Login a user and store the token
@@ -88,6 +128,49 @@ class GraphQLTestClient:
         
         return self.query(mutation, variables)
 
+class WebSocketTestClient:
+    """
+    Talks graphql-transport-ws to the ASGI WebSocket application directly
+    """
+    def __init__(self, application, path='/graphql/'):
+        self.application = application
+        self.scope = {
+            'type': 'websocket',
+            'path': path,
+            'headers': [],
+            'subprotocols': ['graphql-transport-ws'],
+        }
+        self.incoming = asyncio.Queue()
+        self.outgoing = asyncio.Queue()
+        self.task = None
+
+    async def connect(self):
+        """
+        Open the socket and return the server's answer
+        """
+        self.task = asyncio.ensure_future(
+            self.application(self.scope, self.incoming.get, self.outgoing.put)
+        )
+        await self.incoming.put({'type': 'websocket.connect'})
+        return await self.receive()
+
+    async def send_json(self, data):
+        await self.incoming.put({'type': 'websocket.receive', 'text': json.dumps(data)})
+
+    async def receive(self, timeout=5):
+        return await asyncio.wait_for(self.outgoing.get(), timeout)
+
+    async def receive_json(self, timeout=5):
+        message = await self.receive(timeout)
+        if message['type'] != 'websocket.send':
+            raise AssertionError(f"Expected a message, got {message}")
+        return json.loads(message['text'])
+
+    async def disconnect(self):
+        await self.incoming.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(self.task, 5)
+
+
 def create_test_user(username="testuser", email="test@example.com", password="password123"):
     """
     Create a test user directly in the database
@@ -0,0 +1,115 @@
+"""
+JWT authentication with a per-process cache of verified tokens.
+
+``JSONWebTokenBackend`` decodes the token and loads the user from the
+database on every request. ``CachedJSONWebTokenBackend`` remembers the
+decoded payload and a snapshot of the user for each token it verified, until
+the earlier of the token's ``exp`` and ``JWT_TOKEN_CACHE['TIMEOUT']``.
+Entries for a user are dropped when that user is saved or deleted in this
+process (see ``users.signals``); other processes pick up the change within
+the timeout.
+"""
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from graphql_jwt.backends import JSONWebTokenBackend
+from graphql_jwt.utils import get_credentials, get_payload, get_user_by_payload
+
+DEFAULTS = {
+    'TIMEOUT': 60,
+    'MAX_ENTRIES': 10000,
+}
+
+TokenEntry = namedtuple('TokenEntry', ['payload', 'user', 'expires_at'])
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'JWT_TOKEN_CACHE', {})}
+
+
+class TokenCache:
+    """Bounded LRU of verified tokens whose entries expire on their own."""
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token):
+        # The digest covers header and payload too, not only the signature
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token):
+        key = self.key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.time():
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, token, payload, user):
+        expires_at = time.time() + self.timeout
+        if 'exp' in payload:
+            expires_at = min(expires_at, payload['exp'])
+        key = self.key(token)
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = TokenEntry(payload, user, expires_at)
+            self._by_user.setdefault(user.pk, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._by_user.get(entry.user.pk)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_user[entry.user.pk]
+
+
+_config = get_config()
+token_cache = TokenCache(_config['MAX_ENTRIES'], _config['TIMEOUT'])
+
+
+class CachedJSONWebTokenBackend(JSONWebTokenBackend):
+    def authenticate(self, request=None, **kwargs):
+        if request is None or getattr(request, "_jwt_token_auth", False):
+            return None
+
+        token = get_credentials(request, **kwargs)
+        if token is None:
+            return None
+
+        entry = token_cache.get(token)
+        if entry is not None:
+            # Hand every request its own copy of the snapshot
+            return copy.copy(entry.user)
+
+        payload = get_payload(token, request)
+        user = get_user_by_payload(payload)
+        if user is not None:
+            token_cache.set(token, payload, copy.copy(user))
+        return user
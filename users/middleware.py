@@ -0,0 +1,65 @@
+"""
+JWT authentication once per operation.
+
+Graphene middleware wraps every resolved field, so the stock
+``JSONWebTokenMiddleware`` runs its checks for each item of a large list.
+``authenticate_operation`` is called by ``graphdj.views.GraphQLView`` before
+execution and stores the user on the request; the view then leaves the JWT
+middleware out of the chain entirely. When a schema is executed some other
+way, ``JSONWebTokenMiddleware`` below still authenticates, but only on root
+fields.
+"""
+from django.contrib.auth import authenticate
+from graphql import FieldNode
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.middleware import JSONWebTokenMiddleware as BaseJSONWebTokenMiddleware
+from graphql_jwt.middleware import _authenticate
+from graphql_jwt.settings import jwt_settings
+
+
+def allows_any(schema, operation):
+    """Whether every root field of ``operation`` is in ``JWT_ALLOW_ANY_CLASSES``."""
+    root_type = schema.get_root_type(operation.operation)
+    allowed = tuple(jwt_settings.JWT_ALLOW_ANY_CLASSES)
+    for selection in operation.selection_set.selections:
+        if not isinstance(selection, FieldNode):
+            return False
+        field = root_type.fields.get(selection.name.value)
+        graphene_type = getattr(getattr(field, 'type', None), 'graphene_type', None)
+        if graphene_type is None or not issubclass(graphene_type, allowed):
+            return False
+    return True
+
+
+def authenticate_operation(request, schema, operation):
+    """
+    Authenticate the request's JWT once for the whole operation.
+
+    Returns ``False`` when the operation needs per-field authentication
+    (tokens passed as field arguments), otherwise sets ``request.user`` and
+    returns ``True``. Raises ``JSONWebTokenError`` for a bad token unless
+    every root field allows anonymous access.
+    """
+    if jwt_settings.JWT_ALLOW_ARGUMENT:
+        return False
+    if _authenticate(request):
+        try:
+            user = authenticate(request=request)
+        except JSONWebTokenError:
+            if not allows_any(schema, operation):
+                raise
+        else:
+            if user is not None:
+                request.user = user
+    request.jwt_operation_authenticated = True
+    return True
+
+
+class JSONWebTokenMiddleware(BaseJSONWebTokenMiddleware):
+    def resolve(self, next, root, info, **kwargs):
+        if not jwt_settings.JWT_ALLOW_ARGUMENT and (
+            info.path.prev is not None
+            or getattr(info.context, 'jwt_operation_authenticated', False)
+        ):
+            return next(root, info, **kwargs)
+        return super().resolve(next, root, info, **kwargs)
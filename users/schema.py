@@ -4,11 +4,23 @@ from graphene_django import DjangoObjectType
 from graphql import GraphQLError
 from graphql_jwt.decorators import login_required
 
+from graphdj.loaders import load_related, track
+from graphdj.optimizer import optimize
+
 class UserType(DjangoObjectType):
     class Meta:
         model = get_user_model()
         exclude = ['password']
 
+    def resolve_books(self, info):
+        return load_related(info, self, 'books')
+
+    def resolve_reviews(self, info):
+        return load_related(info, self, 'reviews')
+
+    def resolve_profile(self, info):
+        return load_related(info, self, 'profile')
+
 class Query(graphene.ObjectType):
     users = graphene.List(UserType)
     user = graphene.Field(UserType, id=graphene.Int(required=True))
@@ -17,14 +29,14 @@ class Query(graphene.ObjectType):
     @login_required
     def resolve_users(self, info):
         print(info.context.user)
-        return get_user_model().objects.all()
+        return track(info, optimize(get_user_model().objects.all(), info))
 
     def resolve_user(self,info,id):
         try:
              user = get_user_model().objects.get(id=id)
         except get_user_model().DoesNotExist:
             raise GraphQLError('Cannot find user with given id')
-        return user
+        return track(info, [user])[0]
 
     def resolve_me(self, info):
         user = info.context.user
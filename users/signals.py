@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from graphdj import response_cache
+
+from .backends import token_cache
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_tokens(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_user(sender, instance, **kwargs):
+    response_cache.invalidate_on_commit(['users:list'])